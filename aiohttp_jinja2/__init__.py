@@ -1,10 +1,28 @@
+import asyncio
 import functools
+import json
+import logging
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from concurrent.futures import Executor
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from gettext import NullTranslations
+from pathlib import Path
 from typing import (
     Any,
+    AsyncIterator,
     Awaitable,
     Callable,
+    Collection,
     Final,
+    Hashable,
+    Iterable,
+    Iterator,
+    Literal,
     Mapping,
+    NamedTuple,
     ParamSpec,
     Protocol,
     Sequence,
@@ -13,21 +31,90 @@ from typing import (
 )
 
 import jinja2
-from aiohttp import web
+from aiohttp import hdrs, web
 from aiohttp.abc import AbstractView
+from aiohttp.typedefs import JSONEncoder
+from jinja2.runtime import Context
 
-from .helpers import GLOBAL_HELPERS, static_root_key
+from . import fastpath
+from .admission import Rejected, RenderAdmission
+from .cache import CacheEntry, TemplateCache
+from .deferred import LazyContext, computed, lazy, resolve_async
+from .flatten import FlattenExtension
+from .fragments import (
+    SSEStream,
+    WSStream,
+    has_block,
+    render_fragment,
+    render_fragment_async,
+)
+from .helpers import (
+    GLOBAL_HELPERS,
+    BatchFunction,
+    BatchLoader,
+    batched,
+    preload_links,
+    static_assets,
+    static_root_key,
+    uses_batches,
+)
+from .i18n import (
+    LocaleSelector,
+    StaticTranslationsExtension,
+    locale_env,
+    locale_envs,
+    setup_locales,
+    varies_by_language,
+)
+from .loaders import IndexedFileSystemLoader, NegativeCacheLoader
+from .minify import MinifyExtension
+from .prerender import Pages
+from .shells import DynamicExtension, Shells
+from .singleflight import Flights
 from .typedefs import Filters
+from .usage import ContextUsage, ContextUsageTracker
+from .warmup import log_report, warmup_templates
+from .watchdog import RenderSnapshot, SlowRenderWatchdog
 
 __version__ = "1.6"
 
+logger = logging.getLogger("aiohttp_jinja2")
+
 __all__ = (
+    "BatchLoader",
+    "CacheEntry",
+    "ContextUsage",
+    "ContextUsageTracker",
+    "DynamicExtension",
+    "environment_report",
+    "EnvironmentInfo",
+    "Fallback",
+    "FlattenExtension",
     "get_env",
+    "IndexedFileSystemLoader",
+    "lazy",
+    "MinifyExtension",
+    "NegativeCacheLoader",
+    "RenderAdmission",
+    "render_block",
+    "render_block_async",
+    "render_many",
+    "render_sse",
     "render_string",
     "render_template",
+    "render_template_stream",
+    "RenderSnapshot",
+    "render_ws",
     "setup",
+    "SlowRenderWatchdog",
+    "SSEStream",
     "static_root_key",
+    "StaticTranslationsExtension",
     "template",
+    "TemplateCache",
+    "Truncate",
+    "warmup_templates",
+    "WSStream",
 )
 
 _TemplateReturnType = Awaitable[web.StreamResponse | Mapping[str, Any]]
@@ -37,7 +124,20 @@ _ContextProcessor = Callable[[web.Request], Awaitable[dict[str, Any]]]
 APP_CONTEXT_PROCESSORS_KEY: Final = web.AppKey[Sequence[_ContextProcessor]](
     "APP_CONTEXT_PROCESSORS_KEY"
 )
+APP_CONTEXT_USAGE_KEY: Final = web.AppKey[ContextUsageTracker](
+    "APP_CONTEXT_USAGE_KEY"
+)
 APP_KEY: Final = web.AppKey[jinja2.Environment]("APP_KEY")
+APP_RENDER_ADMISSION_KEY: Final = web.AppKey[RenderAdmission](
+    "APP_RENDER_ADMISSION_KEY"
+)
+APP_RENDER_TIMEOUTS_KEY: Final = web.AppKey[Counter[str]]("APP_RENDER_TIMEOUTS_KEY")
+APP_STATIC_PRELOAD_KEY: Final = web.AppKey[dict[str, str]]("APP_STATIC_PRELOAD_KEY")
+APP_RENDER_WATCHDOG_KEY: Final = web.AppKey[SlowRenderWatchdog](
+    "APP_RENDER_WATCHDOG_KEY"
+)
+APP_SINGLE_FLIGHTS_KEY: Final = web.AppKey[Flights]("APP_SINGLE_FLIGHTS_KEY")
+APP_WARMUP_REPORT_KEY: Final = web.AppKey[dict[str, float]]("APP_WARMUP_REPORT_KEY")
 REQUEST_CONTEXT_KEY: Final = "aiohttp_jinja2_context"
 
 _T = TypeVar("_T")
@@ -45,6 +145,31 @@ _P = ParamSpec("_P")
 _AbstractView = TypeVar("_AbstractView", bound=AbstractView)
 
 
+class Truncate(NamedTuple):
+    """Render timeout fallback returning the output rendered so far."""
+
+    marker: str = ""
+
+
+class Fallback(NamedTuple):
+    """Render timeout fallback rendering another template with *status*."""
+
+    template_name: str
+    status: int = 503
+
+
+class _FallbackText(str):
+    """Output of a :class:`Fallback` template, carrying its status."""
+
+    status: int
+
+
+_OnTimeout = str | Fallback | Truncate | None
+# single-flight key of a render from its request
+_FlightKey = Callable[[web.Request], Hashable]
+_ShellKey = Callable[[web.Request], Hashable]
+
+
 class _TemplateWrapper(Protocol):
     @overload
     def __call__(
@@ -62,6 +187,54 @@ class _TemplateWrapper(Protocol):
     ) -> Callable[[_T, web.Request], Awaitable[web.StreamResponse]]: ...
 
 
+class _EnvHolder:
+    """One-time construction of the environment of an application."""
+
+    def __init__(self, build: Callable[[], jinja2.Environment], lazy: bool) -> None:
+        self._build = build
+        self._env: jinja2.Environment | None = None
+        self._lock = threading.Lock()
+        self.lazy = lazy
+        self.build_time: float | None = None
+
+    def get(self) -> jinja2.Environment:
+        env = self._env
+        if env is not None:
+            return env
+        with self._lock:
+            # another thread may have built it while this one waited
+            if self._env is None:
+                start = time.perf_counter()
+                self._env = self._build()
+                self.build_time = time.perf_counter() - start
+                logger.debug(
+                    "Built template environment in %.3fs", self.build_time
+                )
+            return self._env
+
+
+_HOLDER_KEYS: dict[web.AppKey[jinja2.Environment], web.AppKey[_EnvHolder]] = {}
+
+
+def _holder_key(app_key: web.AppKey[jinja2.Environment]) -> web.AppKey[_EnvHolder]:
+    key = _HOLDER_KEYS.get(app_key)
+    if key is None:
+        key = _HOLDER_KEYS[app_key] = web.AppKey("APP_ENV_HOLDER_KEY", _EnvHolder)
+    return key
+
+
+@overload
+def setup(
+    app: web.Application, *args: Any, lazy: Literal[True], **kwargs: Any
+) -> None: ...
+
+
+@overload
+def setup(
+    app: web.Application, *args: Any, lazy: Literal[False] = False, **kwargs: Any
+) -> jinja2.Environment: ...
+
+
 def setup(
     app: web.Application,
     *args: Any,
@@ -69,40 +242,227 @@ def setup(
     context_processors: Sequence[_ContextProcessor] = (),
     filters: Filters | None = None,
     default_helpers: bool = True,
+    warmup: bool | str | Sequence[str] = False,
+    warmup_concurrency: int = 4,
+    sync_fast_path: bool = False,
+    preload_static: bool = False,
+    cache_max_bytes: int | None = None,
+    minify: bool = False,
+    flatten: bool = False,
+    negative_cache_ttl: float | None = None,
+    translations: Mapping[str, NullTranslations] | None = None,
+    locale_selector: LocaleSelector | None = None,
+    batched_globals: Mapping[str, BatchFunction | BatchLoader] | None = None,
+    watchdog: SlowRenderWatchdog | None = None,
+    admission: RenderAdmission | None = None,
+    context_usage: ContextUsageTracker | None = None,
+    lazy: bool = False,
     **kwargs: Any,
-) -> jinja2.Environment:
+) -> jinja2.Environment | None:
     kwargs.setdefault("autoescape", True)
-    env = jinja2.Environment(*args, **kwargs)
-    if default_helpers:
-        env.globals.update(GLOBAL_HELPERS)
-    if filters is not None:
-        env.filters.update(filters)
-    app[app_key] = env
+    if minify:
+        kwargs["extensions"] = [*kwargs.get("extensions", ()), MinifyExtension]
+    if flatten:
+        if kwargs.get("bytecode_cache") is not None:
+            # bytecode is keyed by the source of the outer template only
+            raise ValueError("flatten cannot be used with a bytecode_cache")
+        kwargs["extensions"] = [*kwargs.get("extensions", ()), FlattenExtension]
+    if translations is not None:
+        kwargs["extensions"] = [
+            *kwargs.get("extensions", ()),
+            "jinja2.ext.i18n",
+            StaticTranslationsExtension,
+        ]
+    if batched_globals and not kwargs.get("enable_async", False):
+        raise ValueError("batched_globals require enable_async=True")
+
+    def build() -> jinja2.Environment:
+        env = jinja2.Environment(*args, **kwargs)
+        if env.context_class is Context:
+            env.context_class = LazyContext
+        if cache_max_bytes is not None:
+            env.cache = TemplateCache(cache_max_bytes)
+        if negative_cache_ttl is not None and env.loader is not None:
+            env.loader = NegativeCacheLoader(env.loader, ttl=negative_cache_ttl)
+        if default_helpers:
+            env.globals.update(GLOBAL_HELPERS)
+        if filters is not None:
+            env.filters.update(filters)
+        if batched_globals:
+            env.globals.update(
+                (name, value if isinstance(value, BatchLoader) else BatchLoader(value))
+                for name, value in batched_globals.items()
+            )
+            env.extend(aiohttp_jinja2_batched_globals=frozenset(batched_globals))
+        if translations is not None:
+            setup_locales(env, translations, locale_selector)
+        if env.is_async and sync_fast_path:
+            for variant in (env, *locale_envs(env)):
+                fastpath.enable(variant)
+        env.globals["app"] = app
+        return env
+
+    holder = _EnvHolder(build, lazy)
+    app[_holder_key(app_key)] = holder
+    env = None
+    if not lazy:
+        env = app[app_key] = holder.get()
     if context_processors:
         app[APP_CONTEXT_PROCESSORS_KEY] = context_processors
         app.middlewares.append(context_processors_middleware)
 
-    env.globals["app"] = app
+    app.setdefault(APP_RENDER_TIMEOUTS_KEY, Counter())
+    app.setdefault(APP_SINGLE_FLIGHTS_KEY, Flights())
+    if preload_static:
+        app.setdefault(APP_STATIC_PRELOAD_KEY, {})
+    if watchdog is not None:
+        app[APP_RENDER_WATCHDOG_KEY] = watchdog
+    if admission is not None:
+        app[APP_RENDER_ADMISSION_KEY] = admission
+    if context_usage is not None:
+        app[APP_CONTEXT_USAGE_KEY] = context_usage
+
+    if warmup:
+        patterns = None if warmup is True else _as_patterns(warmup)
+        report = app.setdefault(APP_WARMUP_REPORT_KEY, {})
+
+        async def on_startup(app: web.Application) -> None:
+            compiled: dict[str, float] = {}
+            env = holder.get()
+            for variant in (env, *locale_envs(env)):
+                times = await warmup_templates(
+                    variant, patterns, concurrency=warmup_concurrency
+                )
+                for name, seconds in times.items():
+                    compiled[name] = compiled.get(name, 0.0) + seconds
+            log_report(compiled)
+            report.update(compiled)
+
+        app.on_startup.append(on_startup)
+
+    return env
+
+
+def _as_patterns(value: str | Sequence[str]) -> Sequence[str]:
+    return (value,) if isinstance(value, str) else value
+
 
+def _lookup_env(
+    mapping: Mapping[Any, Any], app_key: web.AppKey[jinja2.Environment]
+) -> jinja2.Environment | None:
+    holder: _EnvHolder | None = mapping.get(_holder_key(app_key))
+    if holder is not None:
+        return holder.get()
+    # environments stored without setup()
+    env: jinja2.Environment | None = mapping.get(app_key)
     return env
 
 
 def get_env(
     app: web.Application, *, app_key: web.AppKey[jinja2.Environment] = APP_KEY
 ) -> jinja2.Environment:
-    try:
-        return app[app_key]
-    except KeyError:
+    env = _lookup_env(app, app_key)
+    if env is None:
         raise RuntimeError("aiohttp_jinja2.setup(...) must be called first.")
+    return env
 
 
-def _render_string(
+class EnvironmentInfo(NamedTuple):
+    prefix: str
+    app_key: web.AppKey[jinja2.Environment]
+    lazy: bool
+    build_time: float | None
+
+
+def environment_report(app: web.Application) -> list[EnvironmentInfo]:
+    """Describe the environments set up for *app* and its sub-applications.
+
+    *build_time* is ``None`` for lazy environments not used yet.
+    """
+    report = []
+    pending = [("", app)]
+    while pending:
+        prefix, current = pending.pop(0)
+        for app_key, holder_key in _HOLDER_KEYS.items():
+            holder = current.get(holder_key)
+            if holder is not None:
+                info = EnvironmentInfo(
+                    prefix, app_key, holder.lazy, holder.build_time
+                )
+                report.append(info)
+        for resource in current.router.resources():
+            if isinstance(resource, web.PrefixedSubAppResource):
+                resource_info = resource.get_info()
+                pending.append((prefix + resource_info["prefix"], resource_info["app"]))
+    return report
+
+
+class _AppConfig:
+    """The settings of an application its renders look up.
+
+    ``request.config_dict`` chains the mappings of the application and its
+    parents anew on every access; frozen applications cannot change, so
+    theirs are looked up once.
+    """
+
+    def __init__(self, config: Mapping[Any, Any]) -> None:
+        self.admission: RenderAdmission | None = config.get(APP_RENDER_ADMISSION_KEY)
+        self.flights: Flights | None = config.get(APP_SINGLE_FLIGHTS_KEY)
+        self.static_preload: dict[str, str] | None = config.get(APP_STATIC_PRELOAD_KEY)
+        self.timeouts: Counter[str] | None = config.get(APP_RENDER_TIMEOUTS_KEY)
+        self.usage: ContextUsageTracker | None = config.get(APP_CONTEXT_USAGE_KEY)
+        self.watchdog: SlowRenderWatchdog | None = config.get(APP_RENDER_WATCHDOG_KEY)
+        # weak, environments refer to the application keying the config
+        self._envs: dict[
+            web.AppKey[jinja2.Environment], weakref.ref[jinja2.Environment]
+        ] = {}
+
+    def env(
+        self, request: web.Request, app_key: web.AppKey[jinja2.Environment]
+    ) -> jinja2.Environment | None:
+        ref = self._envs.get(app_key)
+        env = None if ref is None else ref()
+        if env is None:
+            env = _lookup_env(request.config_dict, app_key)
+            if env is not None:
+                self._envs[app_key] = weakref.ref(env)
+        return env
+
+
+_app_configs: weakref.WeakKeyDictionary[web.Application, _AppConfig] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _app_config(request: web.Request) -> _AppConfig:
+    app = request.app
+    config = _app_configs.get(app)
+    if config is None:
+        config = _AppConfig(request.config_dict)
+        if app.frozen:
+            _app_configs[app] = config
+    return config
+
+
+def _request_env(
+    request: web.Request, app_key: web.AppKey[jinja2.Environment], config: _AppConfig
+) -> jinja2.Environment | None:
+    env = config.env(request, app_key)
+    if env is None:
+        return None
+    return locale_env(env, request)
+
+
+def _get_template(
     template_name: str,
     request: web.Request,
-    context: Mapping[str, Any],
     app_key: web.AppKey[jinja2.Environment],
-) -> tuple[jinja2.Template, Mapping[str, Any]]:
-    env = request.config_dict.get(app_key)
+) -> jinja2.Template:
+    env = _request_env(request, app_key, _app_config(request))
+    return _template_of(env, template_name)
+
+
+def _template_of(env: jinja2.Environment | None, template_name: str) -> jinja2.Template:
     if env is None:
         text = "Template engine is not initialized, call aiohttp_jinja2.setup() first"
         # in order to see meaningful exception message both: on console
@@ -114,13 +474,88 @@ def _render_string(
     except jinja2.TemplateNotFound as e:
         text = f"Template '{template_name}' not found"
         raise web.HTTPInternalServerError(reason=text, text=text) from e
+    return template
+
+
+def _merge_context(
+    request: web.Request, context: Mapping[str, Any]
+) -> Mapping[str, Any]:
     if not isinstance(context, Mapping):
         text = f"context should be mapping, not {type(context)}"  # type: ignore[unreachable]
         # same reason as above
         raise web.HTTPInternalServerError(reason=text, text=text)
     if request.get(REQUEST_CONTEXT_KEY):
         context = dict(request[REQUEST_CONTEXT_KEY], **context)
-    return template, context
+    return context
+
+
+def _prepare(
+    template: jinja2.Template,
+    request: web.Request,
+    context: Mapping[str, Any],
+    config: _AppConfig,
+) -> Mapping[str, Any]:
+    context = _merge_context(request, context)
+    if config.usage is not None:
+        config.usage.record(template, context)
+    return context
+
+
+def _render_string(
+    template_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    app_key: web.AppKey[jinja2.Environment],
+) -> tuple[jinja2.Template, Mapping[str, Any]]:
+    config = _app_config(request)
+    template = _template_of(_request_env(request, app_key, config), template_name)
+    return template, _prepare(template, request, context, config)
+
+
+def _collect(chunks: Iterator[str], deadline: float) -> tuple[list[str], bool]:
+    rendered = []
+    for chunk in chunks:
+        rendered.append(chunk)
+        if time.monotonic() >= deadline:
+            return rendered, False
+    return rendered, True
+
+
+async def _collect_async(
+    chunks: AsyncIterator[str], deadline: float
+) -> tuple[list[str], bool]:
+    rendered = []
+    async for chunk in chunks:
+        rendered.append(chunk)
+        if time.monotonic() >= deadline:
+            return rendered, False
+    return rendered, True
+
+
+def _count_timeout(template_name: str, config: _AppConfig) -> None:
+    if config.timeouts is not None:
+        config.timeouts[template_name] += 1
+
+
+def _fallback_name(on_timeout: str | Fallback) -> str:
+    return on_timeout if isinstance(on_timeout, str) else on_timeout.template_name
+
+
+def _fallback_text(text: str, on_timeout: str | Fallback) -> str:
+    if isinstance(on_timeout, str):
+        return text
+    fallback = _FallbackText(text)
+    fallback.status = on_timeout.status
+    return fallback
+
+
+def _timed_out(
+    template_name: str, rendered: list[str], on_timeout: Truncate | None
+) -> str:
+    if on_timeout is None:
+        text = f"Rendering of template '{template_name}' timed out"
+        raise web.HTTPServiceUnavailable(reason=text, text=text)
+    return "".join(rendered) + on_timeout.marker
 
 
 def render_string(
@@ -129,9 +564,56 @@ def render_string(
     context: Mapping[str, Any],
     *,
     app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
 ) -> str:
-    template, context = _render_string(template_name, request, context, app_key)
-    return template.render(context)
+    config = _app_config(request)
+    template = _template_of(_request_env(request, app_key, config), template_name)
+    return _render_text(
+        template_name,
+        template,
+        request,
+        context,
+        config,
+        app_key=app_key,
+        timeout=timeout,
+        on_timeout=on_timeout,
+    )
+
+
+def _render_text(
+    template_name: str,
+    template: jinja2.Template,
+    request: web.Request,
+    context: Mapping[str, Any],
+    config: _AppConfig,
+    *,
+    app_key: web.AppKey[jinja2.Environment],
+    timeout: float | None,
+    on_timeout: _OnTimeout,
+) -> str:
+    context = _prepare(template, request, context, config)
+    if timeout is None:
+        return template.render(context)
+    rendered, complete = _collect(
+        template.generate(context), time.monotonic() + timeout
+    )
+    if complete:
+        return "".join(rendered)
+    _count_timeout(template_name, config)
+    if isinstance(on_timeout, (str, Fallback)):
+        text = render_string(
+            _fallback_name(on_timeout), request, context, app_key=app_key
+        )
+        return _fallback_text(text, on_timeout)
+    return _timed_out(template_name, rendered, on_timeout)
+
+
+async def _render_async(template: jinja2.Template, context: Mapping[str, Any]) -> str:
+    if not uses_batches(template):
+        return await template.render_async(context)
+    async with batched(template, context):
+        return await template.render_async(context)
 
 
 async def render_string_async(
@@ -140,9 +622,252 @@ async def render_string_async(
     context: Mapping[str, Any],
     *,
     app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
+    single_flight: _FlightKey | None = None,
+) -> str:
+    config = _app_config(request)
+    template = _template_of(_request_env(request, app_key, config), template_name)
+    return await _render_text_async(
+        template_name,
+        template,
+        request,
+        context,
+        config,
+        app_key=app_key,
+        timeout=timeout,
+        on_timeout=on_timeout,
+        single_flight=single_flight,
+    )
+
+
+async def _render_text_async(
+    template_name: str,
+    template: jinja2.Template,
+    request: web.Request,
+    context: Mapping[str, Any],
+    config: _AppConfig,
+    *,
+    app_key: web.AppKey[jinja2.Environment],
+    timeout: float | None,
+    on_timeout: _OnTimeout,
+    single_flight: _FlightKey | None,
+) -> str:
+    if single_flight is not None and config.flights is not None:
+        # the template object tells locales and environments apart
+        key = (template, single_flight(request))
+        return await config.flights.join(
+            key,
+            functools.partial(
+                _render_text_async,
+                template_name,
+                template,
+                request,
+                context,
+                config,
+                app_key=app_key,
+                timeout=timeout,
+                on_timeout=on_timeout,
+                single_flight=None,
+            ),
+        )
+    context = _prepare(template, request, context, config)
+    await resolve_async(template, context)
+    sync_template = fastpath.sync_variant(template, context)
+    if timeout is None:
+        if sync_template is not None:
+            return sync_template.render(context)
+        return await _render_async(template, context)
+    deadline = time.monotonic() + timeout
+    if sync_template is not None:
+        rendered, complete = _collect(sync_template.generate(context), deadline)
+    else:
+        async with batched(template, context):
+            chunks = template.generate_async(context)
+            try:
+                rendered, complete = await _collect_async(chunks, deadline)
+            finally:
+                await chunks.aclose()
+    if complete:
+        return "".join(rendered)
+    _count_timeout(template_name, config)
+    if isinstance(on_timeout, (str, Fallback)):
+        text = await render_string_async(
+            _fallback_name(on_timeout), request, context, app_key=app_key
+        )
+        return _fallback_text(text, on_timeout)
+    return _timed_out(template_name, rendered, on_timeout)
+
+
+async def render_many(
+    template_name: str | None,
+    request: web.Request,
+    contexts: Iterable[Mapping[str, Any]] | Iterable[tuple[str, Mapping[str, Any]]],
+    *,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+    executor: Executor | None = None,
+    concurrency: int = 1,
+) -> AsyncIterator[str]:
+    if concurrency < 1:
+        raise ValueError("concurrency should be a positive number")
+    loop = asyncio.get_running_loop()
+    templates: dict[str, jinja2.Template] = {}
+    pending: deque[asyncio.Future[str]] = deque()
+
+    if template_name is None:
+        items: Iterable[tuple[str, Mapping[str, Any]]] = contexts  # type: ignore[assignment]
+    else:
+        items = ((template_name, context) for context in contexts)  # type: ignore[misc]
+
+    try:
+        for name, context in items:
+            template = templates.get(name)
+            if template is None:
+                template = templates[name] = _get_template(name, request, app_key)
+            context = _merge_context(request, context)
+
+            sync_template: jinja2.Template | None = template
+            if template.environment.is_async:
+                await resolve_async(template, context)
+                sync_template = fastpath.sync_variant(template, context)
+            if executor is None:
+                if sync_template is not None:
+                    yield sync_template.render(context)
+                else:
+                    yield await _render_async(template, context)
+                continue
+
+            if len(pending) >= concurrency:
+                yield await pending.popleft()
+            if sync_template is not None:
+                future = loop.run_in_executor(executor, sync_template.render, context)
+            else:
+                future = asyncio.ensure_future(_render_async(template, context))
+            pending.append(future)
+
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def render_block(
+    template_name: str,
+    block_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    *,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
 ) -> str:
     template, context = _render_string(template_name, request, context, app_key)
-    return await template.render_async(context)
+    return render_fragment(template, context, block_name)
+
+
+async def render_block_async(
+    template_name: str,
+    block_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    *,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+) -> str:
+    template, context = _render_string(template_name, request, context, app_key)
+    await resolve_async(template, context)
+    return await render_fragment_async(template, context, block_name)
+
+
+def _fragment_template(
+    template_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    block: str | None,
+    app_key: web.AppKey[jinja2.Environment],
+) -> tuple[jinja2.Template, Mapping[str, Any]]:
+    template, context = _render_string(template_name, request, context, app_key)
+    if block is not None and not has_block(template, block):
+        text = f"Template '{template_name}' has no block '{block}'"
+        raise web.HTTPInternalServerError(reason=text, text=text)
+    return template, context
+
+
+def _accept_quality(ranges: list[tuple[str, str, float]], media_type: str) -> float:
+    # the most specific matching range decides
+    kind, _, subtype = media_type.partition("/")
+    best, quality = -1, 0.0
+    for range_kind, range_subtype, range_quality in ranges:
+        if range_kind == kind and range_subtype == subtype:
+            specificity = 2
+        elif range_kind == kind and range_subtype == "*":
+            specificity = 1
+        elif range_kind == "*":
+            specificity = 0
+        else:
+            continue
+        if specificity > best:
+            best, quality = specificity, range_quality
+    return quality
+
+
+def _prefers_json(request: web.Request) -> bool:
+    """Whether ``Accept`` ranks JSON above HTML, ties go to HTML."""
+    header = request.headers.get(hdrs.ACCEPT)
+    if not header:
+        return False
+    ranges = []
+    for item in header.split(","):
+        media_range, *params = item.split(";")
+        kind, _, subtype = media_range.strip().lower().partition("/")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        ranges.append((kind, subtype, quality))
+    return _accept_quality(ranges, "application/json") > _accept_quality(
+        ranges, "text/html"
+    )
+
+
+async def render_sse(
+    template_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    *,
+    block: str | None = None,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+) -> SSEStream:
+    template, context = _fragment_template(
+        template_name, request, context, block, app_key
+    )
+    response = web.StreamResponse(
+        headers={
+            hdrs.CONTENT_TYPE: "text/event-stream",
+            hdrs.CACHE_CONTROL: "no-cache",
+        }
+    )
+    await response.prepare(request)
+    return SSEStream(template, context, block, response)
+
+
+async def render_ws(
+    template_name: str,
+    request: web.Request,
+    context: Mapping[str, Any],
+    ws: web.WebSocketResponse,
+    *,
+    block: str | None = None,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+) -> WSStream:
+    template, context = _fragment_template(
+        template_name, request, context, block, app_key
+    )
+    if not ws.prepared:
+        await ws.prepare(request)
+    return WSStream(template, context, block, ws)
 
 
 def _render_template(
@@ -158,6 +883,69 @@ def _render_template(
     return response, context
 
 
+@contextmanager
+def _static_preload(
+    template_name: str, links: dict[str, str] | None, response: web.StreamResponse
+) -> Iterator[None]:
+    if links is None:
+        yield
+        return
+    header = links.get(template_name)
+    if header is not None:
+        # set before rendering, a stream sends its headers first
+        if header:
+            response.headers[hdrs.LINK] = header
+        yield
+        return
+    # first render of the template, record what static() produces
+    token = static_assets.set([])
+    try:
+        yield
+        urls = static_assets.get() or ()
+    finally:
+        static_assets.reset(token)
+    header = links[template_name] = preload_links(urls)
+    if header and not response.prepared:
+        response.headers[hdrs.LINK] = header
+
+
+@contextmanager
+def _hooked(
+    template_name: str,
+    response: web.StreamResponse,
+    context: Mapping[str, object],
+    config: _AppConfig,
+) -> Iterator[None]:
+    with _static_preload(template_name, config.static_preload, response):
+        if config.watchdog is None:
+            yield
+            return
+        with config.watchdog.watch(template_name, context):
+            yield
+
+
+_NO_HOOKS: Final = nullcontext()
+
+
+def _render_hooks(
+    template_name: str,
+    response: web.StreamResponse,
+    context: Mapping[str, object],
+    config: _AppConfig,
+) -> AbstractContextManager[None]:
+    """Static preloading and the watchdog around a render, when enabled."""
+    if config.static_preload is None and config.watchdog is None:
+        return _NO_HOOKS
+    return _hooked(template_name, response, context, config)
+
+
+def _set_text(response: web.Response, text: str) -> web.Response:
+    response.text = text
+    if isinstance(text, _FallbackText):
+        response.set_status(text.status)
+    return response
+
+
 def render_template(
     template_name: str,
     request: web.Request,
@@ -166,10 +954,50 @@ def render_template(
     app_key: web.AppKey[jinja2.Environment] = APP_KEY,
     encoding: str = "utf-8",
     status: int = 200,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
+) -> web.Response:
+    config = _app_config(request)
+    return _template_response(
+        template_name,
+        _request_env(request, app_key, config),
+        request,
+        context,
+        config,
+        app_key=app_key,
+        encoding=encoding,
+        status=status,
+        timeout=timeout,
+        on_timeout=on_timeout,
+    )
+
+
+def _template_response(
+    template_name: str,
+    env: jinja2.Environment | None,
+    request: web.Request,
+    context: Mapping[str, Any] | None,
+    config: _AppConfig,
+    *,
+    app_key: web.AppKey[jinja2.Environment],
+    encoding: str,
+    status: int,
+    timeout: float | None,
+    on_timeout: _OnTimeout,
 ) -> web.Response:
     response, context = _render_template(context, encoding, status)
-    response.text = render_string(template_name, request, context, app_key=app_key)
-    return response
+    with _render_hooks(template_name, response, context, config):
+        text = _render_text(
+            template_name,
+            _template_of(env, template_name),
+            request,
+            context,
+            config,
+            app_key=app_key,
+            timeout=timeout,
+            on_timeout=on_timeout,
+        )
+    return _set_text(response, text)
 
 
 async def render_template_async(
@@ -180,11 +1008,144 @@ async def render_template_async(
     app_key: web.AppKey[jinja2.Environment] = APP_KEY,
     encoding: str = "utf-8",
     status: int = 200,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
+    single_flight: _FlightKey | None = None,
 ) -> web.Response:
-    response, context = _render_template(context, encoding, status)
-    response.text = await render_string_async(
-        template_name, request, context, app_key=app_key
+    config = _app_config(request)
+    return await _template_response_async(
+        template_name,
+        _request_env(request, app_key, config),
+        request,
+        context,
+        config,
+        app_key=app_key,
+        encoding=encoding,
+        status=status,
+        timeout=timeout,
+        on_timeout=on_timeout,
+        single_flight=single_flight,
     )
+
+
+async def _template_response_async(
+    template_name: str,
+    env: jinja2.Environment | None,
+    request: web.Request,
+    context: Mapping[str, Any] | None,
+    config: _AppConfig,
+    *,
+    app_key: web.AppKey[jinja2.Environment],
+    encoding: str,
+    status: int,
+    timeout: float | None,
+    on_timeout: _OnTimeout,
+    single_flight: _FlightKey | None,
+) -> web.Response:
+    response, context = _render_template(context, encoding, status)
+    with _render_hooks(template_name, response, context, config):
+        text = await _render_text_async(
+            template_name,
+            _template_of(env, template_name),
+            request,
+            context,
+            config,
+            app_key=app_key,
+            timeout=timeout,
+            on_timeout=on_timeout,
+            single_flight=single_flight,
+        )
+    return _set_text(response, text)
+
+
+async def render_template_stream(
+    template_name: str,
+    request: web.Request,
+    context: Mapping[str, Any] | None,
+    *,
+    app_key: web.AppKey[jinja2.Environment] = APP_KEY,
+    encoding: str = "utf-8",
+    status: int = 200,
+    headers: Mapping[str, str] | None = None,
+    buffer_size: int = 16384,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
+) -> web.StreamResponse:
+    if context is None:
+        context = {}
+    config = _app_config(request)
+    template = _template_of(_request_env(request, app_key, config), template_name)
+    context = _prepare(template, request, context, config)
+    response = web.StreamResponse(status=status, headers=headers)
+    response.content_type = "text/html"
+    response.charset = encoding
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _render_hooks(template_name, response, context, config):
+        await response.prepare(request)
+        buffered: list[str] = []
+        size = 0
+
+        async def flush() -> None:
+            nonlocal size
+            # write() waits for the transport to drain, a slow client
+            # pauses the render and the async iterables it consumes
+            await response.write("".join(buffered).encode(encoding))
+            buffered.clear()
+            size = 0
+
+        async def add(chunk: str) -> bool:
+            """Buffer *chunk*, return whether the deadline expired."""
+            nonlocal size
+            buffered.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                await flush()
+            return deadline is not None and time.monotonic() >= deadline
+
+        expired = False
+        sync_template: jinja2.Template | None = template
+        if template.environment.is_async:
+            await resolve_async(template, context)
+            sync_template = fastpath.sync_variant(template, context)
+        if sync_template is not None:
+            for chunk in sync_template.generate(context):
+                if expired := await add(chunk):
+                    break
+        else:
+            async with batched(template, context):
+                chunks = template.generate_async(context)
+                try:
+                    async for chunk in chunks:
+                        if expired := await add(chunk):
+                            break
+                finally:
+                    await chunks.aclose()
+        if expired:
+            _count_timeout(template_name, config)
+            if on_timeout is None:
+                await flush()
+                # the status is sent already, ending the connection without
+                # ending the body tells the client the page is incomplete
+                if request.transport is not None:
+                    request.transport.close()
+                return response
+            if isinstance(on_timeout, Truncate):
+                buffered.append(on_timeout.marker)
+            elif template.environment.is_async:
+                buffered.append(
+                    await render_string_async(
+                        _fallback_name(on_timeout), request, context, app_key=app_key
+                    )
+                )
+            else:
+                buffered.append(
+                    render_string(
+                        _fallback_name(on_timeout), request, context, app_key=app_key
+                    )
+                )
+        if buffered:
+            await flush()
+        await response.write_eof()
     return response
 
 
@@ -194,7 +1155,33 @@ def template(
     app_key: web.AppKey[jinja2.Environment] = APP_KEY,
     encoding: str = "utf-8",
     status: int = 200,
+    timeout: float | None = None,
+    on_timeout: _OnTimeout = None,
+    block: str | None = None,
+    block_header: str | None = None,
+    prerender: bool = False,
+    prerender_dir: str | Path | None = None,
+    stream: bool = False,
+    single_flight: _FlightKey | None = None,
+    shell_key: _ShellKey | None = None,
+    priority: int = 0,
+    max_renders: int | None = None,
+    negotiate: bool = False,
+    json_keys: Collection[str] | None = None,
+    dumps: JSONEncoder = json.dumps,
 ) -> _TemplateWrapper:
+    if timeout is not None or on_timeout is not None:
+        # these render without a deadline
+        options = {
+            "block": block is not None,
+            "block_header": block_header is not None,
+            "prerender": prerender or prerender_dir is not None,
+            "shell_key": shell_key is not None,
+        }
+        for option, used in options.items():
+            if used:
+                raise ValueError(f"timeout cannot be used with {option}")
+
     @overload
     def wrapper(
         func: _SimpleTemplateHandler,
@@ -213,29 +1200,155 @@ def template(
     def wrapper(
         func: Callable[_P, _TemplateReturnType],
     ) -> Callable[_P, Awaitable[web.StreamResponse]]:
-        @functools.wraps(func)
-        async def wrapped(*args: _P.args, **kwargs: _P.kwargs) -> web.StreamResponse:  # type: ignore[misc]
-            context = await func(*args, **kwargs)
+        pages = Pages(prerender_dir) if prerender or prerender_dir else None
+        shells = Shells() if shell_key is not None else None
+        vary = [block_header] if block_header is not None else []
+        if negotiate:
+            vary.append(hdrs.ACCEPT)
+
+        async def respond(
+            request: web.Request,
+            env: jinja2.Environment | None,
+            context: web.StreamResponse | Mapping[str, Any],
+            as_json: bool,
+            vary: list[str],
+            config: _AppConfig,
+        ) -> web.StreamResponse:
             if isinstance(context, web.StreamResponse):
                 return context
 
+            if as_json:
+                if json_keys is not None:
+                    context = {
+                        key: context[key] for key in json_keys if key in context
+                    }
+                context = await computed(context)
+                response = web.json_response(context, status=status, dumps=dumps)
+                response.headers.add(hdrs.VARY, hdrs.ACCEPT)
+                return response
+
+            if pages is not None and env is not None:
+                _, context = _render_template(context, encoding, status)
+                # served to every request, the values context processors
+                # computed for this one are left out
+                tmpl = _template_of(env, template_name)
+                if env.is_async:
+                    await resolve_async(tmpl, context)
+                    text = await _render_async(tmpl, context)
+                else:
+                    text = tmpl.render(context)
+                page = await pages.store(env, template_name, text, encoding, status)
+                return page.response(request, vary)
+
+            selected = block
+            if block_header is not None:
+                requested = request.headers.get(block_header)
+                if requested and has_block(
+                    _template_of(env, template_name), requested
+                ):
+                    selected = requested
+            if selected is not None:
+                response, context = _render_template(context, encoding, status)
+                if env and env.is_async:
+                    response.text = await render_block_async(
+                        template_name, selected, request, context, app_key=app_key
+                    )
+                else:
+                    response.text = render_block(
+                        template_name, selected, request, context, app_key=app_key
+                    )
+            elif stream:
+                # headers are sent before rendering starts
+                return await render_template_stream(
+                    template_name,
+                    request,
+                    context,
+                    app_key=app_key,
+                    encoding=encoding,
+                    status=status,
+                    headers={hdrs.VARY: ", ".join(vary)} if vary else None,
+                    timeout=timeout,
+                    on_timeout=on_timeout,
+                )
+            elif shells is not None and shell_key is not None:
+                response, context = _render_template(context, encoding, status)
+                tmpl, context = _render_string(template_name, request, context, app_key)
+                key = shell_key(request)
+                if tmpl.environment.is_async:
+                    await resolve_async(tmpl, context)
+                    body = await shells.render_async(tmpl, key, context, encoding)
+                else:
+                    body = shells.render(tmpl, key, context, encoding)
+                response.body = body
+            elif env and env.is_async:
+                response = await _template_response_async(
+                    template_name,
+                    env,
+                    request,
+                    context,
+                    config,
+                    app_key=app_key,
+                    encoding=encoding,
+                    status=status,
+                    timeout=timeout,
+                    on_timeout=on_timeout,
+                    single_flight=single_flight,
+                )
+            else:
+                response = _template_response(
+                    template_name,
+                    env,
+                    request,
+                    context,
+                    config,
+                    app_key=app_key,
+                    encoding=encoding,
+                    status=status,
+                    timeout=timeout,
+                    on_timeout=on_timeout,
+                )
+            for header in vary:
+                response.headers.add(hdrs.VARY, header)
+            return response
+
+        @functools.wraps(func)
+        async def wrapped(*args: _P.args, **kwargs: _P.kwargs) -> web.StreamResponse:  # type: ignore[misc]
             # Supports class based views see web.View
             if isinstance(args[0], AbstractView):
                 request = args[0].request
             else:
                 request = args[-1]  # type: ignore[assignment]
 
-            env = request.config_dict.get(app_key)
-            if env and env.is_async:
-                response = await render_template_async(
-                    template_name, request, context, app_key=app_key, encoding=encoding
-                )
-            else:
-                response = render_template(
-                    template_name, request, context, app_key=app_key, encoding=encoding
+            # JSON clients get the context, no template is looked up
+            config = _app_config(request)
+            as_json = negotiate and _prefers_json(request)
+            env = None if as_json else _request_env(request, app_key, config)
+            request_vary = vary
+            if env is not None:
+                root_env = config.env(request, app_key)
+                if root_env is not None and varies_by_language(root_env):
+                    request_vary = [*vary, hdrs.ACCEPT_LANGUAGE]
+            if pages is not None and env is not None:
+                page = pages.get(env)
+                if page is not None:
+                    return page.response(request, request_vary)
+
+            admission = config.admission
+            if admission is None:
+                context = await func(*args, **kwargs)
+                return await respond(
+                    request, env, context, as_json, request_vary, config
                 )
-            response.set_status(status)
-            return response
+            try:
+                async with admission.slot(
+                    template_name, priority=priority, limit=max_renders
+                ):
+                    context = await func(*args, **kwargs)
+                    return await respond(
+                        request, env, context, as_json, request_vary, config
+                    )
+            except Rejected:
+                return admission.reject()
 
         return wrapped
 
@@ -0,0 +1,165 @@
+"""Admission control limiting the number of concurrent renders."""
+
+import asyncio
+import heapq
+import itertools
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Mapping
+
+from aiohttp import hdrs, web
+
+_REJECTION = b"<!doctype html><title>503 Service Unavailable</title>"
+
+
+class Rejected(Exception):
+    """No render slot became free in time."""
+
+
+class _Waiter:
+    def __init__(self, template_name: str, limit: int | None) -> None:
+        self.template_name = template_name
+        self.limit = limit
+        self.future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+
+
+class RenderAdmission:
+    """Limit concurrent renders globally and per template.
+
+    At most *max_renders* renders run at a time, and at most
+    ``template_limits[name]`` of the template *name*. Requests over a limit
+    wait in a queue of *max_queue* entries, the highest priority first and
+    in order of arrival within a priority. Requests finding the queue full
+    or waiting longer than *max_wait* seconds get a 503 response built from
+    the *rejection* body rendered beforehand.
+    """
+
+    def __init__(
+        self,
+        max_renders: int | None = None,
+        *,
+        template_limits: Mapping[str, int] | None = None,
+        max_queue: int = 100,
+        max_wait: float = 1.0,
+        rejection: bytes = _REJECTION,
+        retry_after: int = 1,
+    ) -> None:
+        self.max_renders = max_renders
+        self.template_limits = dict(template_limits or {})
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.rejection = rejection
+        self.retry_after = str(retry_after)
+        self.rejected = 0
+        self._running = 0
+        self._running_templates: Counter[str] = Counter()
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._queued = 0
+        self._order = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    def _limit(self, template_name: str, limit: int | None) -> int | None:
+        if limit is not None:
+            return limit
+        return self.template_limits.get(template_name)
+
+    def _free(self, template_name: str, limit: int | None) -> bool:
+        if self.max_renders is not None and self._running >= self.max_renders:
+            return False
+        return limit is None or self._running_templates[template_name] < limit
+
+    def _start(self, template_name: str) -> None:
+        self._running += 1
+        self._running_templates[template_name] += 1
+
+    def _release(self, template_name: str) -> None:
+        self._running -= 1
+        self._running_templates[template_name] -= 1
+        if not self._running_templates[template_name]:
+            del self._running_templates[template_name]
+        self._wake()
+
+    def _wake(self) -> None:
+        blocked = []
+        while self._queue:
+            if self.max_renders is not None and self._running >= self.max_renders:
+                break
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.future.done():
+                # gave up waiting
+                continue
+            if not self._free(waiter.template_name, waiter.limit):
+                # the template is at its own limit, others may go first
+                blocked.append(entry)
+                continue
+            self._queued -= 1
+            self._start(waiter.template_name)
+            waiter.future.set_result(None)
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    async def _acquire(
+        self, template_name: str, priority: int, limit: int | None
+    ) -> None:
+        if self._free(template_name, limit) and not self._queued:
+            self._start(template_name)
+            return
+        if self._queued >= self.max_queue:
+            raise Rejected
+        waiter = _Waiter(template_name, limit)
+        # entries are unique by their order of arrival, waiters are never compared
+        heapq.heappush(self._queue, (-priority, next(self._order), waiter))
+        self._queued += 1
+        # a slot may be free for this template while others wait for theirs
+        self._wake()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if self._leave_queue(waiter):
+                # the slot was given as the wait ended
+                return
+            raise Rejected from None
+        except BaseException:
+            if self._leave_queue(waiter):
+                self._release(template_name)
+            raise
+
+    def _leave_queue(self, waiter: _Waiter) -> bool:
+        """Stop waiting, return whether the slot was given already."""
+        if waiter.future.done():
+            return True
+        waiter.future.cancel()
+        self._queued -= 1
+        return False
+
+    @asynccontextmanager
+    async def slot(
+        self, template_name: str, *, priority: int = 0, limit: int | None = None
+    ) -> AsyncIterator[None]:
+        """Wait for a render slot, raise :exc:`Rejected` when none is free.
+
+        *limit* replaces the limit of the template from *template_limits*.
+        """
+        limit = self._limit(template_name, limit)
+        await self._acquire(template_name, priority, limit)
+        try:
+            yield
+        finally:
+            self._release(template_name)
+
+    def reject(self) -> web.Response:
+        self.rejected += 1
+        return web.Response(
+            body=self.rejection,
+            status=503,
+            content_type="text/html",
+            headers={hdrs.RETRY_AFTER: self.retry_after},
+        )
@@ -0,0 +1,224 @@
+"""Compiled template cache bounded by memory instead of template count."""
+
+import heapq
+import sys
+import threading
+import time
+from types import CodeType
+from typing import Any, Iterator, MutableMapping, NamedTuple
+
+import jinja2
+
+# Environment cache keys are (weakref to the loader, template name) pairs,
+# views add their tag
+_Key = tuple[Any, ...]
+
+
+class CacheEntry(NamedTuple):
+    name: str
+    size: int
+    hits: int
+    last_used: float
+    compile_time: float
+
+
+class _Entry:
+    __slots__ = ("template", "size", "cost", "hits", "last_used", "priority")
+
+    def __init__(self, template: jinja2.Template, size: int, cost: float) -> None:
+        self.template = template
+        self.size = size
+        self.cost = cost
+        self.hits = 0
+        self.last_used = time.time()
+        self.priority = 0.0
+
+
+def _code_size(code: CodeType) -> int:
+    size = sys.getsizeof(code)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            size += _code_size(const)
+        else:
+            size += sys.getsizeof(const)
+    return size
+
+
+def estimate_size(template: jinja2.Template) -> int:
+    """Rough size in bytes of the code compiled for *template*."""
+    funcs = [template.root_render_func, *template.blocks.values()]
+    return sum(_code_size(func.__code__) for func in funcs)
+
+
+class TemplateCache(MutableMapping[_Key, jinja2.Template]):
+    """Cache for :attr:`jinja2.Environment.cache` limited to *max_bytes*.
+
+    Eviction follows the greedy-dual-size-frequency policy: an entry's
+    priority grows with its hit count and compile time and shrinks with its
+    size, and ages relatively to entries used later, so among cold entries
+    the big and cheap to compile ones go first.
+    """
+
+    # Environment.overlay() creates an LRUCache of the same capacity
+    capacity = 400
+
+    def __init__(self, max_bytes: int) -> None:
+        if max_bytes <= 0:
+            raise ValueError("max_bytes should be a positive number")
+        self.max_bytes = max_bytes
+        self.total_size = 0
+        self._entries: dict[_Key, _Entry] = {}
+        self._heap: list[tuple[float, int, _Key]] = []
+        self._counter = 0
+        self._age = 0.0
+        self._lock = threading.RLock()
+        # time of the last miss per thread, the environment compiles and
+        # stores the template right after
+        self._local = threading.local()
+
+    def _push(self, key: _Key, entry: _Entry) -> None:
+        entry.priority = self._age + (entry.hits + 1) * entry.cost / entry.size
+        self._counter += 1
+        heapq.heappush(self._heap, (entry.priority, self._counter, key))
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._heap = [
+                (e.priority, i, k) for i, (k, e) in enumerate(self._entries.items())
+            ]
+            heapq.heapify(self._heap)
+
+    def _evict(self, keep: _Key) -> None:
+        kept = None
+        while self.total_size > self.max_bytes and self._heap:
+            item = heapq.heappop(self._heap)
+            priority, _, key = item
+            entry = self._entries.get(key)
+            if entry is None or entry.priority != priority:
+                continue
+            if key == keep:
+                # an oversized template still gets cached on its own
+                kept = item
+                continue
+            del self._entries[key]
+            self.total_size -= entry.size
+            self._age = priority
+        if kept is not None:
+            heapq.heappush(self._heap, kept)
+
+    def get(  # type: ignore[override]
+        self, key: _Key, default: jinja2.Template | None = None
+    ) -> jinja2.Template | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._local.miss = (key, time.perf_counter())
+                return default
+            entry.hits += 1
+            entry.last_used = time.time()
+            self._push(key, entry)
+            return entry.template
+
+    def __getitem__(self, key: _Key) -> jinja2.Template:
+        template = self.get(key)
+        if template is None:
+            raise KeyError(key)
+        return template
+
+    def __setitem__(self, key: _Key, template: jinja2.Template) -> None:
+        miss = getattr(self._local, "miss", None)
+        cost = 0.0
+        if miss is not None and miss[0] == key:
+            cost = time.perf_counter() - miss[1]
+            self._local.miss = None
+        entry = _Entry(template, max(estimate_size(template), 1), max(cost, 1e-6))
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_size -= old.size
+            self._entries[key] = entry
+            self.total_size += entry.size
+            self._push(key, entry)
+            self._evict(keep=key)
+
+    def __delitem__(self, key: _Key) -> None:
+        with self._lock:
+            entry = self._entries.pop(key)
+            self.total_size -= entry.size
+
+    def __iter__(self) -> Iterator[_Key]:
+        return iter(list(self._entries))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._heap.clear()
+            self.total_size = 0
+            self._age = 0.0
+
+    def view(self, tag: str) -> "_TaggedView":
+        """Return a cache storing its templates in this one under *tag*.
+
+        For environments sharing the loader of the one using this cache,
+        e.g. overlays compiling the same templates differently, to share the
+        budget without mixing up the templates.
+        """
+        return _TaggedView(self, tag)
+
+    def entries(self) -> list[CacheEntry]:
+        """Describe cached templates, most recently used first."""
+        with self._lock:
+            items = [
+                CacheEntry(
+                    key[1],
+                    entry.size,
+                    entry.hits,
+                    entry.last_used,
+                    entry.cost,
+                )
+                for key, entry in self._entries.items()
+            ]
+        return sorted(items, key=lambda item: -item.last_used)
+
+
+class _TaggedView(MutableMapping[_Key, jinja2.Template]):
+    def __init__(self, cache: TemplateCache, tag: str) -> None:
+        self.cache = cache
+        self.tag = tag
+
+    @property
+    def capacity(self) -> int:
+        return self.cache.capacity
+
+    def _key(self, key: _Key) -> _Key:
+        return (*key, self.tag)
+
+    def get(  # type: ignore[override]
+        self, key: _Key, default: jinja2.Template | None = None
+    ) -> jinja2.Template | None:
+        return self.cache.get(self._key(key), default)
+
+    def __getitem__(self, key: _Key) -> jinja2.Template:
+        return self.cache[self._key(key)]
+
+    def __setitem__(self, key: _Key, template: jinja2.Template) -> None:
+        self.cache[self._key(key)] = template
+
+    def __delitem__(self, key: _Key) -> None:
+        del self.cache[self._key(key)]
+
+    def __iter__(self) -> Iterator[_Key]:
+        return (
+            key[:-1] for key in self.cache if len(key) == 3 and key[-1] == self.tag
+        )
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def clear(self) -> None:
+        for key in list(self):
+            self.pop(key, None)
+
+    def view(self, tag: str) -> "_TaggedView":
+        return _TaggedView(self.cache, f"{self.tag}/{tag}")
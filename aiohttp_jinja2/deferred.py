@@ -0,0 +1,212 @@
+"""Context values computed only when a template reads them."""
+
+import asyncio
+import weakref
+from typing import Any, Callable, Iterator, Mapping
+
+import jinja2
+from jinja2.runtime import Context
+from markupsafe import Markup, escape
+
+from .fastpath import is_async_callable
+from .usage import referenced_names
+
+_UNSET: Any = object()
+
+_names: weakref.WeakKeyDictionary[jinja2.Template, frozenset[str] | None] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _value(obj: "Lazy") -> Any:
+    return obj._lazy_resolve()
+
+
+class Lazy:
+    """Context value produced by calling *func* on first use.
+
+    Compiled templates look up every variable of a scope when entering it,
+    so the lookup returns the wrapper itself, standing in for the value
+    like :class:`jinja2.Undefined` does for missing ones: printing it,
+    testing its truth, taking its length, iterating over it, comparing it,
+    calling it or accessing its attributes and items calls *func* once.
+    """
+
+    # odd names, attributes of the value are looked up through the wrapper
+    __slots__ = ("_lazy_func", "_lazy_is_async", "_lazy_value", "_lazy_task")
+
+    def __init__(self, func: Callable[[], Any]) -> None:
+        self._lazy_func = func
+        self._lazy_is_async = is_async_callable(func)
+        self._lazy_value = _UNSET
+        self._lazy_task: asyncio.Future[Any] | None = None
+
+    def _lazy_resolve(self) -> Any:
+        if self._lazy_value is _UNSET:
+            if self._lazy_is_async:
+                raise TypeError(
+                    f"{self._lazy_func!r} is a coroutine function, awaiting "
+                    "lazy values needs an environment with enable_async=True"
+                )
+            self._lazy_value = self._lazy_func()
+        return self._lazy_value
+
+    async def _lazy_resolve_async(self) -> Any:
+        if self._lazy_value is _UNSET:
+            if not self._lazy_is_async:
+                return self._lazy_resolve()
+            # renders sharing the value wait for the same call
+            if self._lazy_task is None:
+                self._lazy_task = asyncio.ensure_future(self._lazy_func())
+            self._lazy_value = await self._lazy_task
+        return self._lazy_value
+
+    def __repr__(self) -> str:
+        return f"<Lazy {self._lazy_func!r}>"
+
+    def _lazy_peek(self) -> tuple[bool, Any]:
+        return self._lazy_value is not _UNSET, self._lazy_value
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            # protocol probes like hasattr(obj, "__aiter__") or the
+            # _is_coroutine_marker lookup of inspect are not a use
+            raise AttributeError(name)
+        return getattr(_value(self), name)
+
+    def __getitem__(self, key: Any) -> Any:
+        return _value(self)[key]
+
+    def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        return _value(self)(*args, **kwargs)
+
+    def __str__(self) -> str:
+        return str(_value(self))
+
+    def __html__(self) -> Markup:
+        return escape(_value(self))
+
+    def __bool__(self) -> bool:
+        return bool(_value(self))
+
+    def __len__(self) -> int:
+        return len(_value(self))
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(_value(self))
+
+    def __contains__(self, item: Any) -> bool:
+        return item in _value(self)
+
+    def __eq__(self, other: object) -> bool:
+        return bool(_value(self) == other)
+
+    def __ne__(self, other: object) -> bool:
+        return bool(_value(self) != other)
+
+    def __lt__(self, other: Any) -> Any:
+        return _value(self) < other
+
+    def __le__(self, other: Any) -> Any:
+        return _value(self) <= other
+
+    def __gt__(self, other: Any) -> Any:
+        return _value(self) > other
+
+    def __ge__(self, other: Any) -> Any:
+        return _value(self) >= other
+
+    def __hash__(self) -> int:
+        return hash(_value(self))
+
+    def __int__(self) -> int:
+        return int(_value(self))
+
+    def __float__(self) -> float:
+        return float(_value(self))
+
+    def __add__(self, other: Any) -> Any:
+        return _value(self) + other
+
+    def __radd__(self, other: Any) -> Any:
+        return other + _value(self)
+
+    def __sub__(self, other: Any) -> Any:
+        return _value(self) - other
+
+    def __mul__(self, other: Any) -> Any:
+        return _value(self) * other
+
+    def __truediv__(self, other: Any) -> Any:
+        return _value(self) / other
+
+    def __mod__(self, other: Any) -> Any:
+        return _value(self) % other
+
+
+def lazy(func: Callable[[], Any]) -> Lazy:
+    """Wrap *func* to be called when a template first uses the value.
+
+    The result is kept for the later uses. In async environments *func*
+    may be a coroutine function.
+    """
+    return Lazy(func)
+
+
+class LazyContext(Context):
+    """Template context unwrapping the :class:`Lazy` values computed already."""
+
+    def resolve_or_missing(self, key: str) -> Any:
+        value = super().resolve_or_missing(key)
+        if isinstance(value, Lazy):
+            if value._lazy_value is not _UNSET:
+                return value._lazy_value
+            if value._lazy_is_async:
+                # not awaited by resolve_async(), e.g. a sync environment
+                return value._lazy_resolve()
+        return value
+
+
+def _referenced(template: jinja2.Template) -> frozenset[str] | None:
+    try:
+        return _names[template]
+    except KeyError:
+        pass
+    names = None
+    if template.name is not None:
+        names = referenced_names(template.environment, template.name)
+    _names[template] = names
+    return names
+
+
+async def resolve_async(template: jinja2.Template, context: Mapping[str, Any]) -> None:
+    """Await the async lazy values *template* may read, concurrently.
+
+    Variable lookups cannot await while rendering, the values referenced
+    anywhere in the template and the ones it pulls in are awaited
+    beforehand instead, including the ones only used by branches the
+    render does not take.
+    """
+    pending = [
+        (key, value)
+        for key, value in context.items()
+        if isinstance(value, Lazy)
+        and value._lazy_is_async
+        and value._lazy_value is _UNSET
+    ]
+    if not pending:
+        return
+    names = _referenced(template)
+    if names is not None:
+        pending = [(key, value) for key, value in pending if key in names]
+    await asyncio.gather(*(value._lazy_resolve_async() for _, value in pending))
+
+
+async def computed(context: Mapping[str, Any]) -> dict[str, Any]:
+    """Return a copy of *context* with its :class:`Lazy` values computed.
+
+    Coroutine functions are awaited concurrently.
+    """
+    keys = [key for key, value in context.items() if isinstance(value, Lazy)]
+    values = await asyncio.gather(*(context[key]._lazy_resolve_async() for key in keys))
+    return {**context, **dict(zip(keys, values))}
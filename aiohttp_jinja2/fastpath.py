@@ -0,0 +1,310 @@
+"""Synchronous rendering of templates that never await in async environments.
+
+With ``enable_async=True`` every template is compiled into async generator
+code and rendered through :meth:`jinja2.Template.render_async`, even when
+nothing in it can produce an awaitable. :class:`SyncVariants` inspects the
+template source (following extends, includes and imports) and, when no
+async construct is reachable, renders a synchronously compiled variant of
+the very same template instead.
+"""
+
+import functools
+import inspect
+import types
+import weakref
+from typing import Any, Mapping, NamedTuple
+
+import jinja2
+from jinja2 import nodes
+
+from .cache import TemplateCache, _TaggedView
+from .references import DynamicReference, walk
+
+# names the code generator provides inside templates
+_IMPLICIT_CALLABLES = frozenset(("caller", "loop", "super"))
+_IMPLICIT_OBJECTS = frozenset(("loop", "self"))
+
+# values telling sync and async apart by themselves rather than by their type
+_FUNCTION_TYPES = (
+    types.BuiltinFunctionType,
+    types.FunctionType,
+    types.GeneratorType,
+    types.MethodType,
+    functools.partial,
+)
+
+_MISSING: Any = object()
+
+# whether instances of a type are async values
+_async_types: dict[type, bool] = {}
+
+
+def is_async_callable(obj: Any) -> bool:
+    return (
+        inspect.iscoroutinefunction(obj)
+        or inspect.isasyncgenfunction(obj)
+        or inspect.iscoroutinefunction(getattr(obj, "__call__", None))
+    )
+
+
+def _peek(obj: Any) -> tuple[bool, Any]:
+    """Return whether the value of *obj* is known, and the value.
+
+    deferred.Lazy wrappers tell without computing their value.
+    """
+    peek = getattr(type(obj), "_lazy_peek", None)
+    return (True, obj) if peek is None else peek(obj)
+
+
+def is_async_value(obj: Any) -> bool:
+    known, obj = _peek(obj)
+    if not known:
+        # async lazy values resolve_async() left are not read by the template,
+        # sync ones are computed by the sync render just the same
+        return False
+    return (
+        inspect.isawaitable(obj) or hasattr(obj, "__aiter__") or is_async_callable(obj)
+    )
+
+
+def _is_async_instance(obj: Any) -> bool:
+    """:func:`is_async_value` decided once per type where the type tells."""
+    cls = type(obj)
+    cached = _async_types.get(cls)
+    if cached is not None:
+        return cached
+    peek = getattr(cls, "_lazy_peek", None)
+    if peek is not None:
+        known, value = peek(obj)
+        return known and _is_async_instance(value)
+    if isinstance(obj, _FUNCTION_TYPES):
+        return is_async_value(obj)
+    result = _async_types[cls] = is_async_value(obj)
+    return result
+
+
+def _is_sync_method(cls: type, name: str) -> bool:
+    """Whether calling attribute *name* of instances of *cls* cannot await.
+
+    Looked up on the class without evaluating anything, attributes only
+    known by evaluating them count as async.
+    """
+    attr = inspect.getattr_static(cls, name, _MISSING)
+    if isinstance(attr, (staticmethod, classmethod)):
+        attr = attr.__func__
+    return inspect.isroutine(attr) and not is_async_callable(attr)
+
+
+class _Unsafe(Exception):
+    """Raised by the analysis when an async construct may be reachable."""
+
+
+# context variable and the (is item, key) lookups applied to it, like
+# ``page.rows`` or ``page["rows"]``
+_Path = tuple[str, tuple[tuple[bool, Any], ...]]
+
+
+class _Plan(NamedTuple):
+    template: jinja2.Template
+    # methods of context variables the template calls, ``page.load()``;
+    # they can be checked only against the actual context
+    calls: frozenset[tuple[str, str]]
+
+
+class _Analyzer:
+    def __init__(self, env: jinja2.Environment) -> None:
+        self._env = env
+        self.calls: set[tuple[str, str]] = set()
+
+    def template(self, name: str) -> None:
+        if self._env.loader is None:
+            raise _Unsafe(name)
+        try:
+            for _, ast in walk(self._env, name):
+                self.check(ast)
+        except DynamicReference as exc:
+            raise _Unsafe(name) from exc
+
+    def check(self, ast: nodes.Template) -> None:
+        env = self._env
+        # loop targets, macro arguments and variables set by the template may
+        # hold anything taken out of the context
+        assigned = {
+            n.name for n in ast.find_all(nodes.Name) if n.ctx in ("store", "param")
+        }
+        macros = {m.name for m in ast.find_all(nodes.Macro)}
+        imported: set[str] = set()
+        namespaces: set[str] = set(_IMPLICIT_OBJECTS)
+
+        for import_ in ast.find_all(nodes.Import):
+            namespaces.add(import_.target)
+        for from_import in ast.find_all(nodes.FromImport):
+            for item in from_import.names:
+                imported.add(item[1] if isinstance(item, tuple) else item)
+
+        def path(node: nodes.Node) -> _Path | None:
+            """Return the lookups producing *node*, ``None`` for other objects."""
+            steps: list[tuple[bool, Any]] = []
+            while isinstance(node, (nodes.Getattr, nodes.Getitem)):
+                if isinstance(node, nodes.Getattr):
+                    steps.append((False, node.attr))
+                elif isinstance(node.arg, nodes.Const):
+                    steps.append((True, node.arg.value))
+                else:
+                    raise _Unsafe(node)
+                node = node.node
+            if not isinstance(node, nodes.Name) or node.name in assigned:
+                raise _Unsafe(node)
+            if node.name in namespaces:
+                return None
+            return node.name, tuple(reversed(steps))
+
+        def value(node: nodes.Node) -> None:
+            if isinstance(node, nodes.Name):
+                if node.name in assigned:
+                    raise _Unsafe(node)
+                # context variables are checked at render time
+                if node.name in env.globals and is_async_value(env.globals[node.name]):
+                    raise _Unsafe(node)
+            elif isinstance(node, (nodes.Getattr, nodes.Getitem)):
+                # known only by evaluating the lookups, which the render
+                # does again
+                if path(node) is not None:
+                    raise _Unsafe(node)
+            elif not isinstance(
+                node, (nodes.Const, nodes.Literal, nodes.Call, nodes.Filter)
+            ):
+                # calls and filters are checked on their own
+                raise _Unsafe(node)
+
+        for for_ in ast.find_all(nodes.For):
+            value(for_.iter)
+        for filter_ in ast.find_all(nodes.Filter):
+            func = env.filters.get(filter_.name)
+            if func is None or is_async_callable(func):
+                raise _Unsafe(filter_)
+            if filter_.node is not None and getattr(func, "jinja_async_variant", False):
+                value(filter_.node)
+        for test in ast.find_all(nodes.Test):
+            func = env.tests.get(test.name)
+            if func is None or is_async_callable(func):
+                raise _Unsafe(test)
+
+        for call in ast.find_all(nodes.Call):
+            func = call.node
+            if isinstance(func, nodes.Name):
+                name = func.name
+                if name in macros or name in imported or name in _IMPLICIT_CALLABLES:
+                    continue
+                if name in assigned:
+                    raise _Unsafe(call)
+                if name in env.globals and is_async_callable(env.globals[name]):
+                    raise _Unsafe(call)
+                # otherwise a context variable, checked at render time
+            elif isinstance(func, nodes.ExtensionAttribute):
+                ext = env.extensions[func.identifier]
+                if is_async_callable(getattr(ext, func.name)):
+                    raise _Unsafe(call)
+            else:
+                found = path(func)
+                if found is None:
+                    continue
+                name, steps = found
+                if len(steps) != 1 or steps[0][0]:
+                    # the method of a looked up object or item
+                    raise _Unsafe(call)
+                self.calls.add((name, steps[0][1]))
+
+
+class SyncVariants:
+    """Pick synchronously compiled twins for templates of an async environment."""
+
+    def __init__(self, env: jinja2.Environment) -> None:
+        self._env = env
+        # linked overlay: shares loader, filters and globals, has its own
+        # cache; bytecode is keyed by source only and must not be shared
+        self._sync_env = env.overlay(enable_async=False, bytecode_cache=None)
+        if isinstance(env.cache, (TemplateCache, _TaggedView)):
+            # the twins count against the same memory budget
+            self._sync_env.cache = env.cache.view("sync")
+        self._plans: weakref.WeakKeyDictionary[jinja2.Template, _Plan | None] = (
+            weakref.WeakKeyDictionary()
+        )
+        # (class, method name) -> whether calling the method cannot await
+        self._methods: dict[tuple[type, str], bool] = {}
+
+    def _plan(self, template: jinja2.Template) -> _Plan | None:
+        if template.name is None:
+            return None
+        analyzer = _Analyzer(self._env)
+        try:
+            analyzer.template(template.name)
+        except (_Unsafe, jinja2.TemplateError):
+            return None
+        return _Plan(
+            self._sync_env.get_template(template.name), frozenset(analyzer.calls)
+        )
+
+    def prepare(self, template: jinja2.Template) -> _Plan | None:
+        """Analyze *template* and compile its sync twin if it has one."""
+        try:
+            return self._plans[template]
+        except KeyError:
+            plan = self._plans[template] = self._plan(template)
+            return plan
+
+    def _is_sync_call(self, context: Mapping[str, Any], name: str, attr: str) -> bool:
+        obj = context[name] if name in context else self._env.globals.get(name)
+        cls = type(obj)
+        peek = getattr(cls, "_lazy_peek", None)
+        if peek is not None:
+            known, obj = peek(obj)
+            if not known:
+                return False
+            cls = type(obj)
+        key = (cls, attr)
+        sync = self._methods.get(key)
+        if sync is None:
+            sync = self._methods[key] = _is_sync_method(cls, attr)
+        return sync
+
+    def get(
+        self, template: jinja2.Template, context: Mapping[str, Any]
+    ) -> jinja2.Template | None:
+        """Return the sync variant to render *context* with, or ``None``."""
+        plan = self.prepare(template)
+        if plan is None:
+            return None
+        for value in context.values():
+            if _is_async_instance(value):
+                return None
+        for name, attr in plan.calls:
+            if not self._is_sync_call(context, name, attr):
+                return None
+        return plan.template
+
+
+def enable(env: jinja2.Environment) -> None:
+    # stored on the environment itself, a registry keyed by environment would
+    # keep it alive through the overlay linked to it
+    env.extend(aiohttp_jinja2_sync_variants=SyncVariants(env))
+
+
+def sync_variant(
+    template: jinja2.Template, context: Mapping[str, Any]
+) -> jinja2.Template | None:
+    variants: SyncVariants | None = getattr(
+        template.environment, "aiohttp_jinja2_sync_variants", None
+    )
+    if variants is None:
+        return None
+    return variants.get(template, context)
+
+
+def prepare(template: jinja2.Template) -> None:
+    """Compile the sync variant of *template* ahead of its first render."""
+    variants: SyncVariants | None = getattr(
+        template.environment, "aiohttp_jinja2_sync_variants", None
+    )
+    if variants is not None:
+        variants.prepare(template)
@@ -0,0 +1,290 @@
+"""Compile-time inlining of extended and included templates."""
+
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator
+
+import jinja2
+from jinja2.ext import Extension
+from jinja2.lexer import Token, TokenStream
+
+# tags whose effect changes when the template is inlined into another one
+_SCOPED_TAGS = frozenset(("block", "extends", "from", "import", "macro", "set"))
+
+# names the code generator provides to the including template only
+_IMPLICIT_NAMES = frozenset(("caller", "kwargs", "loop", "self", "varargs"))
+
+# names of the templates being flattened, guards against include cycles
+_active: ContextVar[frozenset[str]] = ContextVar(
+    "aiohttp_jinja2_flattening", default=frozenset()
+)
+
+_Uptodate = Callable[[], bool] | None
+
+
+class _Unflattenable(Exception):
+    """The template is compiled as it is."""
+
+
+class _Block:
+    def __init__(
+        self,
+        name: str,
+        opening: list[Token],
+        body: list["Token | _Block"],
+        closing: list[Token],
+    ) -> None:
+        self.name = name
+        self.opening = opening
+        self.body = body
+        self.closing = closing
+
+
+def _is_tag(tokens: list[Token], pos: int, name: str) -> bool:
+    return (
+        tokens[pos].type == "block_begin"
+        and pos + 1 < len(tokens)
+        and tokens[pos + 1].test(f"name:{name}")
+    )
+
+
+def _tag_end(tokens: list[Token], pos: int) -> int:
+    while tokens[pos].type != "block_end":
+        pos += 1
+    return pos
+
+
+def _parse(
+    tokens: list[Token], pos: int = 0, in_block: bool = False
+) -> tuple[list["Token | _Block"], int]:
+    items: list[Token | _Block] = []
+    while pos < len(tokens):
+        if _is_tag(tokens, pos, "block"):
+            end = _tag_end(tokens, pos)
+            body, close = _parse(tokens, end + 1, True)
+            close_end = _tag_end(tokens, close)
+            items.append(
+                _Block(
+                    tokens[pos + 2].value,
+                    tokens[pos : end + 1],
+                    body,
+                    tokens[close : close_end + 1],
+                )
+            )
+            pos = close_end + 1
+        elif _is_tag(tokens, pos, "endblock"):
+            if not in_block:
+                raise _Unflattenable
+            return items, pos
+        else:
+            items.append(tokens[pos])
+            pos += 1
+    if in_block:
+        raise _Unflattenable
+    return items, pos
+
+
+def _walk(items: list["Token | _Block"]) -> Iterator[_Block]:
+    for item in items:
+        if isinstance(item, _Block):
+            yield item
+            yield from _walk(item.body)
+
+
+def _emit(
+    items: list["Token | _Block"], overrides: dict[str, _Block], out: list[Token]
+) -> None:
+    for item in items:
+        if isinstance(item, _Block):
+            block = overrides.get(item.name, item)
+            out.extend(block.opening)
+            _emit(block.body, overrides, out)
+            out.extend(block.closing)
+        else:
+            out.append(item)
+
+
+class FlattenExtension(Extension):
+    """Inline templates extended or included by constant names.
+
+    ``{% extends %}`` is resolved by substituting the blocks of the child
+    into the (flattened) parent, ``{% include %}`` by the tokens of the
+    included template, so the compiled template renders without looking
+    up other templates, creating contexts for them or chaining their
+    generators. Templates for which this would change the behaviour are
+    left as they are: children using ``super()`` or with code outside of
+    their blocks, included templates defining blocks, macros or variables
+    or importing others, includes ``without context`` or ``ignore
+    missing``, and included templates reading names only the including
+    template provides, like ``loop`` or ``varargs``.
+
+    Templates compiled with inlined ones are out of date as soon as any of
+    them is.
+    """
+
+    # after the other extensions, inlined tokens went through them already
+    priority = 1000
+
+    def __init__(self, environment: jinja2.Environment) -> None:
+        super().__init__(environment)
+        # template name -> uptodate callables of the templates inlined in it,
+        # shared with the bound copies of linked environments
+        self.dependencies: dict[str, list[_Uptodate]] = {}
+        cls = environment.template_class
+        if cls is jinja2.Template:
+            environment.template_class = _FlattenedTemplate
+        elif not issubclass(cls, _FlattenedTemplate):
+            environment.template_class = type(
+                f"Flattened{cls.__name__}", (_FlattenedTemplate, cls), {}
+            )
+
+    def up_to_date(self, name: str) -> bool:
+        return all(
+            uptodate is None or uptodate()
+            for uptodate in self.dependencies.get(name, ())
+        )
+
+    def filter_stream(self, stream: TokenStream) -> Iterator[Token]:
+        tokens = list(stream)
+        name = stream.name
+        if self.environment.loader is None:
+            yield from tokens
+            return
+        active = _active.get()
+        token = _active.set(active | {name} if name is not None else active)
+        try:
+            dependencies: list[_Uptodate] = []
+            try:
+                tokens = self._extends(tokens, name, dependencies)
+            except _Unflattenable:
+                pass
+            tokens = self._includes(tokens, name, dependencies)
+        finally:
+            _active.reset(token)
+        if name is not None:
+            self.dependencies[name] = dependencies
+        yield from tokens
+
+    def _load(
+        self, name: str, into: str | None, dependencies: list[_Uptodate]
+    ) -> list[Token]:
+        """Return the flattened tokens of *name* to inline into *into*."""
+        if name in _active.get():
+            raise _Unflattenable
+        env = self.environment
+        if callable(env.autoescape) and env.autoescape(name) != env.autoescape(into):
+            # e.g. select_autoescape() picking it by file extension
+            raise _Unflattenable
+        assert env.loader is not None  # noqa: S101
+        try:
+            source, filename, uptodate = env.loader.get_source(env, name)
+        except jinja2.TemplateNotFound:
+            raise _Unflattenable from None
+        tokens = list(env._tokenize(source, name, filename))
+        dependencies.append(uptodate)
+        dependencies.extend(self.dependencies.get(name, ()))
+        return tokens
+
+    def _extends(
+        self, tokens: list[Token], name: str | None, dependencies: list[_Uptodate]
+    ) -> list[Token]:
+        if not any(_is_tag(tokens, pos, "extends") for pos in range(len(tokens))):
+            return tokens
+        items, _ = _parse(tokens)
+        parent = None
+        pos = 0
+        while pos < len(items):
+            item = items[pos]
+            if isinstance(item, _Block) or (
+                item.type == "data" and not item.value.strip()
+            ):
+                pos += 1
+                continue
+            tag = items[pos : pos + 4]
+            if parent is None and _is_extends(tag):
+                parent = tag[2].value  # type: ignore[union-attr]
+                pos += 4
+                continue
+            # code outside of blocks or a computed parent name
+            raise _Unflattenable
+        if parent is None:
+            # extended conditionally
+            raise _Unflattenable
+        overrides: dict[str, _Block] = {}
+        for block in _walk(items):
+            if block.name in overrides or _uses_super(block.body):
+                raise _Unflattenable
+            overrides[block.name] = block
+        parent_items, _ = _parse(self._load(parent, name, dependencies))
+        out: list[Token] = []
+        _emit(parent_items, overrides, out)
+        if not {block.name for block in _walk(_parse(out)[0])}.issuperset(overrides):
+            # blocks only the child defines stay reachable through self
+            raise _Unflattenable
+        return out
+
+    def _includes(
+        self, tokens: list[Token], name: str | None, dependencies: list[_Uptodate]
+    ) -> list[Token]:
+        out: list[Token] = []
+        pos = 0
+        while pos < len(tokens):
+            if _is_tag(tokens, pos, "include"):
+                end = _tag_end(tokens, pos)
+                inlined = self._include(tokens[pos + 2 : end], name, dependencies)
+                if inlined is not None:
+                    out.extend(inlined)
+                    pos = end + 1
+                    continue
+            out.append(tokens[pos])
+            pos += 1
+        return out
+
+    def _include(
+        self, args: list[Token], into: str | None, dependencies: list[_Uptodate]
+    ) -> list[Token] | None:
+        if not args or args[0].type != "string":
+            return None
+        rest = [token.value for token in args[1:]]
+        if rest not in ([], ["with", "context"]):
+            return None
+        inlined: list[_Uptodate] = []
+        try:
+            tokens = self._load(args[0].value, into, inlined)
+        except _Unflattenable:
+            return None
+        for pos, token in enumerate(tokens):
+            if token.type == "block_begin" and pos + 1 < len(tokens):
+                if tokens[pos + 1].value in _SCOPED_TAGS:
+                    return None
+            if token.type == "name" and token.value in _IMPLICIT_NAMES:
+                return None
+        dependencies.extend(inlined)
+        return tokens
+
+
+def _uses_super(items: list["Token | _Block"]) -> bool:
+    for item in items:
+        if isinstance(item, _Block):
+            if _uses_super(item.body):
+                return True
+        elif item.test("name:super"):
+            return True
+    return False
+
+
+def _is_extends(tag: list["Token | _Block"]) -> bool:
+    return [getattr(item, "type", None) for item in tag] == [
+        "block_begin",
+        "name",
+        "string",
+        "block_end",
+    ] and tag[1].test("name:extends")  # type: ignore[union-attr]
+
+
+class _FlattenedTemplate(jinja2.Template):
+    @property
+    def is_up_to_date(self) -> bool:
+        if not super().is_up_to_date:
+            return False
+        ext: Any = self.environment.extensions.get(FlattenExtension.identifier)
+        return ext is None or self.name is None or ext.up_to_date(self.name)
@@ -0,0 +1,274 @@
+"""Rendering of single blocks and streaming of rendered fragments."""
+
+import abc
+import asyncio
+import re
+import weakref
+from typing import Any, Callable, Mapping
+
+import jinja2
+from aiohttp import web
+from jinja2 import nodes
+from jinja2.runtime import Context
+
+from . import fastpath
+from .deferred import resolve_async
+
+_parents: weakref.WeakKeyDictionary[jinja2.Template, str | None] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _parent_name(template: jinja2.Template) -> str | None:
+    try:
+        return _parents[template]
+    except KeyError:
+        pass
+    parent = None
+    env = template.environment
+    if template.name is not None and env.loader is not None:
+        source = env.loader.get_source(env, template.name)[0]
+        extends = env.parse(source, template.name).find(nodes.Extends)
+        if extends is not None:
+            if not isinstance(extends.template, nodes.Const):
+                raise RuntimeError(
+                    f"Cannot render blocks of '{template.name}', "
+                    "it extends a template chosen at render time"
+                )
+            parent = extends.template.value
+    _parents[template] = parent
+    return parent
+
+
+def _chain(template: jinja2.Template) -> list[jinja2.Template]:
+    """Return *template* followed by the templates it extends."""
+    chain = [template]
+    parent_name = _parent_name(template)
+    while parent_name is not None:
+        parent = template.environment.get_template(parent_name, template.name)
+        chain.append(parent)
+        parent_name = _parent_name(parent)
+    return chain
+
+
+def block_context(
+    template: jinja2.Template, context: Mapping[str, Any]
+) -> Context:
+    """Build a render context knowing the blocks of the whole extends chain.
+
+    Top-level code of the templates is not executed here, see
+    :func:`_setup`.
+    """
+    ctx = template.new_context(dict(context))
+    for parent in _chain(template)[1:]:
+        for name, func in parent.blocks.items():
+            ctx.blocks.setdefault(name, []).append(func)
+    return ctx
+
+
+# top-level statements whose effect blocks can see through the context
+_SETUP_NODES = (
+    nodes.Assign,
+    nodes.AssignBlock,
+    nodes.FromImport,
+    nodes.Import,
+    nodes.Macro,
+)
+
+_setups: weakref.WeakKeyDictionary[jinja2.Template, jinja2.Template | None] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _setup(template: jinja2.Template) -> jinja2.Template | None:
+    """Compile the top-level assignments, imports and macros of *template*.
+
+    A full render runs them before the blocks, whose output is skipped
+    when rendering a single block.
+    """
+    try:
+        return _setups[template]
+    except KeyError:
+        pass
+    setup = None
+    env = template.environment
+    if template.name is not None and env.loader is not None:
+        source, filename, _ = env.loader.get_source(env, template.name)
+        ast = env.parse(source, template.name, filename)
+        body = [node for node in ast.body if isinstance(node, _SETUP_NODES)]
+        if body:
+            setup_ast = nodes.Template(body, lineno=1)
+            setup_ast.set_environment(env)
+            code = env.compile(setup_ast, template.name, filename)
+            setup = env.template_class.from_code(env, code, template.globals)
+    _setups[template] = setup
+    return setup
+
+
+def _setups_of(template: jinja2.Template) -> list[jinja2.Template]:
+    # the child assigns first, the templates it extends may override
+    return [setup for t in _chain(template) if (setup := _setup(t)) is not None]
+
+
+_block_names: weakref.WeakKeyDictionary[jinja2.Template, frozenset[str]] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def has_block(template: jinja2.Template, block: str) -> bool:
+    try:
+        names = _block_names[template]
+    except KeyError:
+        names = _block_names[template] = frozenset(block_context(template, {}).blocks)
+    return block in names
+
+
+def _block_func(
+    ctx: Context, template: jinja2.Template, block: str
+) -> Callable[[Context], Any]:
+    try:
+        return ctx.blocks[block][0]
+    except KeyError:
+        text = f"Template '{template.name}' has no block '{block}'"
+        raise web.HTTPInternalServerError(reason=text, text=text) from None
+
+
+def render_fragment(
+    template: jinja2.Template, context: Mapping[str, Any], block: str | None
+) -> str:
+    if block is None:
+        return template.render(context)
+    ctx = block_context(template, context)
+    func = _block_func(ctx, template, block)
+    try:
+        for setup in _setups_of(template):
+            for _ in setup.root_render_func(ctx):
+                pass
+        return "".join(func(ctx))
+    except Exception:
+        return template.environment.handle_exception()
+
+
+async def render_fragment_async(
+    template: jinja2.Template, context: Mapping[str, Any], block: str | None
+) -> str:
+    await resolve_async(template, context)
+    sync_template = fastpath.sync_variant(template, context)
+    if sync_template is not None:
+        return render_fragment(sync_template, context, block)
+    if block is None:
+        return await template.render_async(context)
+    ctx = block_context(template, context)
+    func = _block_func(ctx, template, block)
+    try:
+        for setup in _setups_of(template):
+            async for _ in setup.root_render_func(ctx):  # type: ignore[attr-defined]
+                pass
+        return "".join([chunk async for chunk in func(ctx)])
+    except Exception:
+        return template.environment.handle_exception()
+
+
+class _FragmentStream(abc.ABC):
+    """Render fragments of a template bound to a base context.
+
+    Fragments sent while a previous write is still in progress are queued
+    and handed to the next write together, so a slow client gets fewer,
+    larger writes where the protocol allows it.
+    """
+
+    def __init__(
+        self,
+        template: jinja2.Template,
+        context: Mapping[str, Any],
+        block: str | None,
+    ) -> None:
+        self._template = template
+        self._context = context
+        self._block = block
+        self._pending: list[str] = []
+        self._lock = asyncio.Lock()
+
+    async def render(self, delta: Mapping[str, Any] | None = None) -> str:
+        context = dict(self._context, **delta) if delta else self._context
+        if self._template.environment.is_async:
+            return await render_fragment_async(self._template, context, self._block)
+        return render_fragment(self._template, context, self._block)
+
+    @abc.abstractmethod
+    async def _write(self, frames: list[str]) -> None:
+        """Send the queued *frames*, in order."""
+
+    async def _enqueue(self, frame: str) -> None:
+        self._pending.append(frame)
+        if self._lock.locked():
+            # the running writer picks the frame up
+            return
+        async with self._lock:
+            while self._pending:
+                frames, self._pending = self._pending, []
+                await self._write(frames)
+
+
+# the line ends of the event stream format, unlike str.splitlines()
+# which also splits at form feeds, U+2028 and other separators
+_SSE_LINE_END = re.compile(r"\r\n|\r|\n")
+
+
+class SSEStream(_FragmentStream):
+    """Server-Sent Events stream of rendered fragments."""
+
+    def __init__(
+        self,
+        template: jinja2.Template,
+        context: Mapping[str, Any],
+        block: str | None,
+        response: web.StreamResponse,
+    ) -> None:
+        super().__init__(template, context, block)
+        self.response = response
+
+    async def send(
+        self,
+        delta: Mapping[str, Any] | None = None,
+        *,
+        event: str | None = None,
+        event_id: str | None = None,
+    ) -> None:
+        for field, value in (("event", event), ("event_id", event_id)):
+            if value is not None and _SSE_LINE_END.search(value):
+                raise ValueError(f"{field} cannot contain line breaks: {value!r}")
+        html = await self.render(delta)
+        lines = []
+        if event is not None:
+            lines.append(f"event: {event}\n")
+        if event_id is not None:
+            lines.append(f"id: {event_id}\n")
+        lines.extend(f"data: {line}\n" for line in _SSE_LINE_END.split(html))
+        lines.append("\n")
+        await self._enqueue("".join(lines))
+
+    async def _write(self, frames: list[str]) -> None:
+        # events are delimited in the stream, one write carries them all
+        await self.response.write("".join(frames).encode())
+
+
+class WSStream(_FragmentStream):
+    """WebSocket stream of rendered fragments, one text message per fragment."""
+
+    def __init__(
+        self,
+        template: jinja2.Template,
+        context: Mapping[str, Any],
+        block: str | None,
+        ws: web.WebSocketResponse,
+    ) -> None:
+        super().__init__(template, context, block)
+        self.ws = ws
+
+    async def send(self, delta: Mapping[str, Any] | None = None) -> None:
+        await self._enqueue(await self.render(delta))
+
+    async def _write(self, frames: list[str]) -> None:
+        for frame in frames:
+            await self.ws.send_str(frame)
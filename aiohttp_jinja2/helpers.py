@@ -3,12 +3,37 @@ useful context functions, see
 http://jinja.pocoo.org/docs/dev/api/#jinja2.contextfunction
 """
 
-from typing import TypedDict
+import asyncio
+import logging
+import posixpath
+import weakref
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterable,
+    Mapping,
+    Sequence,
+    TypedDict,
+    TypeVar,
+)
 
 import jinja2
 from aiohttp import web
+from jinja2 import nodes
+from jinja2.defaults import DEFAULT_NAMESPACE
 from yarl import URL
 
+from .references import DynamicReference, walk
+
+logger = logging.getLogger("aiohttp_jinja2")
+
+_N = TypeVar("_N", bound=nodes.Node)
+
 
 class _Context(TypedDict, total=False):
     app: web.Application
@@ -16,6 +41,28 @@ class _Context(TypedDict, total=False):
 
 static_root_key = web.AppKey("static_root_key", str)
 
+# collects static() urls while a template is rendered for preload hints
+static_assets: ContextVar[list[str] | None] = ContextVar(
+    "aiohttp_jinja2_static_assets", default=None
+)
+
+_PRELOAD_TYPES = {
+    ".css": "style",
+    ".js": "script",
+    ".mjs": "script",
+    ".woff": "font",
+    ".woff2": "font",
+    ".ttf": "font",
+    ".otf": "font",
+    ".avif": "image",
+    ".gif": "image",
+    ".jpeg": "image",
+    ".jpg": "image",
+    ".png": "image",
+    ".svg": "image",
+    ".webp": "image",
+}
+
 
 @jinja2.pass_context
 def url_for(
@@ -73,7 +120,370 @@ def static_url(context: _Context, static_file_path: str) -> str:
             "app does not define a static root url, you need to set the url root "
             "with app[aiohttp_jinja2.static_root_key] = '<static root>'."
         ) from None
-    return "{}/{}".format(static_url.rstrip("/"), static_file_path.lstrip("/"))
+    url = "{}/{}".format(static_url.rstrip("/"), static_file_path.lstrip("/"))
+    assets = static_assets.get()
+    if assets is not None:
+        assets.append(url)
+    return url
+
+
+def preload_links(urls: Iterable[str]) -> str:
+    """Build a ``Link`` header value preloading static assets.
+
+    Urls of unknown asset types are skipped, fonts are requested in
+    anonymous CORS mode as browsers require.
+    """
+    links = []
+    for url in dict.fromkeys(urls):
+        ext = posixpath.splitext(url.split("?", 1)[0])[1].lower()
+        kind = _PRELOAD_TYPES.get(ext)
+        if kind is None:
+            continue
+        link = f"<{url}>; rel=preload; as={kind}"
+        if kind == "font":
+            link += "; crossorigin"
+        links.append(link)
+    return ", ".join(links)
+
+
+BatchFunction = Callable[
+    [list[Any]], Awaitable[Sequence[Any] | Mapping[Hashable, Any]]
+]
+
+class _Batches:
+    """Results and pending keys of the batch loaders called by one render."""
+
+    def __init__(self) -> None:
+        self.collecting = False
+        self.results: dict[BatchLoader, dict[Hashable, asyncio.Future[Any]]] = {}
+        self.pending: dict[BatchLoader, list[Hashable]] = {}
+        self.tasks: set[asyncio.Task[None]] = set()
+
+    async def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+        await asyncio.gather(
+            *(
+                loader._resolve(self, chunk, forget=True)
+                for loader, keys in pending.items()
+                for chunk in loader._chunks(keys)
+            )
+        )
+
+
+batches: ContextVar[_Batches | None] = ContextVar(
+    "aiohttp_jinja2_batches", default=None
+)
+
+
+class BatchLoader:
+    """Async template global loading values for many keys at once.
+
+    *load* receives a list of distinct keys and returns their values in the
+    same order, or a mapping from key to value (missing keys give
+    ``None``). During a render every key is loaded once, calls made in the
+    same event loop iteration share one *load* call of at most
+    *max_batch_size* keys.
+    """
+
+    def __init__(
+        self, load: BatchFunction, *, max_batch_size: int | None = None
+    ) -> None:
+        self.load = load
+        self.max_batch_size = max_batch_size
+
+    def __repr__(self) -> str:
+        return f"<BatchLoader {getattr(self.load, '__qualname__', self.load)!r}>"
+
+    async def __call__(self, key: Hashable) -> Any:
+        scope = batches.get()
+        if scope is None:
+            return (await self._load([key]))[0]
+        if scope.collecting and isinstance(key, jinja2.Undefined):
+            # depends on a value the collecting pass has not loaded yet
+            return key
+        results = scope.results.setdefault(self, {})
+        future = results.get(key)
+        if future is None:
+            future = results[key] = asyncio.get_running_loop().create_future()
+            keys = scope.pending.setdefault(self, [])
+            if not keys and not scope.collecting:
+                asyncio.get_running_loop().call_soon(self._dispatch, scope)
+            keys.append(key)
+        if scope.collecting and not future.done():
+            # the collecting pass only records keys, its output is dropped
+            return jinja2.ChainableUndefined(name=repr(key))
+        return await future
+
+    def _chunks(self, keys: list[Hashable]) -> Iterable[list[Hashable]]:
+        size = self.max_batch_size or len(keys)
+        return (keys[i : i + size] for i in range(0, len(keys), size))
+
+    def _dispatch(self, scope: _Batches) -> None:
+        for chunk in self._chunks(scope.pending.pop(self, [])):
+            task = asyncio.ensure_future(self._resolve(scope, chunk))
+            scope.tasks.add(task)
+            task.add_done_callback(scope.tasks.discard)
+
+    async def _load(self, keys: list[Hashable]) -> list[Any]:
+        values = await self.load(keys)
+        if isinstance(values, Mapping):
+            return [values.get(key) for key in keys]
+        if len(values) != len(keys):
+            raise ValueError(
+                f"{self!r} returned {len(values)} values for {len(keys)} keys"
+            )
+        return list(values)
+
+    async def _resolve(
+        self, scope: _Batches, keys: list[Hashable], *, forget: bool = False
+    ) -> None:
+        results = scope.results[self]
+        try:
+            values = await self._load(keys)
+        except Exception as exc:
+            for key in keys:
+                if forget:
+                    # loaded again, and the error raised, by the real render
+                    results.pop(key).cancel()
+                elif not results[key].done():
+                    results[key].set_exception(exc)
+            return
+        for key, value in zip(keys, values):
+            # a future is cancelled along with the render awaiting it
+            if not results[key].done():
+                results[key].set_result(value)
+
+
+_uses_batches: weakref.WeakKeyDictionary[jinja2.Template, bool] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def uses_batches(template: jinja2.Template) -> bool:
+    loaders: frozenset[str] | None = getattr(
+        template.environment, "aiohttp_jinja2_batched_globals", None
+    )
+    if not loaders or template.name is None:
+        return False
+    try:
+        return _uses_batches[template]
+    except KeyError:
+        pass
+    try:
+        # undeclared variables leave out globals
+        used = any(
+            not loaders.isdisjoint(node.name for node in ast.find_all(nodes.Name))
+            for _, ast in walk(template.environment, template.name)
+        )
+    except (DynamicReference, jinja2.TemplateError):
+        used = True
+    _uses_batches[template] = used
+    return used
+
+
+# builtin globals without side effects, callable while prefetching
+_PURE_GLOBALS = ("dict", "range")
+
+
+def _find_all(expr: nodes.Node, node_type: type[_N] | tuple[type[_N], ...]) -> list[_N]:
+    found = list(expr.find_all(node_type))
+    if isinstance(expr, node_type):
+        found.insert(0, expr)
+    return found
+
+
+def _called(node: nodes.Call) -> str | None:
+    return node.node.name if isinstance(node.node, nodes.Name) else None
+
+
+def _runs_code(
+    env: jinja2.Environment,
+    loaders: frozenset[str],
+    unset: set[str],
+    expr: nodes.Node,
+) -> bool:
+    # calls other than batch loader calls, async filters and tests, or names
+    # left unset by a skipped assignment, make an expression unfit to prefetch
+    for node in _find_all(expr, (nodes.Call, nodes.Filter, nodes.Test, nodes.Name)):
+        if isinstance(node, nodes.Call):
+            name = _called(node)
+            if name in loaders:
+                continue
+            if name not in _PURE_GLOBALS or (
+                env.globals.get(name) is not DEFAULT_NAMESPACE[name]
+            ):
+                return True
+        elif isinstance(node, nodes.Name):
+            if node.name in unset:
+                return True
+        elif isinstance(node, (nodes.Filter, nodes.Test)):
+            funcs = env.filters if isinstance(node, nodes.Filter) else env.tests
+            func = funcs.get(node.name)
+            if (
+                func is None
+                or asyncio.iscoroutinefunction(func)
+                or getattr(func, "jinja_async_variant", False)
+            ):
+                return True
+    return False
+
+
+def _loader_calls(loaders: frozenset[str], expr: nodes.Node) -> list[nodes.Node]:
+    return [
+        nodes.Output([call], lineno=call.lineno)
+        for call in _find_all(expr, nodes.Call)
+        if _called(call) in loaders
+    ]
+
+
+def _target_names(target: nodes.Node) -> set[str]:
+    if isinstance(target, nodes.Name):
+        return {target.name}
+    return {name.name for name in target.find_all(nodes.Name)}
+
+
+def _prefetch_body(
+    env: jinja2.Environment,
+    loaders: frozenset[str],
+    unset: set[str],
+    body: list[nodes.Node],
+) -> list[nodes.Node]:
+    kept: list[nodes.Node] = []
+
+    def runs_code(expr: nodes.Node | None) -> bool:
+        return expr is not None and _runs_code(env, loaders, unset, expr)
+
+    def nested(body: list[nodes.Node]) -> list[nodes.Node]:
+        return _prefetch_body(env, loaders, set(unset), body)
+
+    for node in body:
+        if isinstance(node, nodes.Output):
+            for expr in node.nodes:
+                if not isinstance(expr, nodes.TemplateData) and not runs_code(expr):
+                    kept.extend(_loader_calls(loaders, expr))
+        elif isinstance(node, (nodes.Assign, nodes.AssignBlock)):
+            names = _target_names(node.target)
+            if isinstance(node, nodes.Assign) and not runs_code(node.node):
+                kept.extend(_loader_calls(loaders, node.node))
+                kept.append(node)
+                unset.difference_update(names)
+            else:
+                unset.update(names)
+        elif isinstance(node, nodes.For):
+            if runs_code(node.iter) or runs_code(node.test):
+                continue
+            loop = nested(node.body)
+            if loop:
+                kept.extend(_loader_calls(loaders, node.iter))
+                kept.append(
+                    nodes.For(
+                        node.target,
+                        node.iter,
+                        loop,
+                        [],
+                        node.test,
+                        False,
+                        lineno=node.lineno,
+                    )
+                )
+        elif isinstance(node, nodes.If):
+            branches = [node, *node.elif_]
+            if any(runs_code(branch.test) for branch in branches):
+                continue
+            bodies = [nested(branch.body) for branch in branches]
+            else_ = nested(node.else_)
+            if any(bodies) or else_:
+                for branch in branches:
+                    kept.extend(_loader_calls(loaders, branch.test))
+                elif_ = [
+                    nodes.If(branch.test, branch_body, [], [], lineno=branch.lineno)
+                    for branch, branch_body in zip(node.elif_, bodies[1:])
+                ]
+                kept.append(
+                    nodes.If(node.test, bodies[0], elif_, else_, lineno=node.lineno)
+                )
+        elif isinstance(node, (nodes.Block, nodes.Scope)):
+            kept.extend(nested(node.body))
+    return kept
+
+
+_prefetchers: weakref.WeakKeyDictionary[jinja2.Template, jinja2.Template | None] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _prefetcher(template: jinja2.Template) -> jinja2.Template | None:
+    """Compile the batch loader calls of *template* reachable without running
+    other template code.
+
+    Loops, conditions and assignments leading to the calls are kept when
+    their expressions call nothing else, macros, call blocks and everything
+    depending on other calls are left to the real render.
+    """
+    try:
+        return _prefetchers[template]
+    except KeyError:
+        pass
+    env = template.environment
+    loaders: frozenset[str] = getattr(
+        env, "aiohttp_jinja2_batched_globals", frozenset()
+    )
+    body = []
+    try:
+        for _, ast in walk(env, template.name or "", skip_dynamic=True):
+            body.extend(_prefetch_body(env, loaders, set(), ast.body))
+    except jinja2.TemplateError:
+        body = []
+    prefetcher = None
+    if body:
+        prefetch_ast = nodes.Template(body, lineno=1)
+        prefetch_ast.set_environment(env)
+        code = env.compile(prefetch_ast, template.name)
+        prefetcher = env.template_class.from_code(env, code, template.globals)
+    _prefetchers[template] = prefetcher
+    return prefetcher
+
+
+@asynccontextmanager
+async def batched(
+    template: jinja2.Template, context: Mapping[str, object]
+) -> AsyncIterator[None]:
+    """Prefetch the batch loader calls of rendering *template*.
+
+    The batch loader calls reachable without running other template code
+    are rendered first with the loaders only recording their keys and
+    returning undefined values, then the keys are loaded in one batch per
+    loader, before the real render within the block finds them memoized.
+    Keys computed from loaded values, like ``user(post(id).author)``, or
+    behind other calls are loaded by the real render as it reaches them.
+    The recording render stops at the first error, the real render raises
+    it if it is not caused by the undefined values.
+    """
+    prefetcher = _prefetcher(template) if uses_batches(template) else None
+    if prefetcher is None or any(
+        # consumed by the first render, lazily iterated rows stay unbatched
+        hasattr(value, "__anext__")
+        for value in context.values()
+    ):
+        yield
+        return
+    scope = _Batches()
+    token = batches.set(scope)
+    try:
+        scope.collecting = True
+        try:
+            await prefetcher.render_async(context)
+        except Exception:
+            logger.debug(
+                "Batch key collection for %r stopped early",
+                template.name,
+                exc_info=True,
+            )
+        scope.collecting = False
+        await scope.flush()
+        yield
+    finally:
+        batches.reset(token)
 
 
 GLOBAL_HELPERS = dict(
@@ -0,0 +1,204 @@
+"""Per-locale template variants with constant strings translated at compile time."""
+
+import re
+from collections import ChainMap
+from gettext import NullTranslations
+from typing import Callable, Iterator, Mapping
+
+import jinja2
+from aiohttp import hdrs, web
+from jinja2.ext import Extension, InternationalizationExtension
+from jinja2.lexer import Token, TokenStream
+
+from .cache import TemplateCache
+
+LocaleSelector = Callable[[web.Request], "str | None"]
+
+# same as jinja2.ext, used by {% trans trimmed %}
+_TRIM = re.compile(r"\s*\n\s*")
+_GETTEXT_NAMES = frozenset(("_", "gettext"))
+_EOF = Token(0, "eof", "")
+
+
+def _types(tokens: list[Token], pos: int, count: int) -> list[str]:
+    return [token.type for token in tokens[pos : pos + count]]
+
+
+def _at(tokens: list[Token], pos: int) -> Token:
+    return tokens[pos] if pos < len(tokens) else _EOF
+
+
+class StaticTranslationsExtension(Extension):
+    """Replace translatable constant strings by their translation.
+
+    Works together with :class:`jinja2.ext.i18n` on environments carrying a
+    translations object in the ``aiohttp_jinja2_translations`` attribute.
+    ``{% trans %}`` blocks without variables, plural forms or context and,
+    with old-style gettext, ``_("...")`` and ``gettext("...")`` calls are
+    looked up once when the template is compiled. Everything else is left
+    to the i18n extension and translated at render time.
+    """
+
+    def filter_stream(self, stream: TokenStream) -> Iterator[Token]:
+        translations: NullTranslations | None = getattr(
+            self.environment, "aiohttp_jinja2_translations", None
+        )
+        if translations is None:
+            yield from stream
+            return
+        tokens = list(stream)
+        pos = 0
+        while pos < len(tokens):
+            token = tokens[pos]
+            if token.type == "block_begin":
+                baked = self._trans_block(tokens, pos, translations)
+                if baked is not None:
+                    text, pos = baked
+                    if text:
+                        yield Token(token.lineno, "data", text)
+                    continue
+            elif (
+                token.type == "name"
+                and token.value in _GETTEXT_NAMES
+                and not self.environment.newstyle_gettext  # type: ignore[attr-defined]
+                and (pos == 0 or tokens[pos - 1].type != "dot")
+                and _types(tokens, pos + 1, 3) == ["lparen", "string", "rparen"]
+            ):
+                text = translations.gettext(tokens[pos + 2].value)
+                yield Token(token.lineno, "string", text)
+                pos += 4
+                continue
+            yield token
+            pos += 1
+
+    def _trans_block(
+        self, tokens: list[Token], pos: int, translations: NullTranslations
+    ) -> tuple[str, int] | None:
+        """Translate a constant ``{% trans %}`` block starting at *pos*.
+
+        Return the translated text and the position after the block.
+        """
+        if not _at(tokens, pos + 1).test("name:trans"):
+            return None
+        pos += 2
+        trimmed = self.environment.policies["ext.i18n.trimmed"]
+        if _at(tokens, pos).test_any("name:trimmed", "name:notrimmed"):
+            trimmed = tokens[pos].value == "trimmed"
+            pos += 1
+        if _at(tokens, pos).type != "block_end":
+            return None
+        pos += 1
+        parts = []
+        while _at(tokens, pos).type == "data":
+            parts.append(tokens[pos].value)
+            pos += 1
+        if _types(tokens, pos, 3) != ["block_begin", "name", "block_end"]:
+            return None
+        if not tokens[pos + 1].test("name:endtrans"):
+            return None
+        singular = "".join(parts)
+        if trimmed:
+            singular = _TRIM.sub(" ", singular.strip())
+        if not self.environment.newstyle_gettext:  # type: ignore[attr-defined]
+            return translations.gettext(singular), pos + 3
+        # new-style gettext formats the translation even without variables
+        try:
+            text = translations.gettext(singular.replace("%", "%%")) % {}
+        except (TypeError, ValueError):
+            return None
+        return text, pos + 3
+
+
+class LocaleVariants:
+    """Linked environments compiling templates for one locale each."""
+
+    def __init__(
+        self,
+        env: jinja2.Environment,
+        translations: Mapping[str, NullTranslations],
+        selector: LocaleSelector | None,
+    ) -> None:
+        self._env = env
+        self.selector = selector or self.accept_language
+        self.envs: dict[str, jinja2.Environment] = {}
+        newstyle = env.newstyle_gettext  # type: ignore[attr-defined]
+        for locale, catalog in translations.items():
+            # bytecode is keyed by source only and must not be shared
+            locale_env = env.overlay(bytecode_cache=None)
+            if isinstance(env.cache, TemplateCache):
+                # the locales share the memory budget
+                locale_env.cache = env.cache.view(f"locale:{locale}")
+            # globals of the environment stay visible, gettext callables of
+            # the locale shadow them
+            locale_env.globals = ChainMap({}, env.globals)  # type: ignore[assignment]
+            # install_gettext_translations() of the overlay is still bound to
+            # the extension of *env*, install through the linked one instead
+            i18n = locale_env.extensions[InternationalizationExtension.identifier]
+            i18n._install(catalog, newstyle=newstyle)  # type: ignore[attr-defined]
+            locale_env.extend(aiohttp_jinja2_translations=catalog)
+            self.envs[locale] = locale_env
+
+    def accept_language(self, request: web.Request) -> str | None:
+        """Pick the locale best matching the ``Accept-Language`` header."""
+        header = request.headers.get(hdrs.ACCEPT_LANGUAGE)
+        if not header:
+            return None
+        ranges = []
+        for item in header.split(","):
+            tag, _, params = item.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    continue
+            if tag and quality > 0:
+                ranges.append((quality, tag.strip().replace("-", "_").lower()))
+        # stable sort keeps the header order among equal qualities
+        ranges.sort(key=lambda item: -item[0])
+        locales = {locale.lower(): locale for locale in self.envs}
+        for _, tag in ranges:
+            if tag in locales:
+                return locales[tag]
+            primary = tag.partition("_")[0]
+            if primary in locales:
+                return locales[primary]
+        return None
+
+    def select(self, request: web.Request) -> jinja2.Environment:
+        locale = self.selector(request)
+        if locale is None:
+            return self._env
+        return self.envs.get(locale, self._env)
+
+
+def setup_locales(
+    env: jinja2.Environment,
+    translations: Mapping[str, NullTranslations],
+    selector: LocaleSelector | None,
+) -> LocaleVariants:
+    if "gettext" not in env.globals:
+        env.install_null_translations()  # type: ignore[attr-defined]
+    variants = LocaleVariants(env, translations, selector)
+    env.extend(aiohttp_jinja2_locales=variants)
+    return variants
+
+
+def locale_env(env: jinja2.Environment, request: web.Request) -> jinja2.Environment:
+    """Return the environment compiling templates for the request locale."""
+    variants: LocaleVariants | None = getattr(env, "aiohttp_jinja2_locales", None)
+    if variants is None:
+        return env
+    return variants.select(request)
+
+
+def varies_by_language(env: jinja2.Environment) -> bool:
+    """Whether the locale of requests is picked from ``Accept-Language``."""
+    variants: LocaleVariants | None = getattr(env, "aiohttp_jinja2_locales", None)
+    return variants is not None and variants.selector == variants.accept_language
+
+
+def locale_envs(env: jinja2.Environment) -> list[jinja2.Environment]:
+    """Return the linked per-locale environments of *env*."""
+    variants: LocaleVariants | None = getattr(env, "aiohttp_jinja2_locales", None)
+    return [] if variants is None else list(variants.envs.values())
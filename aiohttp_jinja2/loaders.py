@@ -0,0 +1,226 @@
+"""Template loaders wrapping or extending the :mod:`jinja2` ones."""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, MutableMapping, Sequence
+
+import jinja2
+from jinja2.loaders import split_template_path
+
+
+class NegativeCacheLoader(jinja2.BaseLoader):
+    """Remember template names the wrapped *loader* could not find.
+
+    A miss is normally never cached by :mod:`jinja2`, so every lookup of a
+    missing name (fallbacks of :meth:`jinja2.Environment.select_template`,
+    requests for unknown pages) searches all loader paths again. Here the
+    :exc:`jinja2.TemplateNotFound` is raised straight away for *ttl* seconds;
+    at most *maxsize* names are remembered, the oldest are forgotten first.
+
+    Environments with ``auto_reload`` look every name up, as templates may
+    be added at any time. The names are forgotten when the wrapped loader
+    reports a new ``version``, like :class:`IndexedFileSystemLoader` does
+    after rebuilding its index.
+    """
+
+    def __init__(
+        self, loader: jinja2.BaseLoader, *, ttl: float = 60.0, maxsize: int = 1024
+    ) -> None:
+        self.loader = loader
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.has_source_access = loader.has_source_access
+        self._misses: OrderedDict[str, float] = OrderedDict()
+        self._version = getattr(loader, "version", None)
+
+    def _check(self, name: str) -> None:
+        version = getattr(self.loader, "version", None)
+        if version != self._version:
+            self._version = version
+            self._misses.clear()
+        expires = self._misses.get(name)
+        if expires is None:
+            return
+        if expires > time.monotonic():
+            raise jinja2.TemplateNotFound(name)
+        self._misses.pop(name, None)
+
+    def _remember(self, name: str) -> None:
+        self._misses[name] = time.monotonic() + self.ttl
+        while len(self._misses) > self.maxsize:
+            self._misses.popitem(last=False)
+
+    def get_source(
+        self, environment: jinja2.Environment, template: str
+    ) -> tuple[str, str | None, Callable[[], bool] | None]:
+        if environment.auto_reload:
+            return self.loader.get_source(environment, template)
+        self._check(template)
+        try:
+            return self.loader.get_source(environment, template)
+        except jinja2.TemplateNotFound:
+            self._remember(template)
+            raise
+
+    def load(
+        self,
+        environment: jinja2.Environment,
+        name: str,
+        globals: MutableMapping[str, Any] | None = None,
+    ) -> jinja2.Template:
+        if environment.auto_reload:
+            return self.loader.load(environment, name, globals)
+        self._check(name)
+        try:
+            return self.loader.load(environment, name, globals)
+        except jinja2.TemplateNotFound as e:
+            # a missing template included by *name* is remembered by its
+            # own lookup
+            if e.name == name:
+                self._remember(name)
+            raise
+
+    def list_templates(self) -> list[str]:
+        return self.loader.list_templates()
+
+    def clear(self) -> None:
+        """Forget all remembered misses."""
+        self._misses.clear()
+
+
+def _walk(
+    searchpath: str, followlinks: bool
+) -> tuple[dict[str, str], dict[str, float]]:
+    names: dict[str, str] = {}
+    directories: dict[str, float] = {}
+    for dirpath, _, filenames in os.walk(searchpath, followlinks=followlinks):
+        try:
+            directories[dirpath] = os.stat(dirpath).st_mtime
+        except OSError:
+            continue
+        prefix = os.path.relpath(dirpath, searchpath).replace(os.path.sep, "/")
+        for filename in filenames:
+            name = filename if prefix == "." else f"{prefix}/{filename}"
+            names[name] = os.path.join(dirpath, filename)
+    return names, directories
+
+
+class IndexedFileSystemLoader(jinja2.FileSystemLoader):
+    """:class:`jinja2.FileSystemLoader` resolving names through an index.
+
+    All search paths are walked once, in parallel, and every template name
+    is mapped to the file found in the first search path containing it, so
+    a lookup costs a dictionary access instead of a probe per search path.
+
+    Adding or removing a file changes the modification time of its
+    directory; once *refresh_interval* seconds passed, a lookup starts a
+    thread comparing those and rebuilding the index when one differs, and
+    is served by the current index meanwhile. ``None`` disables the checks,
+    :meth:`refresh` rebuilds the index explicitly. *version* counts the
+    rebuilds.
+    """
+
+    def __init__(
+        self,
+        searchpath: str | os.PathLike[str] | Sequence[str | os.PathLike[str]],
+        encoding: str = "utf-8",
+        followlinks: bool = False,
+        *,
+        refresh_interval: float | None = 2.0,
+    ) -> None:
+        super().__init__(searchpath, encoding, followlinks)
+        self.refresh_interval = refresh_interval
+        # held by the background check while it runs
+        self._checking = threading.Lock()
+        self._index: dict[str, str] = {}
+        self._directories: dict[str, float] = {}
+        self._next_check = 0.0
+        self.version = 0
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Walk the search paths again and replace the index."""
+        paths = self.searchpath
+        with ThreadPoolExecutor(max_workers=min(len(paths), 8) or 1) as executor:
+            results = list(
+                executor.map(_walk, paths, [self.followlinks] * len(paths))
+            )
+        index: dict[str, str] = {}
+        directories: dict[str, float] = {}
+        # earlier search paths take precedence
+        for names, dirs in reversed(results):
+            index.update(names)
+            directories.update(dirs)
+        self._index, self._directories = index, directories
+        self.version += 1
+        self._schedule_check()
+
+    def _schedule_check(self) -> None:
+        if self.refresh_interval is not None:
+            self._next_check = time.monotonic() + self.refresh_interval
+
+    def _is_stale(self) -> bool:
+        for dirpath, mtime in self._directories.items():
+            try:
+                if os.stat(dirpath).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def _check(self, force: bool) -> None:
+        try:
+            if force or self._is_stale():
+                self.refresh()
+        finally:
+            self._checking.release()
+
+    def _check_in_background(self, force: bool = False) -> None:
+        if not self._checking.acquire(blocking=False):
+            return
+        self._schedule_check()
+        threading.Thread(
+            target=self._check,
+            args=(force,),
+            name="aiohttp_jinja2-template-index",
+            daemon=True,
+        ).start()
+
+    def _maybe_refresh(self) -> None:
+        if self.refresh_interval is None or time.monotonic() < self._next_check:
+            return
+        self._check_in_background()
+
+    def get_source(
+        self, environment: jinja2.Environment, template: str
+    ) -> tuple[str, str, Callable[[], bool]]:
+        self._maybe_refresh()
+        name = "/".join(split_template_path(template))
+        filename = self._index.get(name)
+        if filename is None:
+            raise jinja2.TemplateNotFound(template)
+        try:
+            with open(filename, encoding=self.encoding) as f:
+                contents = f.read()
+            mtime = os.path.getmtime(filename)
+        except FileNotFoundError:
+            # removed since the index was built, probe the search paths as
+            # the plain loader does, an overridden file of a later one may
+            # be exposed
+            self._check_in_background(force=True)
+            return super().get_source(environment, template)
+
+        def uptodate() -> bool:
+            try:
+                return os.path.getmtime(filename) == mtime
+            except OSError:
+                return False
+
+        return contents, os.path.normpath(filename), uptodate
+
+    def list_templates(self) -> list[str]:
+        self._maybe_refresh()
+        return sorted(self._index)
@@ -0,0 +1,143 @@
+"""Storage and serving of pages rendered once for all requests."""
+
+import asyncio
+import gzip
+import hashlib
+import weakref
+from pathlib import Path
+from typing import Sequence
+
+import jinja2
+from aiohttp import hdrs, web
+
+from .references import dependencies
+
+
+class Page:
+    """Encoded output of a template with its validators and variants."""
+
+    def __init__(
+        self,
+        templates: list[jinja2.Template],
+        body: bytes,
+        content_type: str,
+        charset: str,
+        status: int,
+    ) -> None:
+        # weak references, a template dropped from the cache is reloaded
+        # and the page rendered again
+        self._templates = [weakref.ref(template) for template in templates]
+        self.body = body
+        self.gzipped = gzip.compress(body, 9)
+        self.etag = hashlib.sha1(body).hexdigest()  # noqa: S324
+        # validators differ between representations
+        self.gzip_etag = f"{self.etag}-gzip"
+        self.content_type = content_type
+        self.charset = charset
+        self.status = status
+        self.path: Path | None = None
+
+    @property
+    def is_up_to_date(self) -> bool:
+        for ref in self._templates:
+            template = ref()
+            if template is None or not template.is_up_to_date:
+                return False
+        return True
+
+    def write(self, directory: Path) -> None:
+        """Store the page and its gzip variant for sendfile serving."""
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{self.etag}.html"
+        path.write_bytes(self.body)
+        path.with_name(path.name + ".gz").write_bytes(self.gzipped)
+        self.path = path
+
+    def remove(self) -> None:
+        """Delete the files stored by :meth:`write`."""
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+            self.path.with_name(self.path.name + ".gz").unlink(missing_ok=True)
+
+    def _headers(self, response: web.StreamResponse, vary: Sequence[str]) -> None:
+        response.content_type = self.content_type
+        response.charset = self.charset
+        response.headers[hdrs.VARY] = hdrs.ACCEPT_ENCODING
+        for header in vary:
+            response.headers.add(hdrs.VARY, header)
+
+    def response(
+        self, request: web.Request, vary: Sequence[str] = ()
+    ) -> web.StreamResponse:
+        gzipped = "gzip" in request.headers.get(hdrs.ACCEPT_ENCODING, "").lower()
+        if self.path is not None:
+            # FileResponse handles validators and sendfile; the gzip variant
+            # is picked here, FileResponse would replace the Vary header
+            path = self.path
+            if gzipped:
+                path = path.with_name(path.name + ".gz")
+            file_response = web.FileResponse(path, status=self.status)
+            self._headers(file_response, vary)
+            if gzipped:
+                file_response.headers[hdrs.CONTENT_ENCODING] = "gzip"
+            return file_response
+        response = web.Response(status=self.status)
+        etag = self.gzip_etag if gzipped else self.etag
+        response.etag = etag
+        self._headers(response, vary)
+        if request.if_none_match and any(
+            value.value in (etag, "*") for value in request.if_none_match
+        ):
+            response.set_status(304)
+            return response
+        if gzipped:
+            response.headers[hdrs.CONTENT_ENCODING] = "gzip"
+            response.body = self.gzipped
+        else:
+            response.body = self.body
+        return response
+
+
+class Pages:
+    """Pages of one ``@template(prerender=True)`` handler per environment."""
+
+    def __init__(self, directory: str | Path | None) -> None:
+        self._directory = None if directory is None else Path(directory)
+        self._pages: weakref.WeakKeyDictionary[jinja2.Environment, Page] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def get(self, env: jinja2.Environment) -> Page | None:
+        page = self._pages.get(env)
+        if page is not None and env.auto_reload and not page.is_up_to_date:
+            # kept until replaced, store() removes its files
+            return None
+        return page
+
+    async def store(
+        self,
+        env: jinja2.Environment,
+        template_name: str,
+        text: str,
+        encoding: str,
+        status: int,
+    ) -> Page:
+        page = Page(
+            dependencies(env, template_name),
+            text.encode(encoding),
+            "text/html",
+            encoding,
+            status,
+        )
+        if self._directory is None:
+            self._pages[env] = page
+            return page
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, page.write, self._directory)
+        old = self._pages.get(env)
+        self._pages[env] = page
+        # the files of the replaced page may be the same, or serve the page
+        # of another locale
+        if old is not None and old.path not in {p.path for p in self._pages.values()}:
+            await loop.run_in_executor(None, old.remove)
+        return page
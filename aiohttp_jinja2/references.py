@@ -0,0 +1,50 @@
+"""Templates a template pulls in through extends, include and import."""
+
+from typing import Iterator
+
+import jinja2
+from jinja2 import meta, nodes
+
+
+class DynamicReference(Exception):
+    """A template is referenced by a name computed at render time."""
+
+
+def walk(
+    env: jinja2.Environment, name: str, *, skip_dynamic: bool = False
+) -> Iterator[tuple[str, nodes.Template]]:
+    """Yield the name and syntax tree of *name* and the templates it reaches.
+
+    Templates extended, included or imported directly or through others
+    are yielded once each. References computed at render time raise
+    :exc:`DynamicReference`, or are left out with *skip_dynamic*.
+    """
+    if env.loader is None:
+        raise TypeError("no loader for this environment specified")
+    seen = set()
+    pending = [name]
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        source = env.loader.get_source(env, current)[0]
+        ast = env.parse(source, current)
+        yield current, ast
+        for ref in meta.find_referenced_templates(ast):
+            if ref is not None:
+                pending.append(ref)
+            elif not skip_dynamic:
+                raise DynamicReference(current)
+
+
+def dependencies(env: jinja2.Environment, name: str) -> list[jinja2.Template]:
+    """Return the loaded templates *name* reaches, itself first.
+
+    Templates referenced by names computed at render time cannot be tracked
+    and are left out.
+    """
+    return [
+        env.get_template(current)
+        for current, _ in walk(env, name, skip_dynamic=True)
+    ]
@@ -0,0 +1,242 @@
+"""Cached page shells with per-request ``{% dynamic %}`` holes."""
+
+import re
+import secrets
+import weakref
+from contextvars import ContextVar
+from typing import Any, Callable, Hashable, Mapping
+
+import jinja2
+from jinja2 import meta, nodes
+from jinja2.ext import Extension
+from jinja2.parser import Parser
+from jinja2.utils import LRUCache
+from markupsafe import Markup
+
+from .references import dependencies, walk
+
+
+class _Holes:
+    """Sources of the holes met while a shell is rendered.
+
+    Dynamic blocks output markers with a random nonce in their place, page
+    content cannot forge or guess them.
+    """
+
+    def __init__(self) -> None:
+        self.nonce = secrets.token_hex(16)
+        self.sources: list[str] = []
+
+    def add(self, source: str) -> str:
+        self.sources.append(source)
+        return f"\x00{self.nonce}:{len(self.sources) - 1}\x00"
+
+    def split(self, text: str) -> list[str]:
+        return re.split(f"\x00{self.nonce}:([0-9]+)\x00", text)
+
+
+_shell_holes: ContextVar[_Holes | None] = ContextVar(
+    "aiohttp_jinja2_shell_holes", default=None
+)
+
+# names the code generator provides, never part of the request context
+_IMPLICIT_NAMES = frozenset(("caller", "kwargs", "loop", "self", "super", "varargs"))
+
+
+def _literal(text: str) -> str:
+    # letters, digits and escapes only, no delimiter can end the tag early
+    chars = (c if c.isascii() and c.isalnum() else f"\\U{ord(c):08x}" for c in text)
+    return f'"{"".join(chars)}"'
+
+
+class DynamicExtension(Extension):
+    """``{% dynamic %}...{% enddynamic %}`` marks a per-request hole.
+
+    Outside of shell rendering the block renders in place like any other
+    template code. For a shell it outputs a marker instead, the body is
+    compiled as a template of its own and rendered for each request with
+    the request context.
+    """
+
+    tags = {"dynamic"}
+
+    def preprocess(
+        self, source: str, name: str | None, filename: str | None = None
+    ) -> str:
+        start = re.escape(self.environment.block_start_string)
+        end = re.escape(self.environment.block_end_string)
+        pattern = re.compile(
+            rf"({start}[-+]?\s*dynamic)(\s*[-+]?{end})(.*?)"
+            rf"({start}[-+]?\s*enddynamic\s*[-+]?{end})",
+            re.DOTALL,
+        )
+
+        def embed(match: re.Match[str]) -> str:
+            # the compiled template keeps the source of the hole
+            opening, closing, body, end_tag = match.groups()
+            return f"{opening} {_literal(body)}{closing}{body}{end_tag}"
+
+        return pattern.sub(embed, source)
+
+    def parse(self, parser: Parser) -> nodes.Node:
+        lineno = next(parser.stream).lineno
+        source = parser.parse_expression()
+        body = parser.parse_statements(("name:enddynamic",), drop_needle=True)
+        call = self.call_method("_hole", [source])
+        return nodes.CallBlock(call, [], [], body).set_lineno(lineno)
+
+    def _hole(self, source: str, caller: Callable[[], Any]) -> Any:
+        holes = _shell_holes.get()
+        if holes is None:
+            return caller()
+        return Markup(holes.add(source))
+
+
+def _extension(env: jinja2.Environment) -> DynamicExtension:
+    ext = env.extensions.get(DynamicExtension.identifier)
+    if not isinstance(ext, DynamicExtension):
+        raise RuntimeError(
+            "Page shells need aiohttp_jinja2.DynamicExtension in the extensions "
+            "of the environment"
+        )
+    return ext
+
+
+def _check_holes(env: jinja2.Environment, name: str, ast: nodes.Template) -> None:
+    """Reject holes reading names the template binds, e.g. loop variables.
+
+    Holes are rendered with the request context alone, they would not see
+    the values a full render gives these names.
+    """
+    bound = set(_IMPLICIT_NAMES)
+    bound.update(
+        node.name for node in ast.find_all(nodes.Name) if node.ctx in ("store", "param")
+    )
+    bound.update(node.name for node in ast.find_all(nodes.Macro))
+    bound.update(node.target for node in ast.find_all(nodes.Import))
+    for from_import in ast.find_all(nodes.FromImport):
+        for item in from_import.names:
+            bound.add(item[1] if isinstance(item, tuple) else item)
+    for block in ast.find_all(nodes.CallBlock):
+        func = block.call.node
+        if not (
+            isinstance(func, nodes.ExtensionAttribute)
+            and func.identifier == DynamicExtension.identifier
+        ):
+            continue
+        body = nodes.Template(block.body, lineno=block.lineno)
+        body.set_environment(env)
+        used = sorted(bound & meta.find_undeclared_variables(body))
+        if used:
+            raise jinja2.TemplateSyntaxError(
+                f"{{% dynamic %}} block uses {', '.join(map(repr, used))}, "
+                "holes are rendered with the request context only",
+                block.lineno,
+                name,
+            )
+
+
+class Shell:
+    """Encoded static parts of a page around its holes."""
+
+    def __init__(
+        self, template: jinja2.Template, text: str, holes: _Holes, encoding: str
+    ) -> None:
+        env = template.environment
+        parts = holes.split(text)
+        self.segments = [part.encode(encoding) for part in parts[::2]]
+        self.holes = [
+            env.from_string(holes.sources[int(hole)]) for hole in parts[1::2]
+        ]
+        self.encoding = encoding
+        self._templates = []
+        if template.name is not None:
+            self._templates = [
+                weakref.ref(dependency)
+                for dependency in dependencies(env, template.name)
+            ]
+
+    @property
+    def is_up_to_date(self) -> bool:
+        for ref in self._templates:
+            template = ref()
+            if template is None or not template.is_up_to_date:
+                return False
+        return True
+
+    def join(self, rendered: list[str]) -> bytes:
+        body = [self.segments[0]]
+        for text, segment in zip(rendered, self.segments[1:]):
+            body.append(text.encode(self.encoding))
+            body.append(segment)
+        return b"".join(body)
+
+    def render(self, context: Mapping[str, Any]) -> bytes:
+        return self.join([hole.render(context) for hole in self.holes])
+
+    async def render_async(self, context: Mapping[str, Any]) -> bytes:
+        return self.join([await hole.render_async(context) for hole in self.holes])
+
+
+class Shells:
+    """Shells of one ``@template(shell_key=...)`` handler."""
+
+    def __init__(self, capacity: int = 128) -> None:
+        self._shells = LRUCache(capacity)
+        self._checked: weakref.WeakSet[jinja2.Template] = weakref.WeakSet()
+
+    def _get(self, template: jinja2.Template, key: Hashable) -> Shell | None:
+        _extension(template.environment)
+        if template not in self._checked:
+            env = template.environment
+            if template.name is not None and env.loader is not None:
+                for name, ast in walk(env, template.name, skip_dynamic=True):
+                    _check_holes(env, name, ast)
+            self._checked.add(template)
+        shell: Shell | None = self._shells.get((template, key))
+        if (
+            shell is not None
+            and template.environment.auto_reload
+            and not shell.is_up_to_date
+        ):
+            del self._shells[(template, key)]
+            return None
+        return shell
+
+    def render(
+        self,
+        template: jinja2.Template,
+        key: Hashable,
+        context: Mapping[str, Any],
+        encoding: str,
+    ) -> bytes:
+        shell = self._get(template, key)
+        if shell is None:
+            holes = _Holes()
+            token = _shell_holes.set(holes)
+            try:
+                text = template.render(context)
+            finally:
+                _shell_holes.reset(token)
+            shell = Shell(template, text, holes, encoding)
+            self._shells[(template, key)] = shell
+        return shell.render(context)
+
+    async def render_async(
+        self,
+        template: jinja2.Template,
+        key: Hashable,
+        context: Mapping[str, Any],
+        encoding: str,
+    ) -> bytes:
+        shell = self._get(template, key)
+        if shell is None:
+            holes = _Holes()
+            token = _shell_holes.set(holes)
+            try:
+                text = await template.render_async(context)
+            finally:
+                _shell_holes.reset(token)
+            shell = Shell(template, text, holes, encoding)
+            self._shells[(template, key)] = shell
+        return await shell.render_async(context)
@@ -0,0 +1,41 @@
+"""Sharing of one in-flight render between identical concurrent requests."""
+
+import asyncio
+from typing import Awaitable, Callable, Hashable
+
+
+class _Flight:
+    def __init__(self, task: "asyncio.Future[str]") -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class Flights:
+    """Renders in progress, by key."""
+
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def join(self, key: Hashable, render: Callable[[], Awaitable[str]]) -> str:
+        """Return the result of the render running for *key*, or start it."""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.ensure_future(render()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        flight.waiters += 1
+        try:
+            # a cancelled waiter must not cancel the render of the others
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.task.done():
+                # nobody is left waiting; later requests start afresh
+                self._forget(key, flight)
+                flight.task.cancel()
@@ -0,0 +1,92 @@
+"""Report of context keys which templates never read."""
+
+import weakref
+from collections import Counter
+from typing import Any, Mapping, NamedTuple
+
+import jinja2
+from aiohttp import web
+from jinja2 import meta
+
+from .references import DynamicReference, walk
+
+
+class ContextUsage(NamedTuple):
+    template: str
+    renders: int
+    # unused key -> number of renders it was passed to
+    unused: dict[str, int]
+
+
+def referenced_names(env: jinja2.Environment, name: str) -> frozenset[str] | None:
+    """Variables read by the template *name* and the templates it pulls in.
+
+    Return ``None`` when a template reference is computed at render time,
+    which leaves the variables it reads unknown.
+    """
+    if env.loader is None:
+        return None
+    names: set[str] = set()
+    try:
+        for _, ast in walk(env, name):
+            names.update(meta.find_undeclared_variables(ast))
+    except DynamicReference:
+        return None
+    return frozenset(names)
+
+
+class _Usage:
+    def __init__(self) -> None:
+        self.renders = 0
+        self.unused: Counter[str] = Counter()
+
+
+class ContextUsageTracker:
+    """Count the context keys passed to renders but never read by the template.
+
+    The variables of a template, including the ones it extends, includes
+    and imports, are found once from its source. Templates reaching others
+    through names computed at render time are not tracked.
+    """
+
+    def __init__(self) -> None:
+        self._names: weakref.WeakKeyDictionary[
+            jinja2.Template, frozenset[str] | None
+        ] = weakref.WeakKeyDictionary()
+        self._usage: dict[str, _Usage] = {}
+
+    def _referenced(self, template: jinja2.Template) -> frozenset[str] | None:
+        try:
+            return self._names[template]
+        except KeyError:
+            pass
+        names = None
+        if template.name is not None:
+            names = referenced_names(template.environment, template.name)
+        self._names[template] = names
+        return names
+
+    def record(self, template: jinja2.Template, context: Mapping[str, Any]) -> None:
+        names = self._referenced(template)
+        if names is None or template.name is None:
+            return
+        usage = self._usage.get(template.name)
+        if usage is None:
+            usage = self._usage[template.name] = _Usage()
+        usage.renders += 1
+        usage.unused.update(key for key in context if key not in names)
+
+    def report(self) -> list[ContextUsage]:
+        """Return the usage of the tracked templates, by name."""
+        return [
+            ContextUsage(name, usage.renders, dict(usage.unused.most_common()))
+            for name, usage in sorted(self._usage.items())
+        ]
+
+    def clear(self) -> None:
+        self._usage.clear()
+
+    async def handler(self, request: web.Request) -> web.Response:
+        """Debug view listing the report as JSON."""
+        data: list[dict[str, Any]] = [usage._asdict() for usage in self.report()]
+        return web.json_response(data)
@@ -0,0 +1,90 @@
+"""Ahead-of-time template compilation.
+
+Templates are compiled lazily by :meth:`jinja2.Environment.get_template`,
+so the first requests after a deploy pay the compile cost. The helpers
+here load every template (or a glob subset) up front and report how long
+each one took to compile.
+"""
+
+import asyncio
+import fnmatch
+import logging
+import time
+from concurrent.futures import Executor
+from typing import Iterator, Sequence
+
+import jinja2
+
+from . import fastpath
+
+logger = logging.getLogger("aiohttp_jinja2")
+
+
+def _select_templates(
+    env: jinja2.Environment, patterns: Sequence[str] | None
+) -> list[str]:
+    names = env.list_templates()
+    if not patterns:
+        return names
+    return [
+        name for name in names if any(fnmatch.fnmatch(name, p) for p in patterns)
+    ]
+
+
+def _compile(env: jinja2.Environment, name: str) -> float:
+    start = time.perf_counter()
+    fastpath.prepare(env.get_template(name))
+    return time.perf_counter() - start
+
+
+async def warmup_templates(
+    env: jinja2.Environment,
+    patterns: Sequence[str] | None = None,
+    *,
+    concurrency: int = 4,
+    executor: Executor | None = None,
+) -> dict[str, float]:
+    """Load and compile templates, return compile time in seconds per name.
+
+    Templates of async environments are compiled along with the sync
+    variants :func:`setup` renders them with when nothing in them awaits.
+
+    Compilation runs in *executor* (the loop's default one if omitted) with
+    at most *concurrency* templates in flight. The first failure, e.g. a
+    :class:`jinja2.TemplateSyntaxError`, cancels the remaining work and is
+    re-raised.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency should be a positive number")
+    loop = asyncio.get_running_loop()
+    names = _select_templates(env, patterns)
+    pending: Iterator[str] = iter(names)
+    report: dict[str, float] = {}
+
+    async def worker() -> None:
+        for name in pending:
+            report[name] = await loop.run_in_executor(executor, _compile, env, name)
+
+    tasks = [
+        asyncio.ensure_future(worker()) for _ in range(min(concurrency, len(names)))
+    ]
+    if not tasks:
+        return report
+    done, running = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    for task in running:
+        task.cancel()
+    if running:
+        await asyncio.wait(running)
+    for task in done:
+        exc = task.exception()
+        if exc is not None:
+            raise exc
+    # keep the order of the loader listing rather than completion order
+    return {name: report[name] for name in names}
+
+
+def log_report(report: dict[str, float]) -> None:
+    total = sum(report.values())
+    logger.info("Compiled %d templates in %.3fs", len(report), total)
+    for name, elapsed in sorted(report.items(), key=lambda item: -item[1]):
+        logger.debug("Compiled template %r in %.3fs", name, elapsed)
@@ -0,0 +1,118 @@
+"""Sampled profiling of slow template renders."""
+
+import cProfile
+import io
+import pstats
+import random
+import time
+from collections import deque
+from collections.abc import Sized
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, NamedTuple
+
+from aiohttp import web
+
+
+class RenderSnapshot(NamedTuple):
+    template: str
+    duration: float
+    timestamp: float
+    context_sizes: dict[str, int]
+    profile: str
+
+
+def _sizes(context: Mapping[str, object]) -> dict[str, int]:
+    sizes = {}
+    for key, value in context.items():
+        # deferred.Lazy wrappers tell without computing their value
+        peek = getattr(type(value), "_lazy_peek", None)
+        if peek is not None:
+            known, value = peek(value)
+            if not known:
+                # not read by the render
+                continue
+        if isinstance(value, Sized):
+            sizes[key] = len(value)
+    return sizes
+
+
+class SlowRenderWatchdog:
+    """Profile a sample of renders and keep the ones slower than *threshold*.
+
+    A fraction *sample_rate* of the renders run under :mod:`cProfile`, one
+    at a time; those lasting *threshold* seconds or more are stored as
+    :class:`RenderSnapshot` in a ring buffer of the *maxlen* latest ones.
+    The profile text lists the *profile_lines* functions with the highest
+    cumulative time.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        *,
+        sample_rate: float = 0.01,
+        maxlen: int = 100,
+        profile_lines: int = 30,
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate should be between 0 and 1")
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.profile_lines = profile_lines
+        self._snapshots: deque[RenderSnapshot] = deque(maxlen=maxlen)
+        self._profiling = False
+
+    def snapshots(self) -> list[RenderSnapshot]:
+        """Return the stored snapshots, most recent first."""
+        return list(reversed(self._snapshots))
+
+    def clear(self) -> None:
+        self._snapshots.clear()
+
+    @contextmanager
+    def watch(
+        self, template_name: str, context: Mapping[str, object]
+    ) -> Iterator[None]:
+        # an async render lets other tasks run under the profiler, which
+        # also means only one render can be profiled at a time
+        if self._profiling or random.random() >= self.sample_rate:  # noqa: S311
+            yield
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # another profiler is active
+            yield
+            return
+        self._profiling = True
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self._profiling = False
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            self._snapshots.append(
+                RenderSnapshot(
+                    template_name,
+                    duration,
+                    time.time(),
+                    _sizes(context),
+                    self._format(profiler),
+                )
+            )
+
+    def _format(self, profiler: cProfile.Profile) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.profile_lines)
+        return out.getvalue()
+
+    async def handler(self, request: web.Request) -> web.Response:
+        """Debug view listing the snapshots as JSON."""
+        data: list[dict[str, Any]] = [
+            snapshot._asdict() for snapshot in self.snapshots()
+        ]
+        return web.json_response(data)
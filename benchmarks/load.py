@@ -0,0 +1,280 @@
+"""End-to-end load test of template rendering under concurrency.
+
+The application runs in a child process so that the clients do not share
+its event loop; the loop lag is sampled there and fetched after the run::
+
+    python benchmarks/load.py --concurrency 200 --duration 10 --max-p99 50
+
+The exit status is 1 when a result goes over a budget given on the command
+line.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import sys
+import time
+from typing import Any, AsyncIterator, NamedTuple, Sequence
+
+import aiohttp
+import jinja2
+from aiohttp import web
+
+import aiohttp_jinja2
+
+TEMPLATES = {
+    "base.html": """\
+<!doctype html>
+<html>
+<head>
+  <title>{% block title %}{% endblock %}</title>
+  <link rel="stylesheet" href="{{ static('css/site.css') }}">
+</head>
+<body>
+  {% include "nav.html" %}
+  {% block content %}{% endblock %}
+</body>
+</html>
+""",
+    "nav.html": """\
+<nav>
+  {% for item in menu %}
+  <a href="{{ url('page', name=item) }}">{{ item|title }}</a>
+  {% endfor %}
+</nav>
+""",
+    "page.html": """\
+{% extends "base.html" %}
+{% block title %}{{ name|title }}{% endblock %}
+{% block content %}
+<h1>{{ name }}</h1>
+<p>Requested {{ request.path }}</p>
+{% for row in rows %}
+<div class="{{ loop.cycle('odd', 'even') }}">{{ row.title }}: {{ row.value }}</div>
+{% endfor %}
+{% endblock %}
+""",
+    "table.html": """\
+{% extends "base.html" %}
+{% block title %}Table{% endblock %}
+{% block content %}
+<table>
+{% for row in rows %}
+  <tr><td>{{ row.title }}</td><td>{{ "%.2f"|format(row.value) }}</td></tr>
+{% endfor %}
+</table>
+{% endblock %}
+""",
+}
+
+ROWS = [{"title": f"Row <{i}>", "value": i * 1.5} for i in range(200)]
+
+
+class Budgets(NamedTuple):
+    p99: float | None
+    p999: float | None
+    loop_lag: float | None
+    min_rps: float | None
+
+
+async def processor(request: web.Request) -> dict[str, Any]:
+    return {"menu": ("home", "about", "contact")}
+
+
+@aiohttp_jinja2.template("page.html")
+async def page(request: web.Request) -> dict[str, Any]:
+    return {"name": request.match_info["name"], "rows": ROWS[:20]}
+
+
+@aiohttp_jinja2.template("table.html")
+async def table(request: web.Request) -> dict[str, Any]:
+    return {"rows": ROWS}
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted *values*."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LagMonitor:
+    """Sample how late the event loop wakes up from a short sleep."""
+
+    def __init__(self, interval: float = 0.01) -> None:
+        self.interval = interval
+        self.samples: list[float] = []
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(loop.time() - start - self.interval)
+
+
+def make_app(enable_async: bool) -> web.Application:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader(TEMPLATES),
+        enable_async=enable_async,
+        context_processors=(processor, aiohttp_jinja2.request_processor),
+    )
+    app[aiohttp_jinja2.static_root_key] = "/static"
+    app.router.add_get("/page/{name}", page, name="page")
+    app.router.add_get("/table", table)
+    monitor = LagMonitor()
+
+    async def stats(request: web.Request) -> web.Response:
+        return web.json_response(sorted(monitor.samples))
+
+    async def reset(request: web.Request) -> web.Response:
+        monitor.samples.clear()
+        return web.Response()
+
+    async def lag_monitor(app: web.Application) -> AsyncIterator[None]:
+        task = asyncio.create_task(monitor.run())
+        yield
+        task.cancel()
+
+    app.router.add_get("/__stats", stats)
+    app.router.add_post("/__stats", reset)
+    app.cleanup_ctx.append(lag_monitor)
+    return app
+
+
+def serve(port: int, enable_async: bool) -> None:
+    web.run_app(make_app(enable_async), host="127.0.0.1", port=port, print=None)
+
+
+async def wait_ready(session: aiohttp.ClientSession, base: str) -> None:
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            async with session.post(base + "/__stats"):
+                return
+        except aiohttp.ClientConnectionError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.05)
+
+
+async def drive(
+    base: str, paths: Sequence[str], concurrency: int, duration: float
+) -> tuple[list[float], int, float, list[float]]:
+    latencies: list[float] = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session, base)
+        # compile the templates before measuring
+        for path in paths:
+            async with session.get(base + path) as resp:
+                await resp.read()
+        async with session.post(base + "/__stats"):
+            pass
+        deadline = time.perf_counter() + duration
+
+        async def client(offset: int) -> None:
+            nonlocal errors
+            count = offset
+            while time.perf_counter() < deadline:
+                url = base + paths[count % len(paths)]
+                count += 1
+                start = time.perf_counter()
+                try:
+                    async with session.get(url) as resp:
+                        await resp.read()
+                        if resp.status != 200:
+                            errors += 1
+                            continue
+                except aiohttp.ClientError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        async with session.get(base + "/__stats") as resp:
+            lags: list[float] = await resp.json()
+    latencies.sort()
+    return latencies, errors, elapsed, lags
+
+
+def report(
+    latencies: Sequence[float],
+    errors: int,
+    elapsed: float,
+    lags: Sequence[float],
+    budgets: Budgets,
+) -> bool:
+    rps = len(latencies) / elapsed if elapsed else 0.0
+    results = {
+        "p50": percentile(latencies, 0.5) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "p999": percentile(latencies, 0.999) * 1000,
+        "loop_lag": percentile(lags, 0.99) * 1000,
+    }
+    print(f"requests:      {len(latencies)} ({errors} errors)")
+    print(f"throughput:    {rps:.0f} req/s")
+    print(
+        f"latency:       p50 {results['p50']:.2f} ms, p99 {results['p99']:.2f} ms,"
+        f" p999 {results['p999']:.2f} ms"
+    )
+    print(
+        f"loop lag:      p99 {results['loop_lag']:.2f} ms,"
+        f" max {(lags[-1] if lags else 0.0) * 1000:.2f} ms"
+    )
+    failed = []
+    for name in ("p99", "p999", "loop_lag"):
+        budget = getattr(budgets, name)
+        if budget is not None and results[name] > budget:
+            failed.append(f"{name} {results[name]:.2f} ms > {budget} ms")
+    if budgets.min_rps is not None and rps < budgets.min_rps:
+        failed.append(f"throughput {rps:.0f} req/s < {budgets.min_rps} req/s")
+    if errors:
+        failed.append(f"{errors} failed requests")
+    for line in failed:
+        print(f"OVER BUDGET:   {line}")
+    return not failed
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--async", dest="enable_async", action="store_true")
+    parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        help="request path, repeat to mix (default: a page and a table)",
+    )
+    parser.add_argument("--max-p99", type=float, help="budget in ms")
+    parser.add_argument("--max-p999", type=float, help="budget in ms")
+    parser.add_argument("--max-loop-lag", type=float, help="p99 budget in ms")
+    parser.add_argument("--min-rps", type=float, help="requests per second")
+    args = parser.parse_args(argv)
+
+    budgets = Budgets(args.max_p99, args.max_p999, args.max_loop_lag, args.min_rps)
+    paths = args.paths or ["/page/home", "/table"]
+    server = multiprocessing.Process(
+        target=serve, args=(args.port, args.enable_async), daemon=True
+    )
+    server.start()
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        latencies, errors, elapsed, lags = asyncio.run(
+            drive(base, paths, args.concurrency, args.duration)
+        )
+    finally:
+        server.terminate()
+        server.join()
+    return 0 if report(latencies, errors, elapsed, lags, budgets) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
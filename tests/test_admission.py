@@ -0,0 +1,218 @@
+import asyncio
+
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+from aiohttp_jinja2.admission import Rejected
+
+
+def _app(admission: aiohttp_jinja2.RenderAdmission) -> web.Application:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader({"a.jinja2": "a {{ n }}", "b.jinja2": "b"}),
+        admission=admission,
+    )
+    return app
+
+
+async def test_queue_full(aiohttp_client):
+    release = asyncio.Event()
+
+    @aiohttp_jinja2.template("a.jinja2")
+    async def func(request):
+        await release.wait()
+        return {"n": 1}
+
+    admission = aiohttp_jinja2.RenderAdmission(1, max_queue=1, retry_after=5)
+    app = _app(admission)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    first = asyncio.create_task(client.get("/"))
+    second = asyncio.create_task(client.get("/"))
+    while admission.queued < 1:
+        await asyncio.sleep(0.01)
+
+    resp = await client.get("/")
+    assert 503 == resp.status
+    assert "5" == resp.headers["Retry-After"]
+    assert "503 Service Unavailable" in await resp.text()
+    assert 1 == admission.rejected
+
+    release.set()
+    for task in (first, second):
+        resp = await task
+        assert 200 == resp.status
+        assert "a 1" == await resp.text()
+    assert 0 == admission.running
+    assert 0 == admission.queued
+
+
+async def test_max_wait(aiohttp_client):
+    release = asyncio.Event()
+
+    @aiohttp_jinja2.template("a.jinja2")
+    async def func(request):
+        await release.wait()
+        return {}
+
+    admission = aiohttp_jinja2.RenderAdmission(1, max_wait=0.01)
+    app = _app(admission)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    first = asyncio.create_task(client.get("/"))
+    while not admission.running:
+        await asyncio.sleep(0.01)
+
+    resp = await client.get("/")
+    assert 503 == resp.status
+    assert 0 == admission.queued
+
+    release.set()
+    assert 200 == (await first).status
+
+
+async def test_template_limit(aiohttp_client):
+    release = asyncio.Event()
+
+    @aiohttp_jinja2.template("a.jinja2", max_renders=1)
+    async def slow(request):
+        await release.wait()
+        return {}
+
+    @aiohttp_jinja2.template("b.jinja2")
+    async def fast(request):
+        return {}
+
+    admission = aiohttp_jinja2.RenderAdmission(10, max_queue=0)
+    app = _app(admission)
+    app.router.add_get("/a", slow)
+    app.router.add_get("/b", fast)
+    client = await aiohttp_client(app)
+
+    first = asyncio.create_task(client.get("/a"))
+    while not admission.running:
+        await asyncio.sleep(0.01)
+
+    assert 503 == (await client.get("/a")).status
+    resp = await client.get("/b")
+    assert 200 == resp.status
+    assert "b" == await resp.text()
+
+    release.set()
+    assert 200 == (await first).status
+
+
+async def test_priority():
+    admission = aiohttp_jinja2.RenderAdmission(1)
+    order: list[str] = []
+
+    async def render(name: str, priority: int) -> None:
+        async with admission.slot("tmpl", priority=priority):
+            order.append(name)
+
+    async with admission.slot("tmpl"):
+        tasks = [
+            asyncio.create_task(render("low", -1)),
+            asyncio.create_task(render("first", 0)),
+            asyncio.create_task(render("high", 5)),
+            asyncio.create_task(render("second", 0)),
+        ]
+        await asyncio.sleep(0)
+        assert 4 == admission.queued
+    await asyncio.gather(*tasks)
+
+    assert ["high", "first", "second", "low"] == order
+
+
+async def test_blocked_template_does_not_hold_queue():
+    admission = aiohttp_jinja2.RenderAdmission(
+        2, template_limits={"a": 1}, max_wait=0.1
+    )
+
+    async with admission.slot("a"):
+        waiting = asyncio.create_task(admission.slot("a").__aenter__())
+        await asyncio.sleep(0)
+        # the waiter for "a" does not keep "b" from the free slot
+        async with admission.slot("b"):
+            assert 2 == admission.running
+        with pytest.raises(Rejected):
+            await waiting
+    assert 0 == admission.running
+    assert 0 == admission.queued
+
+
+async def test_render_holds_slot(aiohttp_client):
+    release = asyncio.Event()
+
+    async def wait(value):
+        await release.wait()
+        return value
+
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"n": 1}
+
+    admission = aiohttp_jinja2.RenderAdmission(1, max_queue=1)
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ n|wait }}"}),
+        admission=admission,
+        enable_async=True,
+        filters={"wait": wait},
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    first = asyncio.create_task(client.get("/"))
+    second = asyncio.create_task(client.get("/"))
+
+    async def queued():
+        while admission.queued < 1:
+            await asyncio.sleep(0.01)
+
+    # the second request waits for the slot of the first render
+    await asyncio.wait_for(queued(), 1)
+    assert 1 == admission.running
+    assert 503 == (await client.get("/")).status
+
+    release.set()
+    for task in (first, second):
+        resp = await task
+        assert 200 == resp.status
+        assert "1" == await resp.text()
+    assert 0 == admission.running
+
+
+async def test_render_wait():
+    release = asyncio.Event()
+
+    async def wait(value):
+        await release.wait()
+        return value
+
+    env = jinja2.Environment(enable_async=True)
+    env.filters["wait"] = wait
+    tmpl = env.from_string("{{ n|wait }}")
+    admission = aiohttp_jinja2.RenderAdmission(1, max_wait=0.01)
+
+    async def render() -> str:
+        async with admission.slot("tmpl"):
+            return await tmpl.render_async(n=1)
+
+    first = asyncio.create_task(render())
+    await asyncio.sleep(0)
+    assert 1 == admission.running
+
+    with pytest.raises(Rejected):
+        await render()
+
+    release.set()
+    assert "1" == await first
+    assert "1" == await render()
+    assert 0 == admission.running
@@ -0,0 +1,235 @@
+from typing import Any, AsyncIterator, Hashable
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+from aiohttp_jinja2.helpers import uses_batches
+
+
+class Recorder:
+    def __init__(self, values: dict[Any, Any]) -> None:
+        self.values = values
+        self.calls: list[list[Hashable]] = []
+
+    async def __call__(self, keys: list[Hashable]) -> list[Any]:
+        self.calls.append(keys)
+        return [self.values[key] for key in keys]
+
+
+def _request(templates: dict[str, str], **batched: Any) -> web.Request:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        loader=jinja2.DictLoader(templates),
+        batched_globals=batched,
+    )
+    return make_mocked_request("GET", "/", app=app)
+
+
+async def test_loop_is_batched():
+    users = Recorder({i: {"name": f"user{i}"} for i in range(5)})
+    prices = Recorder({f"sku{i}": i * 10 for i in range(200)})
+    req = _request(
+        {
+            "tmpl.jinja2": "{% for row in rows %}"
+            "{{ user(row.user).name }}:{{ price(row.sku) }} "
+            "{% endfor %}"
+        },
+        user=users,
+        price=prices,
+    )
+    rows = [{"user": i % 5, "sku": f"sku{i}"} for i in range(200)]
+
+    text = await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, {"rows": rows})
+
+    assert text.startswith("user0:0 user1:10 user2:20 ")
+    assert 200 == len(text.split())
+    assert [[0, 1, 2, 3, 4]] == users.calls
+    assert 1 == len(prices.calls)
+    assert 200 == len(prices.calls[0])
+
+
+async def test_dependent_calls():
+    posts = Recorder({i: {"author": i % 2} for i in range(4)})
+    users = Recorder({0: "ann", 1: "bob"})
+    req = _request(
+        {
+            "tmpl.jinja2": "{% for id in ids %}"
+            "{{ user(post(id).author) }} {% include 'footer.jinja2' %}"
+            "{% endfor %}",
+            "footer.jinja2": "{{ user(0) }};",
+        },
+        post=posts,
+        user=users,
+    )
+
+    text = await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"ids": range(4)}
+    )
+
+    assert "ann ann;bob ann;ann ann;bob ann;" == text
+    assert [[0, 1, 2, 3]] == posts.calls
+    assert [[0], [1]] == users.calls
+
+
+async def test_mapping_result_and_batch_size():
+    calls = []
+
+    async def load(keys: list[Hashable]) -> dict[Hashable, str]:
+        calls.append(keys)
+        return {key: f"v{key}" for key in keys if key != 2}
+
+    req = _request(
+        {"tmpl.jinja2": "{% for i in range(5) %}{{ value(i) }},{% endfor %}"},
+        value=aiohttp_jinja2.BatchLoader(load, max_batch_size=2),
+    )
+
+    text = await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, {})
+
+    assert "v0,v1,None,v3,v4," == text
+    assert [[0, 1], [2, 3], [4]] == calls
+
+
+async def test_error_is_raised_by_render():
+    async def load(keys: list[Hashable]) -> list[Any]:
+        raise LookupError("backend down")
+
+    req = _request({"tmpl.jinja2": "{{ value(1) }}"}, value=load)
+
+    with pytest.raises(LookupError, match="backend down"):
+        await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, {})
+
+
+async def test_wrong_number_of_values():
+    async def load(keys: list[Hashable]) -> list[Any]:
+        return []
+
+    loader = aiohttp_jinja2.BatchLoader(load)
+
+    with pytest.raises(ValueError, match="returned 0 values for 1 keys"):
+        await loader(1)
+
+
+async def test_call_outside_render():
+    users = Recorder({1: "ann"})
+    loader = aiohttp_jinja2.BatchLoader(users)
+
+    assert "ann" == await loader(1)
+    assert [[1]] == users.calls
+
+
+def test_template_without_loaders():
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        loader=jinja2.DictLoader({"a.jinja2": "{{ x }}", "b.jinja2": "{{ user(1) }}"}),
+        batched_globals={"user": Recorder({})},
+    )
+
+    assert not uses_batches(env.get_template("a.jinja2"))
+    assert uses_batches(env.get_template("b.jinja2"))
+
+
+def test_sync_environment():
+    with pytest.raises(ValueError):
+        aiohttp_jinja2.setup(
+            web.Application(),
+            loader=jinja2.DictLoader({}),
+            batched_globals={"user": Recorder({})},
+        )
+
+
+async def test_async_iterable_is_not_consumed_by_collecting():
+    async def rows() -> AsyncIterator[int]:
+        for i in range(3):
+            yield i
+
+    users = Recorder({i: f"user{i}" for i in range(3)})
+    req = _request(
+        {"tmpl.jinja2": "{% for row in rows %}{{ user(row) }} {% endfor %}"},
+        user=users,
+    )
+
+    text = await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"rows": rows()}
+    )
+
+    assert "user0 user1 user2 " == text
+
+
+async def test_other_template_code_is_not_run_twice():
+    posts = Recorder({1: {"author": 0}})
+    users = Recorder({0: "ann"})
+    calls = []
+    req = _request(
+        {
+            "tmpl.jinja2": "{{ user(post(1).author) }}"
+            "{{ count() }}{{ (post(1).author + 1) }}"
+            "{% for row in rows() %}{{ user(row) }}{% endfor %}"
+        },
+        post=posts,
+        user=users,
+    )
+
+    def count() -> str:
+        calls.append(1)
+        return ""
+
+    def rows() -> list[int]:
+        calls.append(2)
+        return [0]
+
+    text = await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"count": count, "rows": rows}
+    )
+
+    assert "ann1ann" == text
+    assert [1, 2] == calls
+    assert [[1]] == posts.calls
+    assert [[0]] == users.calls
+
+
+async def test_prefetch_through_blocks_and_conditions():
+    users = Recorder({i: f"user{i}" for i in range(4)})
+    req = _request(
+        {
+            "base.jinja2": "{% block body %}{% endblock %}",
+            "tmpl.jinja2": "{% extends 'base.jinja2' %}{% block body %}"
+            "{% for row in rows if row is odd %}"
+            "{% set id = row - 1 %}"
+            "{% if id > 0 %}{{ user(id) }}{% else %}{{ user(row) }}{% endif %}"
+            "{% endfor %}{% endblock %}",
+        },
+        user=users,
+    )
+
+    text = await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"rows": range(4)}
+    )
+
+    assert "user1user2" == text
+    assert [[1, 2]] == users.calls
+
+
+async def test_names_set_by_other_code_are_not_prefetched():
+    users = Recorder({i: f"user{i}" for i in range(4)})
+    req = _request(
+        {
+            "tmpl.jinja2": "{% set ids = pick() %}"
+            "{% for id in ids %}{{ user(id) }}{% endfor %}"
+        },
+        user=users,
+    )
+
+    text = await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"ids": [0, 1], "pick": lambda: [2, 3]}
+    )
+
+    assert "user2user3" == text
+    # the ids of the context are shadowed, not loaded in advance
+    assert [[2], [3]] == users.calls
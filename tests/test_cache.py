@@ -0,0 +1,75 @@
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+from aiohttp_jinja2.cache import estimate_size
+
+TEMPLATES = {f"t{i}.html": f"<p>{i} {{{{ value }}}}</p>" * 10 for i in range(5)}
+
+
+def test_setup_installs_cache():
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader(TEMPLATES), cache_max_bytes=10**6
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    for _ in range(3):
+        aiohttp_jinja2.render_string("t1.html", req, {"value": 1})
+    aiohttp_jinja2.render_string("t2.html", req, {"value": 2})
+
+    assert isinstance(env.cache, aiohttp_jinja2.TemplateCache)
+    entries = env.cache.entries()
+    assert ["t2.html", "t1.html"] == [entry.name for entry in entries]
+    assert [0, 2] == [entry.hits for entry in entries]
+    assert all(entry.size > 0 and entry.compile_time > 0 for entry in entries)
+    assert env.cache.total_size == sum(entry.size for entry in entries)
+
+
+def test_eviction_keeps_within_budget():
+    env = jinja2.Environment(loader=jinja2.DictLoader(TEMPLATES))
+    size = estimate_size(env.get_template("t0.html"))
+    cache = aiohttp_jinja2.TemplateCache(int(size * 2.5))
+    env.cache = cache
+
+    env.get_template("t0.html")
+    for _ in range(5):
+        env.get_template("t0.html")  # hot entry
+    for name in ("t1.html", "t2.html", "t3.html"):
+        env.get_template(name)
+
+    names = {entry.name for entry in cache.entries()}
+    assert cache.total_size <= cache.max_bytes
+    assert 2 == len(names)
+    assert "t0.html" in names
+    assert "t3.html" in names
+
+
+def test_oversized_template_is_cached_alone():
+    env = jinja2.Environment(loader=jinja2.DictLoader(TEMPLATES))
+    cache = aiohttp_jinja2.TemplateCache(1)
+    env.cache = cache
+
+    env.get_template("t0.html")
+    env.get_template("t1.html")
+
+    assert ["t1.html"] == [entry.name for entry in cache.entries()]
+
+
+def test_clear():
+    env = jinja2.Environment(loader=jinja2.DictLoader(TEMPLATES))
+    cache = aiohttp_jinja2.TemplateCache(10**6)
+    env.cache = cache
+    env.get_template("t0.html")
+
+    cache.clear()
+
+    assert 0 == len(cache)
+    assert 0 == cache.total_size
+
+
+def test_invalid_budget():
+    with pytest.raises(ValueError):
+        aiohttp_jinja2.TemplateCache(0)
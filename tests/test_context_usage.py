@@ -0,0 +1,77 @@
+import jinja2
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+TEMPLATES = {
+    "base.jinja2": "{{ title }}{% block body %}{% endblock %}",
+    "page.jinja2": (
+        '{% extends "base.jinja2" %}'
+        '{% block body %}{% include "row.jinja2" %}{% endblock %}'
+    ),
+    "row.jinja2": "{% for row in rows %}{{ row }}{% endfor %}",
+    "dynamic.jinja2": "{% include name %}",
+}
+
+
+async def processor(request):
+    return {"user": "bob"}
+
+
+async def test_unused_keys(aiohttp_client):
+    @aiohttp_jinja2.template("page.jinja2")
+    async def func(request):
+        context = {"title": "T", "rows": [1], "stats": 1}
+        if "debug" in request.query:
+            context["debug"] = True
+        return context
+
+    usage = aiohttp_jinja2.ContextUsageTracker()
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader(TEMPLATES),
+        context_processors=(processor,),
+        context_usage=usage,
+    )
+    app.router.add_get("/", func)
+    app.router.add_get("/usage", usage.handler)
+    client = await aiohttp_client(app)
+
+    for path in ("/", "/?debug", "/"):
+        resp = await client.get(path)
+        assert "T1" == await resp.text()
+
+    assert [
+        aiohttp_jinja2.ContextUsage(
+            "page.jinja2", 3, {"stats": 3, "user": 3, "debug": 1}
+        )
+    ] == usage.report()
+    resp = await client.get("/usage")
+    assert [
+        {
+            "template": "page.jinja2",
+            "renders": 3,
+            "unused": {"stats": 3, "user": 3, "debug": 1},
+        }
+    ] == await resp.json()
+
+    usage.clear()
+    assert [] == usage.report()
+
+
+def test_dynamic_include_not_tracked():
+    usage = aiohttp_jinja2.ContextUsageTracker()
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader(TEMPLATES), context_usage=usage
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    text = aiohttp_jinja2.render_string(
+        "dynamic.jinja2", req, {"name": "row.jinja2", "rows": [1, 2]}
+    )
+
+    assert "12" == text
+    assert [] == usage.report()
@@ -0,0 +1,228 @@
+from typing import Any
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+from aiohttp_jinja2 import fastpath
+
+
+async def _fetch_name() -> str:
+    return "async"
+
+
+def _setup(
+    templates: dict[str, str], **kwargs: Any
+) -> tuple[web.Application, web.Request]:
+    kwargs.setdefault("sync_fast_path", True)
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app, enable_async=True, loader=jinja2.DictLoader(templates), **kwargs
+    )
+    env.globals["fetch_name"] = _fetch_name
+    return app, make_mocked_request("GET", "/", app=app)
+
+
+async def test_sync_template_skips_render_async(monkeypatch):
+    app, req = _setup(
+        {
+            "base.html": "<h1>{% block title %}{% endblock %}</h1>",
+            "tmpl.html": (
+                "{% extends 'base.html' %}"
+                "{% block title %}{{ head|upper }} {{ url('index') }}{% endblock %}"
+            ),
+        }
+    )
+
+    async def index(request: web.Request) -> web.Response:
+        return web.Response()
+
+    app.router.add_get("/", index, name="index")
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("render_async should not be used")
+
+    monkeypatch.setattr(jinja2.Template, "render_async", fail)
+    txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, {"head": "h"})
+
+    assert "<h1>H /</h1>" == txt
+
+
+@pytest.mark.parametrize(
+    "templates",
+    (
+        {"tmpl.html": "{{ fetch_name() }}"},
+        {"tmpl.html": "{% include 'inner.html' %}", "inner.html": "{{ fetch_name() }}"},
+        {"tmpl.html": "{% include name %}", "inner.html": "async"},
+        {"tmpl.html": "{% set f = fetch_name %}{{ f() }}"},
+    ),
+)
+async def test_async_constructs_use_render_async(templates):
+    app, req = _setup(templates)
+    env = aiohttp_jinja2.get_env(app)
+
+    txt = await aiohttp_jinja2.render_string_async(
+        "tmpl.html", req, {"name": "inner.html"}
+    )
+
+    assert "async" == txt
+    template = env.get_template("tmpl.html")
+    assert fastpath.sync_variant(template, {}) is None
+
+
+async def test_async_context_values_use_render_async():
+    app, req = _setup({"tmpl.html": "{{ load() }}{% for x in items %}{{ x }}{% endfor %}"})
+
+    async def items():
+        yield 1
+        yield 2
+
+    txt = await aiohttp_jinja2.render_string_async(
+        "tmpl.html", req, {"load": _fetch_name, "items": items()}
+    )
+
+    assert "async12" == txt
+
+
+async def test_async_method_in_context_uses_render_async():
+    class User:
+        async def name(self) -> str:
+            return "async"
+
+    app, req = _setup({"tmpl.html": "{{ user.name() }}"})
+
+    txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, {"user": User()})
+
+    assert "async" == txt
+
+
+async def test_sync_fast_path_disabled_by_default():
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app, enable_async=True, loader=jinja2.DictLoader({"tmpl.html": "{{ text }}"})
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, {"text": "t"})
+
+    assert "t" == txt
+    assert not hasattr(env, "aiohttp_jinja2_sync_variants")
+
+
+async def test_sync_variant_does_not_share_bytecode_cache(tmp_path):
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        sync_fast_path=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ text }}"}),
+        bytecode_cache=jinja2.FileSystemBytecodeCache(str(tmp_path)),
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    text = await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, {"text": 1})
+
+    assert "1" == text
+    assert fastpath.sync_variant(env.get_template("tmpl.jinja2"), {}) is not None
+
+
+class SyncPage:
+    def load(self) -> str:
+        return "12"
+
+
+class AsyncPage:
+    async def load(self) -> str:
+        return "12"
+
+
+async def test_method_calls_checked_by_type():
+    app, req = _setup({"tmpl.html": "{{ page.load() }}"})
+    template = aiohttp_jinja2.get_env(app).get_template("tmpl.html")
+
+    for page in (AsyncPage(), SyncPage()):
+        context = {"page": page}
+        txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, context)
+        assert "12" == txt
+    assert fastpath.sync_variant(template, {"page": AsyncPage()}) is None
+    assert fastpath.sync_variant(template, {"page": SyncPage()}) is not None
+    # items are only known by looking them up
+    assert fastpath.sync_variant(template, {"page": {"load": lambda: "12"}}) is None
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "{% for r in page.rows %}{{ r }}{% endfor %}",
+        "{% for r in page['rows'] %}{{ r }}{% endfor %}",
+        "{{ page.rows|join }}",
+        "{{ page.rows.load() }}",
+    ),
+)
+async def test_looked_up_values_use_render_async(source):
+    async def rows():
+        yield 1
+        yield 2
+
+    class Rows:
+        async def load(self):
+            return "12"
+
+    app, req = _setup({"tmpl.html": source})
+    template = aiohttp_jinja2.get_env(app).get_template("tmpl.html")
+
+    page = {"rows": Rows() if "load" in source else rows()}
+    txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, {"page": page})
+
+    assert "12" == txt
+    assert fastpath.sync_variant(template, {"page": {"rows": [1, 2]}}) is None
+
+
+async def test_check_does_not_evaluate_attributes():
+    calls = []
+
+    class Page:
+        @property
+        def rows(self):
+            calls.append(self)
+            return [1, 2]
+
+        def title(self):
+            calls.append(self)
+            return "t"
+
+    app, req = _setup({"tmpl.html": "{{ page.title() }}{{ page.rows|sum }}"})
+
+    txt = await aiohttp_jinja2.render_string_async("tmpl.html", req, {"page": Page()})
+
+    assert "t3" == txt
+    assert 2 == len(calls)
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "{% for p in pages %}{% for r in p.rows %}{{ r }}{% endfor %}{% endfor %}",
+        "{% set rows = page.rows %}{{ rows|list }}",
+        "{% for r in page[key] %}{{ r }}{% endfor %}",
+    ),
+)
+async def test_values_from_template_code_are_unsafe(source):
+    app, req = _setup({"tmpl.html": source})
+    template = aiohttp_jinja2.get_env(app).get_template("tmpl.html")
+
+    assert fastpath.sync_variant(template, {}) is None
+
+
+async def test_sync_variants_share_cache_budget():
+    app, req = _setup({"tmpl.html": "{{ text }}"}, cache_max_bytes=10**6)
+    env = aiohttp_jinja2.get_env(app)
+
+    await aiohttp_jinja2.render_string_async("tmpl.html", req, {"text": "t"})
+
+    assert isinstance(env.cache, aiohttp_jinja2.TemplateCache)
+    assert ["tmpl.html", "tmpl.html"] == [e.name for e in env.cache.entries()]
+    env.cache.clear()
+    assert fastpath.sync_variant(env.get_template("tmpl.html"), {}) is not None
@@ -0,0 +1,141 @@
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+TEMPLATES = {
+    "base.html": (
+        "<html>{% block head %}<title>{% block title %}Base{% endblock %}"
+        "</title>{% endblock %}{% include 'nav.html' %}"
+        "{% block body %}{% endblock %}</html>"
+    ),
+    "layout.html": (
+        "{% extends 'base.html' %}\n"
+        "{% block body %}<main>{% block content %}{% endblock %}</main>"
+        "{% endblock %}"
+    ),
+    "page.html": (
+        "{% extends 'layout.html' %}"
+        "{% block title %}{{ title }}{% endblock %}"
+        "{% block content %}{% for row in rows %}{% include 'row.html' %}"
+        "{% endfor %}{% endblock %}"
+    ),
+    "nav.html": "<nav>{{ user }}</nav>",
+    "row.html": "<p>{{ row }}</p>",
+    "super.html": (
+        "{% extends 'base.html' %}{% block title %}{{ super() }}!{% endblock %}"
+    ),
+    "setter.html": "{% set user = 'x' %}{{ user }}",
+    "scoped.html": (
+        "{% include 'setter.html' %}{{ user }}"
+        "{% include 'nav.html' without context %}"
+    ),
+}
+
+CONTEXT = {"title": "Title", "rows": [1, 2], "user": "bob"}
+
+
+def _env(templates: dict[str, str], flatten: bool) -> jinja2.Environment:
+    return jinja2.Environment(
+        loader=jinja2.DictLoader(templates),
+        extensions=[aiohttp_jinja2.FlattenExtension] if flatten else [],
+    )
+
+
+@pytest.mark.parametrize("name", sorted(TEMPLATES))
+def test_same_output(name):
+    expected = _env(TEMPLATES, False).get_template(name).render(CONTEXT)
+
+    assert expected == _env(TEMPLATES, True).get_template(name).render(CONTEXT)
+
+
+def test_flattened():
+    env = _env(TEMPLATES, True)
+
+    code = env.compile(TEMPLATES["page.html"], "page.html", raw=True)
+
+    assert "get_template" not in code
+    assert {"head", "title", "body", "content"} == set(
+        env.get_template("page.html").blocks
+    )
+
+
+@pytest.mark.parametrize("name", ("super.html", "scoped.html"))
+def test_not_flattened(name):
+    env = _env(TEMPLATES, True)
+
+    code = env.compile(TEMPLATES[name], name, raw=True)
+
+    assert "get_template" in code
+
+
+def _outcome(env: jinja2.Environment, name: str) -> str:
+    try:
+        return env.get_template(name).render(CONTEXT)
+    except (jinja2.TemplateError, TypeError) as e:
+        return type(e).__name__
+
+
+@pytest.mark.parametrize(
+    "source,included",
+    (
+        ("{% for i in rows %}{% include 'inc.html' %}{% endfor %}", "[{{ loop }}]"),
+        (
+            "{% for i in rows %}{% include 'inc.html' %}{% endfor %}",
+            "[{{ loop.index }}:{{ i }}]",
+        ),
+        ("{% macro m() %}{% include 'inc.html' %}{% endmacro %}{{ m(1, 2) }}",
+         "{{ varargs }}"),
+        ("{% macro m() %}{% include 'inc.html' %}{% endmacro %}{{ m(a=1) }}",
+         "{{ kwargs }}"),
+        (
+            "{% macro m() %}{% include 'inc.html' %}{% endmacro %}"
+            "{% call m() %}c{% endcall %}",
+            "{{ caller() }}",
+        ),
+    ),
+)
+def test_implicit_names_not_flattened(source, included):
+    templates = {"tmpl.html": source, "inc.html": included}
+    plain, flattened = _env(templates, False), _env(templates, True)
+
+    assert _outcome(plain, "tmpl.html") == _outcome(flattened, "tmpl.html")
+    code = flattened.compile(source, "tmpl.html", raw=True)
+    assert "get_template" in code
+
+
+def test_dependency_changed():
+    templates = dict(TEMPLATES)
+    env = _env(templates, True)
+    template = env.get_template("page.html")
+    assert "<nav>bob</nav>" in template.render(CONTEXT)
+
+    templates["nav.html"] = "<nav>{{ user|upper }}</nav>"
+
+    assert not template.is_up_to_date
+    assert "<nav>BOB</nav>" in env.get_template("page.html").render(CONTEXT)
+
+
+def test_setup():
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader(TEMPLATES), flatten=True, enable_async=True
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    text = aiohttp_jinja2.render_string("page.html", req, CONTEXT)
+
+    assert "<title>Title</title>" in text
+
+
+def test_setup_bytecode_cache():
+    app = web.Application()
+    with pytest.raises(ValueError, match="bytecode_cache"):
+        aiohttp_jinja2.setup(
+            app,
+            loader=jinja2.DictLoader(TEMPLATES),
+            flatten=True,
+            bytecode_cache=jinja2.FileSystemBytecodeCache(),
+        )
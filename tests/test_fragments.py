@@ -0,0 +1,271 @@
+import asyncio
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+from aiohttp_jinja2.fragments import SSEStream, WSStream
+
+TEMPLATES = {
+    "base.html": "<ul>{% block items %}{% endblock %}</ul>",
+    "feed.html": (
+        "{% extends 'base.html' %}"
+        "{% block items %}<li>{{ user }}: {{ item }}</li>{% endblock %}"
+    ),
+}
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_sse(aiohttp_client, enable_async):
+    async def handler(request):
+        stream = await aiohttp_jinja2.render_sse(
+            "feed.html", request, {"user": "ann"}, block="items"
+        )
+        await stream.send({"item": 1}, event="item", event_id="1")
+        await stream.send({"item": "a\nb"})
+        return stream.response
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 200 == resp.status
+    assert "text/event-stream" == resp.headers["Content-Type"]
+    txt = await resp.text()
+    assert (
+        "event: item\nid: 1\ndata: <li>ann: 1</li>\n\n"
+        "data: <li>ann: a\ndata: b</li>\n\n"
+    ) == txt
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_ws(aiohttp_client, enable_async):
+    async def handler(request):
+        ws = web.WebSocketResponse()
+        stream = await aiohttp_jinja2.render_ws(
+            "feed.html", request, {"user": "ann"}, ws, block="items"
+        )
+        await stream.send({"item": 1})
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    app.router.add_get("/", handler)
+    client = await aiohttp_client(app)
+
+    async with client.ws_connect("/") as ws:
+        assert "<li>ann: 1</li>" == await ws.receive_str()
+
+
+async def test_render_sse_missing_block():
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(TEMPLATES))
+    req = make_mocked_request("GET", "/", app=app)
+
+    with pytest.raises(web.HTTPInternalServerError) as ctx:
+        await aiohttp_jinja2.render_sse("feed.html", req, {}, block="missing")
+
+    assert "Template 'feed.html' has no block 'missing'" == ctx.value.text
+
+
+async def test_fragments_batched_while_writing():
+    writes = []
+
+    class SlowResponse:
+        async def write(self, data):
+            writes.append(data.decode())
+            await asyncio.sleep(0.01)
+
+    env = jinja2.Environment(loader=jinja2.DictLoader({"t.html": "{{ n }}"}))
+    stream = SSEStream(
+        env.get_template("t.html"), {}, None, SlowResponse()  # type: ignore[arg-type]
+    )
+
+    await asyncio.gather(*(stream.send({"n": n}) for n in range(3)))
+
+    assert ["data: 0\n\n", "data: 1\n\ndata: 2\n\n"] == writes
+
+
+class _Response:
+    def __init__(self) -> None:
+        self.data = ""
+
+    async def write(self, data: bytes) -> None:
+        self.data += data.decode()
+
+
+async def test_sse_data_split_at_line_ends_only():
+    env = jinja2.Environment(loader=jinja2.DictLoader({"t.html": "{{ text }}"}))
+    response = _Response()
+    stream = SSEStream(
+        env.get_template("t.html"), {}, None, response  # type: ignore[arg-type]
+    )
+
+    await stream.send({"text": "a\u2028b\x0cc\x85d\r\ne\rf\ng"})
+    await stream.send({"text": ""})
+
+    assert (
+        "data: a\u2028b\x0cc\x85d\ndata: e\ndata: f\ndata: g\n\ndata: \n\n"
+    ) == response.data
+
+
+@pytest.mark.parametrize("field", ("event", "event_id"))
+@pytest.mark.parametrize("value", ("a\nid: 2", "a\rb", "a\r\n"))
+async def test_sse_fields_reject_line_breaks(field, value):
+    env = jinja2.Environment(loader=jinja2.DictLoader({"t.html": "x"}))
+    response = _Response()
+    stream = SSEStream(
+        env.get_template("t.html"), {}, None, response  # type: ignore[arg-type]
+    )
+
+    with pytest.raises(ValueError, match="cannot contain line breaks"):
+        await stream.send(**{field: value})
+
+    assert "" == response.data
+
+
+PAGES = {
+    "base.html": (
+        "<title>{% block title %}Site{% endblock %}</title>"
+        "<main>{% block main %}{% endblock %}</main>"
+    ),
+    "page.html": (
+        "{% extends 'base.html' %}"
+        "{% block title %}{{ super() }}: {{ name }}{% endblock %}"
+        "{% block main %}<p>{{ name }}</p>{% endblock %}"
+    ),
+}
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_block(enable_async):
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(PAGES)
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    if enable_async:
+        title = await aiohttp_jinja2.render_block_async(
+            "page.html", "title", req, {"name": "x"}
+        )
+    else:
+        title = aiohttp_jinja2.render_block("page.html", "title", req, {"name": "x"})
+
+    assert "Site: x" == title
+
+
+async def test_render_block_missing():
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(PAGES))
+    req = make_mocked_request("GET", "/", app=app)
+
+    with pytest.raises(web.HTTPInternalServerError) as ctx:
+        aiohttp_jinja2.render_block("page.html", "missing", req, {})
+
+    assert "Template 'page.html' has no block 'missing'" == ctx.value.text
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_template_block(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("page.html", block="main")
+    async def func(request):
+        return {"name": "x"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(PAGES)
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 200 == resp.status
+    assert "<p>x</p>" == await resp.text()
+
+
+async def test_template_block_header(aiohttp_client):
+    @aiohttp_jinja2.template("page.html", block_header="X-Block")
+    async def func(request):
+        return {"name": "x"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(PAGES))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"X-Block": "main"})
+    assert "<p>x</p>" == await resp.text()
+    assert "X-Block" == resp.headers["Vary"]
+
+    resp = await client.get("/", headers={"X-Block": "unknown"})
+    assert "<title>Site: x</title><main><p>x</p></main>" == await resp.text()
+
+    resp = await client.get("/")
+    assert "<title>Site: x</title><main><p>x</p></main>" == await resp.text()
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_block_top_level_code(enable_async):
+    templates = {
+        "macros.html": "{% macro bold(text) %}<b>{{ text }}</b>{% endmacro %}",
+        "base.html": (
+            "{% set site = 'Site' %}{% set sep = ':' %}"
+            "<title>{% block title %}{% endblock %}</title>"
+        ),
+        "page.html": (
+            "{% extends 'base.html' %}{% from 'macros.html' import bold %}"
+            "{% import 'macros.html' as m %}{% set sep = '-' %}"
+            "{% block title %}{{ site }}{{ sep }}{{ bold(name) }}"
+            "{{ m.bold(name) }}{% endblock %}"
+        ),
+    }
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader(templates),
+        sync_fast_path=False,
+    )
+    req = make_mocked_request("GET", "/", app=app)
+    context = {"name": "x"}
+
+    if enable_async:
+        title = await aiohttp_jinja2.render_block_async("page.html", "title", req, context)
+        page = await aiohttp_jinja2.render_string_async("page.html", req, context)
+    else:
+        title = aiohttp_jinja2.render_block("page.html", "title", req, context)
+        page = aiohttp_jinja2.render_string("page.html", req, context)
+
+    # the parent assigns last, as in the full render
+    assert "Site:<b>x</b><b>x</b>" == title
+    assert f"<title>{title}</title>" == page
+
+
+async def test_ws_fragments_sent_separately():
+    messages = []
+
+    class SlowWebSocket:
+        async def send_str(self, data):
+            messages.append(data)
+            await asyncio.sleep(0.01)
+
+    env = jinja2.Environment(loader=jinja2.DictLoader({"t.html": "{{ n }}"}))
+    stream = WSStream(
+        env.get_template("t.html"), {}, None, SlowWebSocket()  # type: ignore[arg-type]
+    )
+
+    await asyncio.gather(*(stream.send({"n": n}) for n in range(3)))
+
+    assert ["0", "1", "2"] == messages
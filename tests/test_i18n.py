@@ -0,0 +1,189 @@
+from gettext import NullTranslations
+from typing import Any
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+
+class Catalog(NullTranslations):
+    def __init__(self, messages: dict[str, str]) -> None:
+        super().__init__()
+        self.messages = messages
+        self.lookups: list[str] = []
+
+    def gettext(self, message: str) -> str:
+        self.lookups.append(message)
+        return self.messages.get(message, message)
+
+
+TEMPLATE = (
+    "<title>{{ _('Welcome') }}</title>"
+    "{% trans %}Hello world{% endtrans %}"
+    "{% trans name=name %}Hello {{ name }}{% endtrans %}"
+)
+
+
+def _setup(templates: dict[str, str], **kwargs: Any) -> tuple[web.Application, Catalog]:
+    de = Catalog(
+        {
+            "Welcome": "Willkommen",
+            "Hello world": "Hallo Welt",
+            "Hello %(name)s": "Hallo %(name)s",
+        }
+    )
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader(templates),
+        translations={"de": de, "fr": Catalog({})},
+        **kwargs,
+    )
+    return app, de
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_translated(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"name": "Bob"}
+
+    app, de = _setup({"tmpl.jinja2": TEMPLATE}, enable_async=enable_async)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept-Language": "de-DE,en;q=0.5"})
+    assert "<title>Willkommen</title>Hallo WeltHallo Bob" == await resp.text()
+    assert ["Hello world", "Welcome"] == sorted(set(de.lookups) - {"Hello %(name)s"})
+
+    de.lookups.clear()
+    resp = await client.get("/", headers={"Accept-Language": "de"})
+    assert "<title>Willkommen</title>Hallo WeltHallo Bob" == await resp.text()
+    # only the string with a variable is looked up at render time
+    assert ["Hello %(name)s"] == de.lookups
+
+    resp = await client.get("/", headers={"Accept-Language": "es"})
+    assert "<title>Welcome</title>Hello worldHello Bob" == await resp.text()
+
+
+def test_locale_selector():
+    app, _ = _setup(
+        {"tmpl.jinja2": "{{ _('Welcome') }}"},
+        locale_selector=lambda request: request.query.get("lang"),
+    )
+
+    req = make_mocked_request("GET", "/?lang=de", app=app)
+    assert "Willkommen" == aiohttp_jinja2.render_string("tmpl.jinja2", req, {})
+    req = make_mocked_request("GET", "/", app=app)
+    assert "Welcome" == aiohttp_jinja2.render_string("tmpl.jinja2", req, {})
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    (
+        ("fr;q=0.5, de;q=0.8", "Willkommen"),
+        ("fr-CA, de", "Bienvenue"),
+        ("de;q=0, *", "Welcome"),
+    ),
+)
+def test_accept_language(header, expected):
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ _('Welcome') }}"}),
+        translations={
+            "de": Catalog({"Welcome": "Willkommen"}),
+            "fr": Catalog({"Welcome": "Bienvenue"}),
+        },
+    )
+    req = make_mocked_request("GET", "/", headers={"Accept-Language": header}, app=app)
+
+    assert expected == aiohttp_jinja2.render_string("tmpl.jinja2", req, {})
+
+
+def test_extension_newstyle_gettext():
+    catalog = Catalog({"100%% done": "100%% fertig", "Done": "Fertig"})
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader(
+            {"tmpl.jinja2": "{% trans %}100% done{% endtrans %} {{ _('Done') }}"}
+        ),
+        extensions=["jinja2.ext.i18n", aiohttp_jinja2.StaticTranslationsExtension],
+    )
+    env.install_gettext_translations(catalog, newstyle=True)  # type: ignore[attr-defined]
+    env.extend(aiohttp_jinja2_translations=catalog)
+
+    template = env.get_template("tmpl.jinja2")
+    catalog.lookups.clear()
+
+    assert "100% fertig Fertig" == template.render()
+    # new-style _() calls are left to render time
+    assert ["Done"] == catalog.lookups
+
+
+@pytest.mark.parametrize(
+    "options",
+    ({}, {"prerender": True}, {"stream": True}, {"block_header": "HX-Target"}),
+)
+async def test_vary_accept_language(aiohttp_client, tmp_path, options):
+    @aiohttp_jinja2.template("tmpl.jinja2", **options)
+    async def func(request):
+        return {}
+
+    @aiohttp_jinja2.template("tmpl.jinja2", prerender_dir=tmp_path)
+    async def stored(request):
+        return {}
+
+    app, _ = _setup({"tmpl.jinja2": "{{ _('Welcome') }}"})
+    app.router.add_get("/", func)
+    app.router.add_get("/stored", stored)
+    client = await aiohttp_client(app)
+
+    for path in ("/", "/", "/stored", "/stored"):
+        resp = await client.get(path, headers={"Accept-Language": "de"})
+        assert "Willkommen" == await resp.text()
+        assert "Accept-Language" in resp.headers.getall("Vary")
+
+
+async def test_no_vary_with_locale_selector(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {}
+
+    app, _ = _setup(
+        {"tmpl.jinja2": "{{ _('Welcome') }}"},
+        locale_selector=lambda request: request.query.get("lang"),
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", params={"lang": "de"})
+    assert "Willkommen" == await resp.text()
+    assert "Vary" not in resp.headers
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_locales_share_cache_budget(enable_async):
+    app, _ = _setup(
+        {"tmpl.jinja2": TEMPLATE},
+        enable_async=enable_async,
+        sync_fast_path=True,
+        cache_max_bytes=10**6,
+    )
+    env = aiohttp_jinja2.get_env(app)
+
+    for language in ("de", "fr", ""):
+        req = make_mocked_request(
+            "GET", "/", headers={"Accept-Language": language}, app=app
+        )
+        if enable_async:
+            await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, {})
+        else:
+            aiohttp_jinja2.render_string("tmpl.jinja2", req, {})
+
+    assert isinstance(env.cache, aiohttp_jinja2.TemplateCache)
+    variants = 2 if enable_async else 1
+    assert 3 * variants == len(env.cache)
+    assert env.cache.total_size <= env.cache.max_bytes
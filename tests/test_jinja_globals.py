@@ -167,3 +167,82 @@ async def test_static_var_missing(aiohttp_client, caplog):
 
     resp = await client.get("/")
     assert 200 == resp.status  # static_root_key is not set
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_static_preload(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def index(request):
+        return {}
+
+    template = (
+        "{{ static('app.css') }} {{ static('app.js?v=1') }} "
+        "{{ static('font.woff2') }} {{ static('data.json') }} {{ static('app.css') }}"
+    )
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        preload_static=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": template}),
+    )
+
+    app[aiohttp_jinja2.static_root_key] = "/static"
+    app.router.add_route("GET", "/", index)
+    client = await aiohttp_client(app)
+
+    expected = (
+        "</static/app.css>; rel=preload; as=style, "
+        "</static/app.js?v=1>; rel=preload; as=script, "
+        "</static/font.woff2>; rel=preload; as=font; crossorigin"
+    )
+    for _ in range(2):
+        resp = await client.get("/")
+        assert 200 == resp.status
+        assert expected == resp.headers["Link"]
+    assert {"tmpl.jinja2": expected} == app[aiohttp_jinja2.APP_STATIC_PRELOAD_KEY]
+
+
+async def test_static_preload_stream(aiohttp_client):
+    async def index(request):
+        return await aiohttp_jinja2.render_template_stream(
+            "tmpl.jinja2", request, {}
+        )
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        preload_static=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ static('app.css') }}"}),
+    )
+
+    app[aiohttp_jinja2.static_root_key] = "/static"
+    app.router.add_route("GET", "/", index)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert "/static/app.css" == await resp.text()
+    assert "Link" not in resp.headers
+
+    resp = await client.get("/")
+    assert "</static/app.css>; rel=preload; as=style" == resp.headers["Link"]
+
+
+async def test_static_preload_disabled(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def index(request):
+        return {}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader({"tmpl.jinja2": "{{ static('app.css') }}"})
+    )
+
+    app[aiohttp_jinja2.static_root_key] = "/static"
+    app.router.add_route("GET", "/", index)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert 200 == resp.status
+    assert "Link" not in resp.headers
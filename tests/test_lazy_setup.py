@@ -0,0 +1,72 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import jinja2
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+async def test_lazy_environment(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"text": "ok"}
+
+    app = web.Application()
+    tenant = web.Application()
+    aiohttp_jinja2.setup(
+        tenant,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ text }}"}),
+        lazy=True,
+    )
+    tenant.router.add_get("/", func)
+    app.add_subapp("/tenant/", tenant)
+
+    assert aiohttp_jinja2.APP_KEY not in tenant
+    assert [
+        aiohttp_jinja2.EnvironmentInfo("/tenant", aiohttp_jinja2.APP_KEY, True, None)
+    ] == aiohttp_jinja2.environment_report(app)
+
+    client = await aiohttp_client(app)
+    resp = await client.get("/tenant/")
+    assert "ok" == await resp.text()
+
+    (info,) = aiohttp_jinja2.environment_report(app)
+    assert info.build_time is not None
+    env = aiohttp_jinja2.get_env(tenant)
+    assert env is aiohttp_jinja2.get_env(tenant)
+    assert tenant is env.globals["app"]
+
+
+def test_single_construction_across_threads():
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader({}), lazy=True)
+
+    with ThreadPoolExecutor(8) as executor:
+        envs = list(executor.map(lambda _: aiohttp_jinja2.get_env(app), range(32)))
+
+    assert 1 == len({id(env) for env in envs})
+
+
+def test_eager_environment_report():
+    app = web.Application()
+    env = aiohttp_jinja2.setup(app, loader=jinja2.DictLoader({}))
+
+    (info,) = aiohttp_jinja2.environment_report(app)
+
+    assert env is app[aiohttp_jinja2.APP_KEY]
+    assert not info.lazy
+    assert info.build_time is not None
+
+
+async def test_lazy_warmup():
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader({"a.jinja2": "a"}), lazy=True, warmup=True
+    )
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        report = app[aiohttp_jinja2.APP_WARMUP_REPORT_KEY]
+        assert ["a.jinja2"] == list(report)
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,132 @@
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+from aiohttp_jinja2 import fastpath
+
+TEMPLATES = {
+    "tmpl.jinja2": (
+        "{% if show %}{{ value }}-{{ value }}-{% include 'inc.jinja2' %}"
+        "{% endif %}"
+    ),
+    "inc.jinja2": "{{ value }}",
+    "other.jinja2": "{{ user }}",
+}
+
+
+class Calls:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self) -> str:
+        self.count += 1
+        return "v"
+
+    async def coro(self) -> str:
+        self.count += 1
+        return "av"
+
+
+def _app(enable_async: bool) -> web.Application:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    return app
+
+
+@pytest.mark.parametrize("show", (False, True))
+def test_lazy(show):
+    calls = Calls()
+    req = make_mocked_request("GET", "/", app=_app(False))
+
+    text = aiohttp_jinja2.render_string(
+        "tmpl.jinja2", req, {"show": show, "value": aiohttp_jinja2.lazy(calls)}
+    )
+
+    assert ("v-v-v" if show else "") == text
+    assert int(show) == calls.count
+
+
+@pytest.mark.parametrize("coroutine", (False, True))
+async def test_lazy_async(coroutine):
+    calls = Calls()
+    req = make_mocked_request("GET", "/", app=_app(True))
+    context = {
+        "show": True,
+        "value": aiohttp_jinja2.lazy(calls.coro if coroutine else calls),
+        "unused": aiohttp_jinja2.lazy(calls.coro),
+    }
+
+    text = await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, context)
+
+    assert ("av-av-av" if coroutine else "v-v-v") == text
+    assert 1 == calls.count
+
+
+async def test_lazy_processor(aiohttp_client):
+    calls = Calls()
+
+    async def processor(request):
+        return {"user": aiohttp_jinja2.lazy(calls.coro)}
+
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def skipped(request):
+        return {"show": False}
+
+    @aiohttp_jinja2.template("other.jinja2")
+    async def used(request):
+        return {}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        loader=jinja2.DictLoader(TEMPLATES),
+        context_processors=(processor,),
+    )
+    app.router.add_get("/skipped", skipped)
+    app.router.add_get("/used", used)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/skipped")
+    assert "" == await resp.text()
+    assert 0 == calls.count
+
+    resp = await client.get("/used")
+    assert "av" == await resp.text()
+    assert 1 == calls.count
+
+
+def test_coroutine_in_sync_environment():
+    calls = Calls()
+    req = make_mocked_request("GET", "/", app=_app(False))
+
+    with pytest.raises(TypeError, match="enable_async=True"):
+        aiohttp_jinja2.render_string(
+            "inc.jinja2", req, {"value": aiohttp_jinja2.lazy(calls.coro)}
+        )
+
+
+async def test_sync_fast_path():
+    calls = Calls()
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        sync_fast_path=True,
+        loader=jinja2.DictLoader(TEMPLATES),
+    )
+    req = make_mocked_request("GET", "/", app=app)
+    value = aiohttp_jinja2.lazy(calls)
+    context = {"show": False, "value": value, "unused": aiohttp_jinja2.lazy(calls.coro)}
+    env = aiohttp_jinja2.get_env(app)
+
+    # inspecting the values for the sync variant does not compute them
+    assert fastpath.sync_variant(env.get_template("tmpl.jinja2"), context)
+    with pytest.raises(AttributeError):
+        value._is_coroutine_marker
+    assert "" == await aiohttp_jinja2.render_string_async("tmpl.jinja2", req, context)
+    assert 0 == calls.count
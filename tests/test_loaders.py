@@ -0,0 +1,193 @@
+import threading
+import time
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+
+class CountingLoader(jinja2.DictLoader):
+    def __init__(self, mapping: dict[str, str]) -> None:
+        super().__init__(mapping)
+        self.lookups: list[str] = []
+
+    def get_source(self, environment, template):
+        self.lookups.append(template)
+        return super().get_source(environment, template)
+
+
+def test_negative_cache():
+    inner = CountingLoader({"theme/base.html": "base"})
+    env = jinja2.Environment(
+        loader=aiohttp_jinja2.NegativeCacheLoader(inner),
+        cache_size=0,
+        auto_reload=False,
+    )
+
+    for _ in range(3):
+        template = env.select_template(["custom/base.html", "theme/base.html"])
+        assert "base" == template.render()
+
+    assert ["custom/base.html"] + ["theme/base.html"] * 3 == inner.lookups
+
+
+def test_negative_cache_ttl_and_clear():
+    templates: dict[str, str] = {}
+    inner = CountingLoader(templates)
+    loader = aiohttp_jinja2.NegativeCacheLoader(inner, ttl=0)
+    env = jinja2.Environment(loader=loader, auto_reload=False)
+
+    for _ in range(2):
+        with pytest.raises(jinja2.TemplateNotFound):
+            env.get_template("missing.html")
+    assert 2 == len(inner.lookups)
+
+    loader.ttl = 60
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("missing.html")
+    templates["missing.html"] = "found"
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("missing.html")
+
+    loader.clear()
+    assert "found" == env.get_template("missing.html").render()
+
+
+def test_negative_cache_maxsize():
+    inner = CountingLoader({})
+    loader = aiohttp_jinja2.NegativeCacheLoader(inner, maxsize=2)
+    env = jinja2.Environment(loader=loader, auto_reload=False)
+
+    for name in ("a", "b", "c", "a"):
+        with pytest.raises(jinja2.TemplateNotFound):
+            env.get_template(name)
+
+    assert ["a", "b", "c", "a"] == inner.lookups
+
+
+def test_setup_negative_cache():
+    app = web.Application()
+    inner = CountingLoader({})
+    env = aiohttp_jinja2.setup(
+        app, loader=inner, negative_cache_ttl=30, auto_reload=False
+    )
+    req = make_mocked_request("GET", "/", app=app)
+
+    for _ in range(2):
+        with pytest.raises(web.HTTPInternalServerError):
+            aiohttp_jinja2.render_string("missing.html", req, {})
+
+    assert isinstance(env.loader, aiohttp_jinja2.NegativeCacheLoader)
+    assert ["missing.html"] == inner.lookups
+
+
+def test_negative_cache_auto_reload():
+    templates: dict[str, str] = {}
+    inner = CountingLoader(templates)
+    env = jinja2.Environment(loader=aiohttp_jinja2.NegativeCacheLoader(inner))
+
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("new.html")
+    templates["new.html"] = "new"
+
+    assert "new" == env.get_template("new.html").render()
+
+
+def test_negative_cache_cleared_by_index_refresh(tmp_path):
+    indexed = aiohttp_jinja2.IndexedFileSystemLoader(tmp_path, refresh_interval=None)
+    loader = aiohttp_jinja2.NegativeCacheLoader(indexed)
+    env = jinja2.Environment(loader=loader, auto_reload=False)
+
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("new.html")
+    (tmp_path / "new.html").write_text("new")
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("new.html")
+
+    indexed.refresh()
+    assert "new" == env.get_template("new.html").render()
+
+
+def test_indexed_loader_precedence(tmp_path):
+    theme, base = tmp_path / "theme", tmp_path / "base"
+    (theme / "pages").mkdir(parents=True)
+    (base / "pages").mkdir(parents=True)
+    (theme / "pages" / "index.html").write_text("theme")
+    (base / "pages" / "index.html").write_text("base")
+    (base / "layout.html").write_text("layout")
+
+    loader = aiohttp_jinja2.IndexedFileSystemLoader([theme, base])
+    env = jinja2.Environment(loader=loader)
+
+    assert "theme" == env.get_template("pages/index.html").render()
+    assert "layout" == env.get_template("./layout.html").render()
+    assert ["layout.html", "pages/index.html"] == env.list_templates()
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("missing.html")
+
+
+def test_indexed_loader_refresh(tmp_path):
+    theme, base = tmp_path / "theme", tmp_path / "base"
+    theme.mkdir()
+    base.mkdir()
+    (theme / "index.html").write_text("theme")
+    (base / "index.html").write_text("base")
+
+    loader = aiohttp_jinja2.IndexedFileSystemLoader(
+        [theme, base], refresh_interval=None
+    )
+    env = jinja2.Environment(loader=loader, cache_size=0)
+
+    (theme / "new.html").write_text("new")
+    with pytest.raises(jinja2.TemplateNotFound):
+        env.get_template("new.html")
+    loader.refresh()
+    assert "new" == env.get_template("new.html").render()
+
+    # a removed override exposes the template of the next search path
+    (theme / "index.html").unlink()
+    assert "base" == env.get_template("index.html").render()
+
+
+def test_indexed_loader_detects_changes(tmp_path):
+    loader = aiohttp_jinja2.IndexedFileSystemLoader(tmp_path, refresh_interval=0)
+    env = jinja2.Environment(loader=loader)
+    assert [] == env.list_templates()
+
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    (sub / "new.html").write_text("new")
+
+    # rebuilt by a thread a lookup starts, the lookup does not wait for it
+    deadline = time.monotonic() + 5
+    while "sub/new.html" not in env.list_templates():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert "new" == env.get_template("sub/new.html").render()
+
+
+def test_indexed_loader_refresh_in_background(tmp_path, monkeypatch):
+    (tmp_path / "index.html").write_text("index")
+    loader = aiohttp_jinja2.IndexedFileSystemLoader(tmp_path, refresh_interval=0)
+    env = jinja2.Environment(loader=loader, cache_size=0)
+    started, release = threading.Event(), threading.Event()
+
+    def refresh():
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(loader, "refresh", refresh)
+    (tmp_path / "new.html").write_text("new")
+    try:
+        assert "index" == env.get_template("index.html").render()
+        assert started.wait(5)
+        # lookups during the rebuild use the current index
+        assert "index" == env.get_template("index.html").render()
+        (tmp_path / "index.html").unlink()
+        (tmp_path / "index.html").write_text("changed")
+        assert "changed" == env.get_template("index.html").render()
+    finally:
+        release.set()
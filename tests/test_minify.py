@@ -0,0 +1,74 @@
+import jinja2
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+def _render(source: str, **context: object) -> str:
+    env = jinja2.Environment(extensions=[aiohttp_jinja2.MinifyExtension])
+    return env.from_string(source).render(context)
+
+
+def test_collapse_whitespace_and_comments():
+    source = """
+    <html>
+      <!-- navigation -->
+      <body>   <h1>{{ title }}</h1>
+        <p>a   b</p>
+      </body>
+    </html>
+    """
+
+    assert "\n<html>\n<body> <h1>T</h1>\n<p>a b</p>\n</body>\n</html>\n" == _render(
+        source, title="T"
+    )
+
+
+def test_keep_raw_elements():
+    source = (
+        "<div>\n  <pre class='{{ cls }}'>  a\n    b</pre>\n"
+        "  <script>\n  var x = 1;  // <!-- y -->\n  </script>\n"
+        "  <textarea>  {{ text }}  </textarea>\n</div>"
+    )
+
+    assert (
+        "<div>\n<pre class='c'>  a\n    b</pre>\n"
+        "<script>\n  var x = 1;  // <!-- y -->\n  </script>\n"
+        "<textarea>  t  </textarea>\n</div>"
+    ) == _render(source, cls="c", text="t")
+
+
+def test_keep_output_and_conditional_comments():
+    source = "<!--[if IE]>  old  <![endif]-->  {{ text }}"
+
+    assert "<!--[if IE]> old <![endif]--> a   b" == _render(source, text="a   b")
+
+
+def test_keep_trans_blocks():
+    env = jinja2.Environment(
+        extensions=["jinja2.ext.i18n", aiohttp_jinja2.MinifyExtension]
+    )
+    env.install_null_translations()  # type: ignore[attr-defined]
+
+    txt = env.from_string("<p>  {% trans %}a   b{% endtrans %}  </p>").render()
+
+    assert "<p> a   b </p>" == txt
+
+
+async def test_setup_minify(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"text": "x"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        minify=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "<p>\n    {{ text }}\n</p>"}),
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert "<p>\nx\n</p>" == await resp.text()
@@ -0,0 +1,126 @@
+import json
+
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+class CountingLoader(jinja2.DictLoader):
+    def __init__(self, mapping: dict[str, str]) -> None:
+        super().__init__(mapping)
+        self.lookups: list[str] = []
+
+    def get_source(self, environment, template):
+        self.lookups.append(template)
+        return super().get_source(environment, template)
+
+
+@pytest.mark.parametrize(
+    "accept,is_json",
+    (
+        ("application/json", True),
+        ("text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", False),
+        ("application/json, text/html", False),
+        ("text/html;q=0.5, application/json", True),
+        ("application/*", True),
+        ("*/*", False),
+        ("application/json;q=0", False),
+        ("application/json;q=oops", False),
+        ("", False),
+    ),
+)
+async def test_negotiate(aiohttp_client, accept, is_json):
+    @aiohttp_jinja2.template("tmpl.jinja2", negotiate=True)
+    async def func(request):
+        return {"head": "HEAD", "text": "text"}
+
+    loader = CountingLoader({"tmpl.jinja2": "<h1>{{ head }}</h1>{{ text }}"})
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=loader)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept": accept})
+
+    assert 200 == resp.status
+    assert "Accept" == resp.headers["Vary"]
+    if is_json:
+        assert "application/json" == resp.content_type
+        assert {"head": "HEAD", "text": "text"} == await resp.json()
+        assert [] == loader.lookups
+    else:
+        assert "text/html" == resp.content_type
+        assert "<h1>HEAD</h1>text" == await resp.text()
+
+
+async def test_json_keys_and_dumps(aiohttp_client):
+    @aiohttp_jinja2.template(
+        "tmpl.jinja2",
+        negotiate=True,
+        json_keys=("head", "missing"),
+        dumps=lambda obj: json.dumps(obj, sort_keys=True),
+        status=201,
+        block_header="HX-Target",
+    )
+    async def func(request):
+        return {"head": "HEAD", "secret": "hidden"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader({"tmpl.jinja2": "{{ head }}"})
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept": "application/json"})
+    assert 201 == resp.status
+    assert '{"head": "HEAD"}' == await resp.text()
+
+    resp = await client.get("/")
+    assert 201 == resp.status
+    assert "HEAD" == await resp.text()
+    assert ["HX-Target", "Accept"] == resp.headers.getall("Vary")
+
+
+async def test_not_negotiated(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"head": "HEAD"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, loader=jinja2.DictLoader({"tmpl.jinja2": "{{ head }}"})
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept": "application/json"})
+    assert "HEAD" == await resp.text()
+    assert "Vary" not in resp.headers
+
+
+async def test_lazy_values(aiohttp_client):
+    async def load_user():
+        return "bob"
+
+    @aiohttp_jinja2.template("tmpl.jinja2", negotiate=True)
+    async def func(request):
+        return {
+            "user": aiohttp_jinja2.lazy(load_user),
+            "count": aiohttp_jinja2.lazy(lambda: 2),
+        }
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ user }}"}),
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", headers={"Accept": "application/json"})
+    assert 200 == resp.status
+    assert {"user": "bob", "count": 2} == await resp.json()
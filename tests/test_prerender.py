@@ -0,0 +1,110 @@
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_prerender(aiohttp_client, enable_async):
+    calls = []
+
+    @aiohttp_jinja2.template("tmpl.jinja2", prerender=True)
+    async def func(request):
+        calls.append(request)
+        return {"text": "static"}
+
+    templates = {"tmpl.jinja2": "<p>{{ text }}</p>{% include 'footer.jinja2' %}"}
+    templates["footer.jinja2"] = "<footer></footer>"
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(templates)
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    etags = set()
+    for _ in range(2):
+        resp = await client.get("/")
+        assert 200 == resp.status
+        assert "<p>static</p><footer></footer>" == await resp.text()
+        assert "gzip" == resp.headers["Content-Encoding"]
+        etags.add(resp.headers["ETag"])
+    assert 1 == len(calls)
+    (etag,) = etags
+
+    resp = await client.get("/", headers={"If-None-Match": etag})
+    assert 304 == resp.status
+
+    resp = await client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in resp.headers
+    assert "<p>static</p><footer></footer>" == await resp.text()
+    identity_etag = resp.headers["ETag"]
+    assert etag != identity_etag
+
+    resp = await client.get(
+        "/", headers={"Accept-Encoding": "identity", "If-None-Match": etag}
+    )
+    assert 200 == resp.status
+    resp = await client.get(
+        "/", headers={"Accept-Encoding": "identity", "If-None-Match": identity_etag}
+    )
+    assert 304 == resp.status
+
+    # editing an included template renders the page again
+    templates["footer.jinja2"] = "<footer>new</footer>"
+    resp = await client.get("/")
+    assert "<p>static</p><footer>new</footer>" == await resp.text()
+    assert etag != resp.headers["ETag"]
+    assert 2 == len(calls)
+
+
+async def test_prerender_dir(aiohttp_client, tmp_path):
+    @aiohttp_jinja2.template("tmpl.jinja2", prerender_dir=tmp_path)
+    async def func(request):
+        return {"text": "static"}
+
+    templates = {"tmpl.jinja2": "<p>{{ text }}</p>"}
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(templates))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    for _ in range(2):
+        resp = await client.get("/")
+        assert 200 == resp.status
+        assert "<p>static</p>" == await resp.text()
+        assert resp.headers["Content-Type"].startswith("text/html")
+        assert "gzip" == resp.headers["Content-Encoding"]
+
+    assert 2 == len(list(tmp_path.iterdir()))
+
+    # the files of the replaced page are removed
+    templates["tmpl.jinja2"] = "<div>{{ text }}</div>"
+    resp = await client.get("/")
+    assert "<div>static</div>" == await resp.text()
+    assert 2 == len(list(tmp_path.iterdir()))
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_prerender_skips_context_processors(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("tmpl.jinja2", prerender=True)
+    async def func(request):
+        return {}
+
+    async def user_processor(request):
+        return {"user": request.headers["X-User"]}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        context_processors=(user_processor,),
+        loader=jinja2.DictLoader({"tmpl.jinja2": "hi {{ user }}"}),
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    for user in ("alice", "bob"):
+        resp = await client.get("/", headers={"X-User": user})
+        assert "hi " == await resp.text()
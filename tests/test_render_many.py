@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+TEMPLATES = {
+    "mail.txt": "Hi {{ name }} from {{ site }}",
+    "note.txt": "{{ name }}!",
+}
+
+
+def _request(enable_async: bool = False) -> web.Request:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    req = make_mocked_request("GET", "/", app=app)
+    req[aiohttp_jinja2.REQUEST_CONTEXT_KEY] = {"site": "example.com", "name": "?"}
+    return req
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_many(enable_async):
+    req = _request(enable_async)
+    contexts = [{"name": "Ann"}, {"name": "Bob"}]
+
+    rendered = [
+        txt async for txt in aiohttp_jinja2.render_many("mail.txt", req, contexts)
+    ]
+
+    assert ["Hi Ann from example.com", "Hi Bob from example.com"] == rendered
+
+
+async def test_render_many_pairs():
+    req = _request()
+    items = [("mail.txt", {"name": "Ann"}), ("note.txt", {"name": "Bob"})]
+
+    rendered = [txt async for txt in aiohttp_jinja2.render_many(None, req, items)]
+
+    assert ["Hi Ann from example.com", "Bob!"] == rendered
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_many_executor_keeps_order(enable_async):
+    req = _request(enable_async)
+    contexts = [{"name": str(i)} for i in range(20)]
+
+    with ThreadPoolExecutor(4) as executor:
+        rendered = [
+            txt
+            async for txt in aiohttp_jinja2.render_many(
+                "note.txt", req, contexts, executor=executor, concurrency=3
+            )
+        ]
+
+    assert [f"{i}!" for i in range(20)] == rendered
+
+
+async def test_render_many_template_not_found():
+    req = _request()
+
+    with pytest.raises(web.HTTPInternalServerError) as ctx:
+        async for _ in aiohttp_jinja2.render_many("missing.txt", req, [{}]):
+            pass
+
+    assert "Template 'missing.txt' not found" == ctx.value.text
+
+
+async def test_render_many_invalid_concurrency():
+    req = _request()
+
+    with pytest.raises(ValueError):
+        async for _ in aiohttp_jinja2.render_many("note.txt", req, [], concurrency=0):
+            pass
@@ -0,0 +1,186 @@
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+from aiohttp_jinja2.shells import Shells
+
+TEMPLATES = {
+    "base.jinja2": (
+        "<title>{{ title|count }}</title>"
+        "{% block body %}{% endblock %}"
+        "<footer>{% dynamic %}{{ user }}{% enddynamic %}</footer>"
+    ),
+    "page.jinja2": (
+        '{% extends "base.jinja2" %}'
+        "{% block body %}"
+        "<p>{% dynamic %}{% for item in cart %}{{ item }},{% endfor %}"
+        "{% enddynamic %}</p>"
+        "{% endblock %}"
+    ),
+}
+
+
+def _app(enable_async: bool, calls: list[str]) -> web.Application:
+    def count(value: str) -> str:
+        calls.append(value)
+        return value
+
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader(TEMPLATES),
+        extensions=[aiohttp_jinja2.DynamicExtension],
+    )
+    env.filters["count"] = count
+    return app
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_shell_rendered_once(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("page.jinja2", shell_key=lambda request: None)
+    async def func(request):
+        return {
+            "title": "Shop",
+            "user": request.query["user"],
+            "cart": request.query.getall("item", []),
+        }
+
+    calls: list[str] = []
+    app = _app(enable_async, calls)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/", params=[("user", "<bob>"), ("item", "a")])
+    assert 200 == resp.status
+    assert "text/html" == resp.content_type
+    assert (
+        "<title>Shop</title><p>a,</p><footer>&lt;bob&gt;</footer>"
+        == await resp.text()
+    )
+
+    resp = await client.get("/", params=[("user", "alice")])
+    assert "<title>Shop</title><p></p><footer>alice</footer>" == await resp.text()
+    assert ["Shop"] == calls
+
+
+async def test_shell_key(aiohttp_client):
+    @aiohttp_jinja2.template(
+        "base.jinja2", shell_key=lambda request: request.query["title"]
+    )
+    async def func(request):
+        return {"title": request.query["title"], "user": "bob"}
+
+    calls: list[str] = []
+    app = _app(False, calls)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    for title in ("a", "b", "a"):
+        resp = await client.get("/", params={"title": title})
+        assert f"<title>{title}</title><footer>bob</footer>" == await resp.text()
+    assert ["a", "b"] == calls
+
+
+async def test_content_cannot_forge_hole_markers(aiohttp_client):
+    @aiohttp_jinja2.template("base.jinja2", shell_key=lambda request: None)
+    async def func(request):
+        return {"title": "\x00aiohttp-jinja2-hole:0\x00", "user": "bob"}
+
+    calls: list[str] = []
+    app = _app(False, calls)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 200 == resp.status
+    assert (
+        "<title>\x00aiohttp-jinja2-hole:0\x00</title><footer>bob</footer>"
+        == await resp.text()
+    )
+
+
+async def test_dynamic_rendered_inline(aiohttp_client):
+    @aiohttp_jinja2.template("page.jinja2")
+    async def func(request):
+        return {"title": "Shop", "user": "bob", "cart": ["a", "b"]}
+
+    calls: list[str] = []
+    app = _app(True, calls)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    for _ in range(2):
+        resp = await client.get("/")
+        assert (
+            "<title>Shop</title><p>a,b,</p><footer>bob</footer>"
+            == await resp.text()
+        )
+    assert ["Shop", "Shop"] == calls
+
+
+async def test_missing_extension(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2", shell_key=lambda request: None)
+    async def func(request):
+        return {}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader({"tmpl.jinja2": "text"}))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert 500 == resp.status
+
+
+def test_hole_source_in_compiled_template():
+    env = jinja2.Environment(extensions=[aiohttp_jinja2.DynamicExtension])
+    shells = Shells()
+    source = "{% dynamic %}{{ '%}' }} {{ user }}{% enddynamic %}é"
+
+    for _ in range(3):
+        body = shells.render(env.from_string(source), None, {"user": "u"}, "utf-8")
+        assert "%} ué".encode() == body
+    # parsing does not register the holes anywhere
+    ext = env.extensions[aiohttp_jinja2.DynamicExtension.identifier]
+    assert ["environment"] == list(vars(ext))
+
+
+@pytest.mark.parametrize(
+    "source",
+    (
+        "{% for item in cart %}{% dynamic %}{{ item }}{% enddynamic %}{% endfor %}",
+        "{% macro m(user) %}{% dynamic %}{{ user }}{% enddynamic %}{% endmacro %}"
+        "{{ m(1) }}",
+        "{% set user = 'x' %}{% dynamic %}{{ user }}{% enddynamic %}",
+        "{% for _ in cart %}{% dynamic %}{{ loop.index }}{% enddynamic %}"
+        "{% endfor %}",
+    ),
+)
+def test_hole_uses_template_names(source):
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader({"tmpl.jinja2": source}),
+        extensions=[aiohttp_jinja2.DynamicExtension],
+    )
+    template = env.get_template("tmpl.jinja2")
+    context = {"cart": [1], "user": "u"}
+
+    with pytest.raises(jinja2.TemplateSyntaxError, match="dynamic"):
+        Shells().render(template, None, context, "utf-8")
+    # rendered in place the hole sees them
+    assert template.render(context)
+
+
+def test_hole_in_loop():
+    source = "{% for item in cart %}{% dynamic %}{{ user }}{% enddynamic %}{% endfor %}"
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader({"tmpl.jinja2": source}),
+        extensions=[aiohttp_jinja2.DynamicExtension],
+    )
+    template = env.get_template("tmpl.jinja2")
+
+    body = Shells().render(template, None, {"cart": [1, 2], "user": "u"}, "utf-8")
+
+    assert b"uu" == body
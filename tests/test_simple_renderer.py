@@ -310,3 +310,32 @@ async def test_skip_render_for_response_from_handler(aiohttp_client):
     assert 200 == resp.status
     txt = await resp.text()
     assert "OK" == txt
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_frozen_app_config_resolved_once(monkeypatch, enable_async):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"text": "text"}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ text }}"}),
+    )
+    app.freeze()
+    lookups = []
+    config_dict = web.Request.__dict__["config_dict"]
+
+    def counting(self):
+        lookups.append(self)
+        return config_dict.__get__(self)
+
+    monkeypatch.setattr(web.Request, "config_dict", property(counting))
+
+    for _ in range(3):
+        resp = await func(make_mocked_request("GET", "/", app=app))
+        assert "text" == resp.text
+    # resolved by the first request only
+    assert all(request is lookups[0] for request in lookups)
@@ -0,0 +1,128 @@
+import asyncio
+from typing import Any
+
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+
+class SlowValue:
+    def __init__(self) -> None:
+        self.calls = 0
+        self.release = asyncio.Event()
+        self.error: Exception | None = None
+
+    async def __call__(self, value: Any) -> Any:
+        self.calls += 1
+        await self.release.wait()
+        if self.error is not None:
+            raise self.error
+        return value
+
+
+def _app(slow: SlowValue) -> web.Application:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=True,
+        loader=jinja2.DictLoader({"tmpl.jinja2": "{{ slow(text) }}"}),
+    )
+    aiohttp_jinja2.get_env(app).globals["slow"] = slow
+    return app
+
+
+def _by_path(request: web.Request) -> str:
+    return request.path
+
+
+async def _render(app: web.Application, path: str = "/") -> str:
+    req = make_mocked_request("GET", path, app=app)
+    return await aiohttp_jinja2.render_string_async(
+        "tmpl.jinja2", req, {"text": path}, single_flight=_by_path
+    )
+
+
+async def test_identical_renders_are_shared():
+    slow = SlowValue()
+    app = _app(slow)
+
+    tasks = [asyncio.create_task(_render(app)) for _ in range(10)]
+    tasks.append(asyncio.create_task(_render(app, "/other")))
+    await asyncio.sleep(0)
+    slow.release.set()
+
+    assert ["/"] * 10 + ["/other"] == await asyncio.gather(*tasks)
+    assert 2 == slow.calls
+    assert 0 == len(app[aiohttp_jinja2.APP_SINGLE_FLIGHTS_KEY])
+
+
+async def test_cancelled_waiter():
+    slow = SlowValue()
+    app = _app(slow)
+
+    first = asyncio.create_task(_render(app))
+    second = asyncio.create_task(_render(app))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    slow.release.set()
+
+    assert "/" == await second
+    assert first.cancelled()
+    assert 1 == slow.calls
+
+
+async def test_all_waiters_cancelled():
+    slow = SlowValue()
+    app = _app(slow)
+
+    task = asyncio.create_task(_render(app))
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert 0 == len(app[aiohttp_jinja2.APP_SINGLE_FLIGHTS_KEY])
+
+    # a later request renders again instead of joining the cancelled render
+    slow.release.set()
+    assert "/" == await _render(app)
+    assert 2 == slow.calls
+
+
+async def test_error_reaches_all_waiters():
+    slow = SlowValue()
+    slow.error = LookupError("boom")
+    app = _app(slow)
+
+    tasks = [asyncio.create_task(_render(app)) for _ in range(3)]
+    await asyncio.sleep(0)
+    slow.release.set()
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    assert all(isinstance(result, LookupError) for result in results)
+    assert 1 == slow.calls
+
+
+async def test_template_decorator(aiohttp_client):
+    slow = SlowValue()
+
+    @aiohttp_jinja2.template("tmpl.jinja2", single_flight=_by_path)
+    async def func(request):
+        return {"text": "page"}
+
+    app = _app(slow)
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    requests = [asyncio.create_task(client.get("/")) for _ in range(5)]
+    while not slow.calls:
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(0.05)
+    slow.release.set()
+
+    for resp in await asyncio.gather(*requests):
+        assert "page" == await resp.text()
+    assert 1 == slow.calls
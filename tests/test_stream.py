@@ -0,0 +1,106 @@
+import asyncio
+from typing import AsyncIterator
+
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+
+TEMPLATE = "<ul>{% for row in rows %}<li>{{ row }}</li>{% endfor %}</ul>"
+
+
+async def _rows(count: int, produced: list[int]) -> AsyncIterator[int]:
+    for i in range(count):
+        produced.append(i)
+        await asyncio.sleep(0)
+        yield i
+
+
+async def test_async_iterable_in_context(aiohttp_client):
+    produced: list[int] = []
+
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"rows": _rows(3, produced)}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=True, loader=jinja2.DictLoader({"tmpl.jinja2": TEMPLATE})
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert "<ul><li>0</li><li>1</li><li>2</li></ul>" == await resp.text()
+    assert [0, 1, 2] == produced
+
+
+async def test_stream(aiohttp_client):
+    produced: list[int] = []
+
+    @aiohttp_jinja2.template("tmpl.jinja2", stream=True, status=201)
+    async def func(request):
+        return {"rows": _rows(2000, produced)}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=True, loader=jinja2.DictLoader({"tmpl.jinja2": TEMPLATE})
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert 201 == resp.status
+    assert "text/html; charset=utf-8" == resp.headers["Content-Type"]
+    assert "chunked" == resp.headers["Transfer-Encoding"]
+    first = await resp.content.readany()
+    assert first.startswith(b"<ul><li>0</li>")
+    # the rows are produced as the response is written, not beforehand
+    assert len(produced) < 2000
+
+    rest = await resp.read()
+    assert (first + rest).endswith(b"<li>1999</li></ul>")
+    assert 2000 == len(produced)
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_template_stream(aiohttp_client, enable_async):
+    async def func(request: web.Request) -> web.StreamResponse:
+        return await aiohttp_jinja2.render_template_stream(
+            "tmpl.jinja2",
+            request,
+            {"rows": range(3)},
+            buffer_size=1,
+            headers={"X-Test": "1"},
+        )
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader({"tmpl.jinja2": TEMPLATE}),
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert "<ul><li>0</li><li>1</li><li>2</li></ul>" == await resp.text()
+    assert "1" == resp.headers["X-Test"]
+
+
+async def test_stream_template_not_found(aiohttp_client):
+    async def func(request: web.Request) -> web.StreamResponse:
+        return await aiohttp_jinja2.render_template_stream("missing", request, {})
+
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader({}))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 500 == resp.status
+    assert "Template 'missing' not found" == await resp.text()
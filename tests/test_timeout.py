@@ -0,0 +1,198 @@
+import aiohttp
+import jinja2
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import make_mocked_request
+
+import aiohttp_jinja2
+
+TEMPLATES = {
+    "tmpl.html": "head{% for item in items %}<p>{{ item }}</p>{% endfor %}",
+    "error.html": "error {{ items|length }}",
+}
+
+
+def _request(enable_async: bool, sync_fast_path: bool = True) -> web.Request:
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        sync_fast_path=sync_fast_path,
+        loader=jinja2.DictLoader(TEMPLATES),
+    )
+    return make_mocked_request("GET", "/", app=app)
+
+
+@pytest.mark.parametrize("sync_fast_path", (False, True))
+async def test_render_within_timeout(sync_fast_path):
+    req = _request(True, sync_fast_path)
+
+    txt = await aiohttp_jinja2.render_string_async(
+        "tmpl.html", req, {"items": [1, 2]}, timeout=10
+    )
+
+    assert "head<p>1</p><p>2</p>" == txt
+
+
+@pytest.mark.parametrize("sync_fast_path", (False, True))
+async def test_render_timeout_service_unavailable(sync_fast_path):
+    req = _request(True, sync_fast_path)
+
+    with pytest.raises(web.HTTPServiceUnavailable) as ctx:
+        await aiohttp_jinja2.render_string_async(
+            "tmpl.html", req, {"items": range(1000)}, timeout=0
+        )
+
+    assert "Rendering of template 'tmpl.html' timed out" == ctx.value.text
+    assert 1 == req.app[aiohttp_jinja2.APP_RENDER_TIMEOUTS_KEY]["tmpl.html"]
+
+
+async def test_render_timeout_truncate():
+    req = _request(True, sync_fast_path=False)
+
+    txt = await aiohttp_jinja2.render_string_async(
+        "tmpl.html",
+        req,
+        {"items": range(1000)},
+        timeout=0,
+        on_timeout=aiohttp_jinja2.Truncate("<!-- truncated -->"),
+    )
+
+    assert "head<!-- truncated -->" == txt
+
+
+async def test_render_timeout_error_template():
+    req = _request(False)
+
+    resp = aiohttp_jinja2.render_template(
+        "tmpl.html", req, {"items": [1, 2, 3]}, timeout=0, on_timeout="error.html"
+    )
+
+    assert "error 3" == resp.text
+    assert 1 == req.app[aiohttp_jinja2.APP_RENDER_TIMEOUTS_KEY]["tmpl.html"]
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_render_timeout_fallback_status(enable_async):
+    req = _request(enable_async, sync_fast_path=False)
+    fallback = aiohttp_jinja2.Fallback("error.html")
+    context = {"items": [1, 2, 3]}
+
+    if enable_async:
+        resp = await aiohttp_jinja2.render_template_async(
+            "tmpl.html", req, context, timeout=0, on_timeout=fallback
+        )
+    else:
+        resp = aiohttp_jinja2.render_template(
+            "tmpl.html", req, context, timeout=0, on_timeout=fallback
+        )
+
+    assert 503 == resp.status
+    assert "error 3" == resp.text
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_template_decorator_timeout(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("tmpl.html", timeout=0)
+    async def func(request):
+        return {"items": range(1000)}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 503 == resp.status
+    assert 1 == app[aiohttp_jinja2.APP_RENDER_TIMEOUTS_KEY]["tmpl.html"]
+
+
+@pytest.mark.parametrize(
+    "option,value",
+    (
+        ("block", "body"),
+        ("block_header", "HX-Target"),
+        ("prerender", True),
+        ("prerender_dir", "pages"),
+        ("shell_key", lambda request: None),
+    ),
+)
+@pytest.mark.parametrize(
+    "deadline", ({"timeout": 1}, {"on_timeout": aiohttp_jinja2.Truncate()})
+)
+def test_template_decorator_timeout_unsupported(option, value, deadline):
+    with pytest.raises(ValueError, match="timeout cannot be used with"):
+        aiohttp_jinja2.template("tmpl.html", **deadline, **{option: value})
+
+
+async def test_template_decorator_fallback_status(aiohttp_client):
+    @aiohttp_jinja2.template(
+        "tmpl.html",
+        timeout=0,
+        on_timeout=aiohttp_jinja2.Fallback("error.html", status=504),
+    )
+    async def func(request):
+        return {"items": range(3)}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(TEMPLATES))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 504 == resp.status
+    assert "error 3" == await resp.text()
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+@pytest.mark.parametrize(
+    "on_timeout,expected",
+    (
+        (aiohttp_jinja2.Truncate("<!-- truncated -->"), "head<!-- truncated -->"),
+        (aiohttp_jinja2.Fallback("error.html"), "headerror 1000"),
+    ),
+)
+async def test_template_decorator_stream_timeout(
+    aiohttp_client, enable_async, on_timeout, expected
+):
+    @aiohttp_jinja2.template(
+        "tmpl.html", stream=True, timeout=0, on_timeout=on_timeout
+    )
+    async def func(request):
+        return {"items": range(1000)}
+
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app, enable_async=enable_async, loader=jinja2.DictLoader(TEMPLATES)
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    # the status was sent before the deadline expired
+    assert 200 == resp.status
+    assert expected == await resp.text()
+    assert 1 == app[aiohttp_jinja2.APP_RENDER_TIMEOUTS_KEY]["tmpl.html"]
+
+
+async def test_stream_timeout_ends_connection(aiohttp_client):
+    async def func(request):
+        return await aiohttp_jinja2.render_template_stream(
+            "tmpl.html", request, {"items": range(1000)}, timeout=0
+        )
+
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=jinja2.DictLoader(TEMPLATES))
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+
+    assert 200 == resp.status
+    with pytest.raises(aiohttp.ClientPayloadError):
+        await resp.read()
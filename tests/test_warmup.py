@@ -0,0 +1,66 @@
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+async def test_warmup_on_startup(aiohttp_client):
+    loader = jinja2.DictLoader(
+        {"a.html": "a", "b.html": "{{ b }}", "mail/c.txt": "c"}
+    )
+    app = web.Application()
+    env = aiohttp_jinja2.setup(app, loader=loader, warmup=True)
+
+    await aiohttp_client(app)
+
+    report = app[aiohttp_jinja2.APP_WARMUP_REPORT_KEY]
+    assert ["a.html", "b.html", "mail/c.txt"] == list(report)
+    assert all(elapsed >= 0 for elapsed in report.values())
+    assert len(env.cache) == 3  # type: ignore[arg-type]
+
+
+async def test_warmup_patterns():
+    env = jinja2.Environment(
+        loader=jinja2.DictLoader({"a.html": "a", "b.txt": "b", "c.html": "c"})
+    )
+
+    report = await aiohttp_jinja2.warmup_templates(env, ["*.html"], concurrency=1)
+
+    assert ["a.html", "c.html"] == list(report)
+
+
+async def test_warmup_fails_fast_on_syntax_error():
+    loader = jinja2.DictLoader({"good.html": "ok", "bad.html": "{% if %}"})
+    app = web.Application()
+    aiohttp_jinja2.setup(app, loader=loader, warmup="*.html")
+
+    runner = web.AppRunner(app)
+    with pytest.raises(jinja2.TemplateSyntaxError):
+        await runner.setup()
+    await runner.cleanup()
+
+
+async def test_warmup_invalid_concurrency():
+    env = jinja2.Environment(loader=jinja2.DictLoader({}))
+
+    with pytest.raises(ValueError):
+        await aiohttp_jinja2.warmup_templates(env, concurrency=0)
+
+
+async def test_warmup_compiles_sync_variants(aiohttp_client):
+    loader = jinja2.DictLoader({"a.html": "a", "b.html": "{{ b }}"})
+    app = web.Application()
+    env = aiohttp_jinja2.setup(
+        app,
+        loader=loader,
+        warmup=True,
+        enable_async=True,
+        sync_fast_path=True,
+        cache_max_bytes=10**6,
+    )
+
+    await aiohttp_client(app)
+
+    assert isinstance(env.cache, aiohttp_jinja2.TemplateCache)
+    assert 4 == len(env.cache)
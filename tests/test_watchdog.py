@@ -0,0 +1,128 @@
+import time
+from typing import Any
+
+import jinja2
+import pytest
+from aiohttp import web
+
+import aiohttp_jinja2
+
+
+def _slow(value: Any) -> Any:
+    time.sleep(0.02)
+    return value
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_slow_render_is_captured(aiohttp_client, enable_async):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {"rows": [1, 2, 3], "title": "x", "count": 3}
+
+    watchdog = aiohttp_jinja2.SlowRenderWatchdog(0.01, sample_rate=1)
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader(
+            {"tmpl.jinja2": "{% for row in rows %}{{ row|slow }}{% endfor %}"}
+        ),
+        filters={"slow": _slow},
+        watchdog=watchdog,
+    )
+    app.router.add_get("/", func)
+    app.router.add_get("/_debug/renders", watchdog.handler)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert "123" == await resp.text()
+
+    (snapshot,) = watchdog.snapshots()
+    assert "tmpl.jinja2" == snapshot.template
+    assert snapshot.duration >= 0.06
+    assert {"rows": 3, "title": 1} == snapshot.context_sizes
+    assert "_slow" in snapshot.profile
+
+    resp = await client.get("/_debug/renders")
+    (data,) = await resp.json()
+    assert "tmpl.jinja2" == data["template"]
+
+    watchdog.clear()
+    assert [] == watchdog.snapshots()
+
+
+async def test_fast_and_unsampled_renders(aiohttp_client):
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        return {}
+
+    fast = aiohttp_jinja2.SlowRenderWatchdog(10, sample_rate=1)
+    unsampled = aiohttp_jinja2.SlowRenderWatchdog(0, sample_rate=0)
+    for watchdog in (fast, unsampled):
+        app = web.Application()
+        aiohttp_jinja2.setup(
+            app, loader=jinja2.DictLoader({"tmpl.jinja2": "ok"}), watchdog=watchdog
+        )
+        app.router.add_get("/", func)
+        client = await aiohttp_client(app)
+        resp = await client.get("/")
+        assert "ok" == await resp.text()
+        assert [] == watchdog.snapshots()
+
+
+def test_ring_buffer():
+    watchdog = aiohttp_jinja2.SlowRenderWatchdog(0, sample_rate=1, maxlen=2)
+    for name in ("a", "b", "c"):
+        with watchdog.watch(name, {}):
+            pass
+
+    assert ["c", "b"] == [snapshot.template for snapshot in watchdog.snapshots()]
+
+
+def test_invalid_sample_rate():
+    with pytest.raises(ValueError):
+        aiohttp_jinja2.SlowRenderWatchdog(1, sample_rate=2)
+
+
+@pytest.mark.parametrize("enable_async", (False, True))
+async def test_lazy_values_not_computed(aiohttp_client, enable_async):
+    calls = []
+
+    def unused():
+        calls.append("unused")
+        return [1]
+
+    async def unused_async():
+        calls.append("unused_async")
+        return [1]
+
+    @aiohttp_jinja2.template("tmpl.jinja2")
+    async def func(request):
+        context = {
+            "rows": aiohttp_jinja2.lazy(lambda: [1, 2, 3]),
+            "unused": aiohttp_jinja2.lazy(unused),
+        }
+        if enable_async:
+            context["unused_async"] = aiohttp_jinja2.lazy(unused_async)
+        return context
+
+    watchdog = aiohttp_jinja2.SlowRenderWatchdog(0, sample_rate=1)
+    app = web.Application()
+    aiohttp_jinja2.setup(
+        app,
+        enable_async=enable_async,
+        loader=jinja2.DictLoader(
+            {"tmpl.jinja2": "{% for row in rows %}{{ row }}{% endfor %}"}
+        ),
+        watchdog=watchdog,
+    )
+    app.router.add_get("/", func)
+    client = await aiohttp_client(app)
+
+    resp = await client.get("/")
+    assert 200 == resp.status
+    assert "123" == await resp.text()
+
+    (snapshot,) = watchdog.snapshots()
+    assert {"rows": 3} == snapshot.context_sizes
+    assert [] == calls